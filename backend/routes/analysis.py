@@ -1,23 +1,45 @@
+import os
 import logging
 import json
+import inspect
 from datetime import datetime
 from flask import Blueprint, request, jsonify, Response
 from functools import wraps
 from services.ai_service import ai_service
+from services.analysis_stream import format_sse, iterate_in_thread
+from services.job_queue import analysis_job_queue, analysis_worker_pool
+from services.usage_tracker import usage_tracker, usage_route
+from services.analysis_recorder import record_analysis
+from services.sentiment_rollup import sentiment_rollup_store
+from services.market_mood import market_mood, summarize_analyses, WINDOWS
+from services.sentiment_cube import sentiment_cube, RESOLUTIONS, DIMENSIONS
+from services.story_cluster import story_clusterer
+from services.ticker_recognizer import ticker_recognizer
+from services.ticker_index import ticker_index
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 analysis_bp = Blueprint('analysis', __name__)
 
+def _set_json_content_type(response):
+    # 流式响应保持text/event-stream
+    if hasattr(response, 'headers') and response.mimetype != 'text/event-stream':
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    return response
+
 # 自定义装饰器确保中文正确编码
 def ensure_chinese_response(func):
+    # 异步视图需要保持协程函数签名，Flask才会在事件循环中执行
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return _set_json_content_type(await func(*args, **kwargs))
+        return async_wrapper
+    
     @wraps(func)
     def wrapper(*args, **kwargs):
-        response = func(*args, **kwargs)
-        if hasattr(response, 'headers'):
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        return _set_json_content_type(func(*args, **kwargs))
     return wrapper
 
 # 创建支持中文的jsonify函数
@@ -62,9 +84,16 @@ def get_analysis_status():
         'service': '股票新闻分析系统 - AI分析服务',
         'status': 'active',
         'endpoints': {
-            'analyze': '/analyze - POST - 分析单篇文章',
+            'analyze': '/analyze - POST - 分析单篇文章（stream=true时以SSE流式返回）',
             'batch-analyze': '/batch-analyze - POST - 批量分析文章',
+            'jobs': '/jobs - POST - 提交异步批量分析任务，/jobs/<id> - GET - 查询进度，/jobs/<id>/results - GET - 获取结果',
             'sentiment-trend': '/sentiment-trend - GET - 获取情绪趋势',
+            'market-mood': '/market-mood - GET - 获取实时滚动市场情绪',
+            'events': '/events - GET - 获取市场事件流（同一事件的文章聚类）',
+            'sentiment-cube': '/sentiment-cube - GET - 按时间粒度和来源/分类/股票维度查询情绪',
+            'watchlist': '/watchlist - GET/POST - 关注列表中各股票的情绪和合并后的最新新闻',
+            'tickers': '/tickers/<code> - GET - 单只股票的最新新闻和情绪',
+            'usage': '/usage - GET - 获取token用量和预算',
             'ai-providers': '/ai-providers - GET - 获取AI服务提供商状态'
         },
         'features': [
@@ -72,7 +101,8 @@ def get_analysis_status():
             '支持多种AI模型（OpenAI、Claude、DeepSeek等）',
             '自动降级机制保证服务可用性',
             '实时分析结果反馈',
-            '批量处理能力'
+            '批量处理能力',
+            '股票实体识别（代码、简称、全称、别名）'
         ],
         'timestamp': datetime.now().isoformat()
     })
@@ -92,11 +122,30 @@ async def analyze_article():
         if not article_content:
             return jsonify_chinese({'error': '文章内容不能为空'}), 400
         
+        usage_route.set('analyze')
+        
+        article = {
+            'id': data.get('id'),
+            'title': article_title,
+            'content': article_content,
+            'source': data.get('source'),
+            'category': data.get('category'),
+            'publish_time': data.get('publish_time')
+        }
+        related_stocks = ticker_recognizer.tag(article)
+        
+        # 流式模式：通过SSE先推送模型增量输出和已完成的字段
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            return stream_analysis_response(article, 0.9, related_stocks)
+        
         # 调用AI服务进行分析
         analysis_result = await ai_service.analyze_content(
             content=article_content,
-            title=article_title
+            title=article_title,
+            tickers=article.get('tickers')
         )
+        analysis_result = ticker_recognizer.annotate(analysis_result, related_stocks)
+        record_analysis(article, analysis_result)
         
         # 计算置信度和风险等级
         source_credibility = 0.9  # 假设来源可信度
@@ -126,6 +175,87 @@ async def analyze_article():
             'message': str(e)
         }), 500
 
+def stream_analysis_response(article: dict, source_credibility: float, related_stocks: list = None) -> Response:
+    """构建SSE流式分析响应"""
+    async def analysis_events():
+        # 流式分析在独立线程中运行，需要在该线程的上下文中标记接口
+        usage_route.set('analyze')
+        async for item in ai_service.analyze_content_stream(article['content'], article['title'], source_credibility):
+            yield item
+    
+    def generate():
+        for item in iterate_in_thread(analysis_events):
+            if item['event'] == 'result':
+                analysis_result = ticker_recognizer.annotate(item['data'], related_stocks or [])
+                record_analysis(article, analysis_result)
+                confidence_score = calculate_confidence_score(analysis_result, source_credibility)
+                item = {'event': 'result', 'data': {
+                    'analysis': analysis_result,
+                    'confidence': {
+                        'score': round(confidence_score, 2),
+                        'level': get_risk_level(confidence_score),
+                        'advice': get_risk_advice(analysis_result.get('sentiment', 'neutral'), confidence_score)
+                    },
+                    'source_credibility': source_credibility,
+                    'analysis_timestamp': datetime.now().isoformat()
+                }}
+            yield format_sse(item['event'], item['data'])
+        yield format_sse('done', {'message': '文章分析完成'})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+async def analyze_batch_item(article: dict) -> dict:
+    """分析批量请求中的单篇文章，供批量分析接口和异步任务工作线程共用"""
+    try:
+        article_content = article.get('content', '')
+        article_title = article.get('title', '')
+        
+        if not article_content:
+            return {
+                'success': False,
+                'error': '文章内容不能为空',
+                'article_id': article.get('id')
+            }
+        
+        related_stocks = ticker_recognizer.tag(article)
+        
+        # 调用AI服务进行分析
+        analysis_result = await ai_service.analyze_content(
+            content=article_content,
+            title=article_title,
+            tickers=article.get('tickers')
+        )
+        analysis_result = ticker_recognizer.annotate(analysis_result, related_stocks)
+        record_analysis(article, analysis_result)
+        
+        # 计算置信度
+        source_credibility = 0.9
+        confidence_score = calculate_confidence_score(analysis_result, source_credibility)
+        risk_level = get_risk_level(confidence_score)
+        risk_advice = get_risk_advice(analysis_result.get('sentiment', 'neutral'), confidence_score)
+        
+        return {
+            'success': True,
+            'article_id': article.get('id'),
+            'analysis': analysis_result,
+            'confidence': {
+                'score': round(confidence_score, 2),
+                'level': risk_level,
+                'advice': risk_advice
+            }
+        }
+        
+    except Exception as e:
+        logger.error(f'分析单篇文章错误: {str(e)}')
+        return {
+            'success': False,
+            'error': str(e),
+            'article_id': article.get('id')
+        }
+
 # 批量分析文章
 @analysis_bp.route('/batch-analyze', methods=['POST'])
 @ensure_chinese_response
@@ -142,55 +272,17 @@ async def batch_analyze_articles():
         if len(articles) > 10:
             return jsonify_chinese({'error': '批量分析最多支持10篇文章'}), 400
         
+        usage_route.set('batch-analyze')
+        
         results = []
         for article in articles:
-            try:
-                article_content = article.get('content', '')
-                article_title = article.get('title', '')
-                
-                if not article_content:
-                    results.append({
-                        'success': False,
-                        'error': '文章内容不能为空',
-                        'article_id': article.get('id')
-                    })
-                    continue
-                
-                # 调用AI服务进行分析
-                analysis_result = await ai_service.analyze_content(
-                    content=article_content,
-                    title=article_title
-                )
-                
-                # 计算置信度
-                source_credibility = 0.9
-                confidence_score = calculate_confidence_score(analysis_result, source_credibility)
-                risk_level = get_risk_level(confidence_score)
-                risk_advice = get_risk_advice(analysis_result.get('sentiment', 'neutral'), confidence_score)
-                
-                results.append({
-                    'success': True,
-                    'article_id': article.get('id'),
-                    'analysis': analysis_result,
-                    'confidence': {
-                        'score': round(confidence_score, 2),
-                        'level': risk_level,
-                        'advice': risk_advice
-                    }
-                })
-                
-            except Exception as e:
-                logger.error(f'分析单篇文章错误: {str(e)}')
-                results.append({
-                    'success': False,
-                    'error': str(e),
-                    'article_id': article.get('id')
-                })
+            results.append(await analyze_batch_item(article))
         
         return jsonify_chinese({
             'success': True,
             'data': {
                 'results': results,
+                'marketAnalysis': summarize_analyses(r['analysis'] for r in results if r.get('success')),
                 'total_count': len(results),
                 'success_count': len([r for r in results if r.get('success')]),
                 'failed_count': len([r for r in results if not r.get('success')]),
@@ -206,26 +298,338 @@ async def batch_analyze_articles():
             'message': str(e)
         }), 500
 
+# 异步任务最多支持的文章数量
+MAX_JOB_ARTICLES = int(os.getenv('ANALYSIS_JOB_MAX_ARTICLES', 1000))
+
+# 提交异步批量分析任务
+@analysis_bp.route('/jobs', methods=['POST'])
+@ensure_chinese_response
+def submit_analysis_job():
+    """
+    提交异步批量分析任务，立即返回任务ID，由工作线程池在后台处理
+    请求体格式:
+    {
+        "articles": [{"id": 1, "title": "...", "content": "..."}]
+    }
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请求体不能为空'}), 400
+        
+        articles = data.get('articles', [])
+        if not articles or not isinstance(articles, list):
+            return jsonify_chinese({'error': '文章列表不能为空'}), 400
+        
+        if len(articles) > MAX_JOB_ARTICLES:
+            return jsonify_chinese({'error': f'单个任务最多支持{MAX_JOB_ARTICLES}篇文章'}), 400
+        
+        job_id = analysis_job_queue.submit(articles)
+        
+        # 本进程内的工作线程按需启动，也可以通过 worker.py 独立部署工作进程
+        analysis_worker_pool.start(analyze_batch_item)
+        analysis_worker_pool.notify()
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': 'queued',
+                'total': len(articles),
+                'status_url': f'/api/analysis/jobs/{job_id}',
+                'results_url': f'/api/analysis/jobs/{job_id}/results'
+            },
+            'message': f'分析任务已提交，共{len(articles)}篇文章'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'提交分析任务错误: {str(e)}')
+        return jsonify_chinese({'error': '提交分析任务失败', 'message': str(e)}), 500
+
+# 查询异步任务进度
+@analysis_bp.route('/jobs/<job_id>', methods=['GET'])
+@ensure_chinese_response
+def get_analysis_job(job_id):
+    try:
+        job = analysis_job_queue.get_job(job_id)
+        if not job:
+            return jsonify_chinese({'error': '任务不存在'}), 404
+        
+        # 可选附带最近完成的部分结果
+        if request.args.get('include_results', '').lower() == 'true':
+            limit = int(request.args.get('limit', 100))
+            if limit > 500:
+                return jsonify_chinese({'error': 'limit参数不能超过500'}), 400
+            job['results'] = analysis_job_queue.get_results(job_id, limit=limit)
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': job,
+            'message': f"任务进度 {job['completed'] + job['failed']}/{job['total']}"
+        })
+        
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'查询分析任务错误: {str(e)}')
+        return jsonify_chinese({'error': '查询分析任务失败', 'message': str(e)}), 500
+
+# 获取异步任务结果（支持分页获取部分结果）
+@analysis_bp.route('/jobs/<job_id>/results', methods=['GET'])
+@ensure_chinese_response
+def get_analysis_job_results(job_id):
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 100))
+        if limit > 500:
+            return jsonify_chinese({'error': 'limit参数不能超过500'}), 400
+        
+        job = analysis_job_queue.get_job(job_id)
+        if not job:
+            return jsonify_chinese({'error': '任务不存在'}), 404
+        
+        results = analysis_job_queue.get_results(job_id, offset, limit)
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': job['status'],
+                'progress': job['progress'],
+                'results': results,
+                'offset': offset,
+                'returned_count': len(results)
+            },
+            'message': f'获取到{len(results)}条分析结果'
+        })
+        
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'获取分析任务结果错误: {str(e)}')
+        return jsonify_chinese({'error': '获取分析任务结果失败', 'message': str(e)}), 500
+
+def parse_time_param(value: str):
+    """解析时间参数，支持Unix时间戳和ISO格式"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+# 多粒度情绪立方体查询（按来源/分类/股票任意组合上卷）
+@analysis_bp.route('/sentiment-cube', methods=['GET'])
+@ensure_chinese_response
+def query_sentiment_cube():
+    try:
+        resolution = request.args.get('resolution', 'hour')
+        if resolution not in RESOLUTIONS:
+            return jsonify_chinese({'error': f"resolution参数只支持{'/'.join(RESOLUTIONS)}"}), 400
+        
+        group_by = [dim.strip() for dim in request.args.get('group_by', '').split(',') if dim.strip()]
+        unknown = [dim for dim in group_by if dim not in DIMENSIONS]
+        if unknown:
+            return jsonify_chinese({'error': f"不支持的分组维度: {', '.join(unknown)}"}), 400
+        
+        start = parse_time_param(request.args.get('start'))
+        end = parse_time_param(request.args.get('end'))
+        if start is not None and end is not None and start >= end:
+            return jsonify_chinese({'error': 'start必须早于end'}), 400
+        
+        result = sentiment_cube.query(
+            resolution=resolution,
+            start=start,
+            end=end,
+            group_by=group_by,
+            filters={dim: request.args.get(dim) for dim in DIMENSIONS}
+        )
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'resolution': resolution,
+                'group_by': group_by,
+                **result
+            },
+            'message': f"获取到{len(result['points'])}个数据点"
+        })
+        
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'查询情绪立方体错误: {str(e)}')
+        return jsonify_chinese({'error': '查询情绪立方体失败', 'message': str(e)}), 500
+
+# 市场事件流（报道同一事件的文章聚类）
+@analysis_bp.route('/events', methods=['GET'])
+@ensure_chinese_response
+def get_story_events():
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        min_size = int(request.args.get('min_size', 1))
+        events = story_clusterer.get_events(limit=limit, min_size=min_size)
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'events': events,
+                'statistics': story_clusterer.get_stats()
+            },
+            'message': f'获取到{len(events)}个市场事件'
+        })
+        
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'获取市场事件错误: {str(e)}')
+        return jsonify_chinese({'error': '获取市场事件失败', 'message': str(e)}), 500
+
+WATCHLIST_MAX_TICKERS = 1000
+
+def describe_tickers(codes: list) -> dict:
+    """股票代码 → 简称和交易所（词典中没有的代码返回None）"""
+    return {code: ticker_recognizer.lookup(code) for code in codes}
+
+# 关注列表：多只股票的情绪合计和合并后的最新新闻
+@analysis_bp.route('/watchlist', methods=['GET', 'POST'])
+@ensure_chinese_response
+def query_watchlist():
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            tickers = data.get('tickers', [])
+            params = data
+        else:
+            tickers = request.args.get('tickers', '').split(',')
+            params = request.args
+
+        if not isinstance(tickers, list):
+            return jsonify_chinese({'error': 'tickers参数必须为数组'}), 400
+        tickers = [str(ticker).strip() for ticker in tickers if str(ticker).strip()]
+        if not tickers:
+            return jsonify_chinese({'error': 'tickers不能为空'}), 400
+        if len(tickers) > WATCHLIST_MAX_TICKERS:
+            return jsonify_chinese({'error': f'单次最多查询{WATCHLIST_MAX_TICKERS}只股票'}), 400
+
+        limit = min(int(params.get('limit', 50)), 200)
+        per_ticker = min(int(params.get('per_ticker', 0)), 20)
+        before = parse_time_param(params.get('before'))
+        before_id = params.get('before_id') or None
+
+        result = ticker_index.query(tickers, limit=limit, per_ticker=per_ticker, before=before, before_id=before_id)
+
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'stocks': describe_tickers(tickers),
+                **result
+            },
+            'message': f'获取到{len(result["stats"])}只股票的{len(result["articles"])}篇相关新闻'
+        })
+
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'关注列表查询错误: {str(e)}')
+        return jsonify_chinese({'error': '关注列表查询失败', 'message': str(e)}), 500
+
+# 单只股票的最新新闻和情绪
+@analysis_bp.route('/tickers/<code>', methods=['GET'])
+@ensure_chinese_response
+def get_ticker_news(code):
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+        before = parse_time_param(request.args.get('before'))
+        result = ticker_index.query([code], limit=limit, before=before, before_id=request.args.get('before_id') or None)
+
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'stock': ticker_recognizer.lookup(code),
+                'stats': result['stats'].get(code),
+                'articles': result['articles'],
+                'next_before': result['next_before'],
+                'next_before_id': result['next_before_id']
+            },
+            'message': f'获取到{len(result["articles"])}篇相关新闻'
+        })
+
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'获取股票新闻错误: {str(e)}')
+        return jsonify_chinese({'error': '获取股票新闻失败', 'message': str(e)}), 500
+
+# 获取实时市场情绪（15分钟/1小时/1天滚动窗口）
+@analysis_bp.route('/market-mood', methods=['GET'])
+@ensure_chinese_response
+def get_market_mood():
+    try:
+        window = request.args.get('window', '1h')
+        if window not in WINDOWS:
+            return jsonify_chinese({'error': f"window参数只支持{'/'.join(WINDOWS)}"}), 400
+        
+        windows = market_mood.snapshot()
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'windows': windows,
+                'marketAnalysis': windows[window],
+                'timestamp': datetime.now().isoformat()
+            },
+            'message': f"最近{window}市场情绪: {windows[window]['overallSentiment']}"
+        })
+        
+    except Exception as e:
+        logger.error(f'获取市场情绪错误: {str(e)}')
+        return jsonify_chinese({'error': '获取市场情绪失败', 'message': str(e)}), 500
+
+# 获取token用量和预算使用情况
+@analysis_bp.route('/usage', methods=['GET'])
+@ensure_chinese_response
+def get_token_usage():
+    try:
+        days = int(request.args.get('days', 7))
+        if days < 1 or days > 90:
+            return jsonify_chinese({'error': 'days参数范围为1-90'}), 400
+        
+        usage = usage_tracker.get_usage(days)
+        return jsonify_chinese({
+            'success': True,
+            'data': usage,
+            'message': f"今日已使用{usage['today']['all']}个token"
+        })
+        
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'获取token用量错误: {str(e)}')
+        return jsonify_chinese({'error': '获取token用量失败', 'message': str(e)}), 500
+
 # 获取情绪趋势
 @analysis_bp.route('/sentiment-trend', methods=['GET'])
 @ensure_chinese_response
 def get_sentiment_trend():
     try:
         days = int(request.args.get('days', 7))
-        if days > 30:
-            return jsonify_chinese({'error': '天数不能超过30天'}), 400
-        
-        # 模拟情绪趋势数据
-        trend_data = [
-            {
-                'date': f'2024-01-{23-i}',
-                'positive_count': max(5, 10 - i),
-                'negative_count': max(2, 5 - i//2),
-                'neutral_count': max(3, 8 - i//3),
-                'total_articles': max(10, 20 - i)
-            }
-            for i in range(days)
-        ]
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'hour'):
+            return jsonify_chinese({'error': 'granularity参数只支持day或hour'}), 400
+        if days < 1 or days > 365:
+            return jsonify_chinese({'error': '天数范围为1-365天'}), 400
+        if granularity == 'hour' and days > 31:
+            return jsonify_chinese({'error': '按小时统计时天数不能超过31天'}), 400
+        
+        # 读取预聚合的情绪汇总
+        rollup = sentiment_rollup_store.get_trend(
+            days,
+            source=request.args.get('source') or None,
+            category=request.args.get('category') or None,
+            granularity=granularity
+        )
+        trend_data = rollup['trend']
+        total_articles = sum(d['total_articles'] for d in trend_data)
         
         return jsonify_chinese({
             'success': True,
@@ -233,9 +637,13 @@ def get_sentiment_trend():
                 'trend': trend_data,
                 'summary': {
                     'total_days': days,
-                    'avg_positive_rate': round(sum(d['positive_count'] for d in trend_data) / sum(d['total_articles'] for d in trend_data), 2),
-                    'avg_negative_rate': round(sum(d['negative_count'] for d in trend_data) / sum(d['total_articles'] for d in trend_data), 2),
-                    'trend_period': f'最近{days}天'
+                    'total_articles': total_articles,
+                    'avg_positive_rate': round(sum(d['positive_count'] for d in trend_data) / total_articles, 2) if total_articles else 0,
+                    'avg_negative_rate': round(sum(d['negative_count'] for d in trend_data) / total_articles, 2) if total_articles else 0,
+                    'trend_period': f'最近{days}天',
+                    'granularity': granularity,
+                    'by_source': rollup['by_source'],
+                    'by_category': rollup['by_category']
                 }
             },
             'message': f'获取到最近{days}天的情绪趋势数据'
@@ -283,6 +691,11 @@ async def get_ai_providers_status():
                     'standby_providers': standby_count,
                     'current_provider': service_status['current_provider'],
                     'overall_status': 'healthy' if active_count > 0 else 'degraded'
+                },
+                'statistics': {
+                    'response_parsing': service_status['response_parsing'],
+                    'hedging': service_status['hedging'],
+                    'local_analysis': service_status['local_analysis']
                 }
             },
             'message': f'系统运行正常，{active_count}个主用服务，{standby_count}个备用服务'
@@ -318,8 +731,10 @@ async def test_analysis_api():
         # 确保AI服务已初始化
         await ai_service.ensure_initialized()
         
-        # 测试hunyuan服务连通性
-        connectivity_result = await ai_service.test_connectivity('hunyuan')
+        # 读取hunyuan服务的缓存探测结果（refresh=true时在后台刷新过期结果）
+        connectivity_result = await ai_service.test_connectivity(
+            'hunyuan', refresh=request.args.get('refresh', '').lower() == 'true'
+        )
         
         return jsonify_chinese({
             'success': connectivity_result['success'],
@@ -357,8 +772,10 @@ async def test_ai_provider(provider_key):
                 'message': f'提供商 {provider_key} 不存在，支持的提供商: {list(ai_service.providers.keys())}'
             }), 400
         
-        # 测试特定提供商连通性
-        connectivity_result = await ai_service.test_connectivity(provider_key)
+        # 读取特定提供商的缓存探测结果
+        connectivity_result = await ai_service.test_connectivity(
+            provider_key, refresh=request.args.get('refresh', '').lower() == 'true'
+        )
         
         return jsonify_chinese({
             'success': connectivity_result['success'],
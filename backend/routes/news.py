@@ -1,8 +1,11 @@
 import logging
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from flask import Blueprint, request, jsonify, Response
 from functools import wraps
+from services.ticker_recognizer import ticker_recognizer
+from services.analysis_store import analysis_store
+from services.ai_service import PROMPT_VERSION
 
 logger = logging.getLogger(__name__)
 
@@ -76,9 +79,10 @@ def filter_news_by_keywords(news_list, keywords):
 
 def filter_news_by_time(news_list, hours=24):
     """根据时间过滤新闻"""
-    cutoff_time = datetime.now() - timedelta(hours=hours)
+    cutoff_time = datetime.now(timezone.utc) - timedelta(hours=hours)
+    # 不带时区的发布时间按本地时间处理
     return [news for news in news_list if 
-            datetime.fromisoformat(news['publish_time'].replace('Z', '+00:00')) > cutoff_time]
+            datetime.fromisoformat(news['publish_time'].replace('Z', '+00:00')).astimezone() > cutoff_time]
 
 def filter_news_by_sentiment(news_list, sentiment):
     """根据情绪过滤新闻"""
@@ -137,6 +141,9 @@ def get_latest_news():
             keyword_list = [k.strip() for k in keywords.split(',')]
             filtered_news = filter_news_by_keywords(filtered_news, keyword_list)
         
+        # 嵌入已保存的分析结果，情绪过滤以分析结果为准
+        filtered_news = analysis_store.attach(filtered_news, PROMPT_VERSION)
+        
         # 情绪过滤
         if sentiment:
             filtered_news = filter_news_by_sentiment(filtered_news, sentiment)
@@ -201,7 +208,7 @@ def search_news():
                 results.append(news)
         
         # 限制数量
-        results = results[:limit]
+        results = analysis_store.attach(results[:limit], PROMPT_VERSION)
         
         return jsonify_chinese({
             'success': True,
@@ -262,7 +269,7 @@ def get_news_detail(news_id):
     
     return jsonify_chinese({
         'success': True,
-        'data': news,
+        'data': analysis_store.attach([news], PROMPT_VERSION)[0],
         'message': '获取新闻详情成功'
     })
 
@@ -366,6 +373,10 @@ def crawl_news():
                         }
                     ]
                 
+                # 一次线性扫描为每条新闻打上股票标签
+                for item in news_items:
+                    ticker_recognizer.tag(item)
+                
                 crawl_results.append({
                     'source': source,
                     'success': True,
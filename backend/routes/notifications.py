@@ -1,7 +1,19 @@
-import logging
+import os
+import time
 import json
+import asyncio
+import logging
+import concurrent.futures
 from datetime import datetime
 from flask import Blueprint, request, jsonify, Response
+from services.background import background_loop
+from services.notification_outbox import notification_outbox, notification_worker_pool
+from services.notification_history import notification_history
+from services.notification_coalescer import notification_coalescer
+from services.subscription_index import subscription_index
+from services.alert_rules import alert_rule_engine
+from services.preference_store import preference_store, normalize_preferences, PRIORITIES
+from services.ticker_recognizer import ticker_recognizer
 
 logger = logging.getLogger(__name__)
 
@@ -22,30 +34,24 @@ def jsonify_chinese(*args, **kwargs):
         mimetype='application/json; charset=utf-8'
     )
 
-# 模拟用户配置数据
-MOCK_USER_CONFIGS = {
-    'user1': {
-        'preferences': {
-            'telegram': {'enabled': True, 'priority': 'high'},
-            'wechat_work': {'enabled': True, 'priority': 'medium'},
-            'email': {'enabled': False, 'priority': 'low'}
-        },
-        'channels': ['telegram', 'wechat_work']
-    },
-    'user2': {
-        'preferences': {
-            'email': {'enabled': True, 'priority': 'high'},
-            'telegram': {'enabled': False, 'priority': 'low'}
-        },
-        'channels': ['email']
-    }
-}
-
-# 模拟通知历史
-MOCK_NOTIFICATION_HISTORY = []
+def _parse_timeout_map(value):
+    """解析 "telegram:5,email:15" 格式的渠道超时配置"""
+    timeouts = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            key, seconds = item.split(':', 1)
+            try:
+                timeouts[key.strip()] = float(seconds)
+            except ValueError:
+                logger.warning(f"⚠️ 无效的渠道超时配置: {item}")
+    return timeouts
 
 class NotificationManager:
-    """通知管理器"""
+    """
+    通知管理器
+    各渠道在后台事件循环中并发发送，每个渠道单独超时，结果按完成顺序汇总；
+    可选在第一个渠道发送成功后立即返回，其余渠道在后台继续发送并更新通知历史
+    """
     
     def __init__(self):
         self.channels = {
@@ -53,80 +59,137 @@ class NotificationManager:
             'wechat_work': WechatWorkChannel(),
             'email': EmailChannel()
         }
+        self.channel_timeout = float(os.getenv('NOTIFICATION_CHANNEL_TIMEOUT', 10))
+        self.channel_timeouts = _parse_timeout_map(os.getenv('NOTIFICATION_CHANNEL_TIMEOUTS'))
+        # 紧急通知默认在第一个渠道送达后即返回
+        self.first_success_priorities = {
+            item.strip() for item in os.getenv('NOTIFICATION_FIRST_SUCCESS_PRIORITIES', 'urgent').split(',') if item.strip()
+        }
     
-    async def send_notification(self, user_id, message, priority='medium', channels=None):
-        """发送通知"""
+    async def _send_channel(self, channel_name, user_id, message, priority):
+        """发送单个渠道，超时或异常都转换为失败结果"""
+        timeout = self.channel_timeouts.get(channel_name, self.channel_timeout)
+        started = time.perf_counter()
         try:
-            user_config = MOCK_USER_CONFIGS.get(user_id, {})
+            channel_result = await asyncio.wait_for(
+                self.channels[channel_name].send(user_id, message, priority), timeout
+            )
+            result = {
+                'channel': channel_name,
+                'success': channel_result.get('success', False),
+                'message': channel_result.get('message', ''),
+                'error': channel_result.get('error', '')
+            }
+        except asyncio.TimeoutError:
+            result = {'channel': channel_name, 'success': False, 'error': f'发送超时（{timeout}秒）'}
+        except Exception as channel_error:
+            result = {'channel': channel_name, 'success': False, 'error': str(channel_error)}
+        if not result['success']:
+            result['retryable'] = True
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+    
+    @staticmethod
+    def _snapshot(record):
+        return {**record, 'results': list(record['results']), 'pending_channels': list(record['pending_channels'])}
+    
+    async def _fan_out(self, record, user_id, message, priority, channel_names, first_success):
+        """并发发送各渠道（在后台事件循环中运行），first_success在首个渠道成功或全部完成时设置"""
+        tasks = [asyncio.ensure_future(self._send_channel(name, user_id, message, priority)) for name in channel_names]
+        for completed in asyncio.as_completed(tasks):
+            result = await completed
+            record['results'].append(result)
+            record['pending_channels'].remove(result['channel'])
+            if result['success']:
+                record['successful_sends'] += 1
+                record['status'] = 'success'
+                if not first_success.done():
+                    first_success.set_result(self._snapshot(record))
+        
+        record['status'] = 'success' if record['successful_sends'] > 0 else 'failed'
+        record['completed_at'] = datetime.now().isoformat()
+        notification_history.update(record)
+        snapshot = self._snapshot(record)
+        if not first_success.done():
+            first_success.set_result(snapshot)
+        return snapshot
+    
+    async def send_notification(self, user_id, message, priority='medium', channels=None, return_on_first_success=None):
+        """
+        发送通知
+        return_on_first_success为True时第一个渠道发送成功即返回（未指定时按优先级决定），
+        返回结果中的pending_channels为仍在后台发送的渠道
+        """
+        try:
+            route = preference_store.route(user_id)
             
             # 确定要使用的渠道
-            target_channels = channels or user_config.get('channels', [])
+            target_channels = channels or route['channels']
             if not target_channels:
                 target_channels = list(self.channels.keys())
             
             results = []
-            successful_sends = 0
+            dispatch = []
             
-            for channel_name in target_channels:
+            for channel_name in dict.fromkeys(target_channels):
                 if channel_name not in self.channels:
                     results.append({
                         'channel': channel_name,
                         'success': False,
-                        'error': '渠道不存在'
+                        'error': '渠道不存在',
+                        'retryable': False
                     })
                     continue
                 
                 # 检查用户偏好
-                channel_pref = user_config.get('preferences', {}).get(channel_name, {})
-                if not channel_pref.get('enabled', True):
+                if channel_name in route['disabled']:
                     results.append({
                         'channel': channel_name,
                         'success': False,
-                        'error': '渠道被用户禁用'
+                        'error': '渠道被用户禁用',
+                        'retryable': False
                     })
                     continue
                 
-                # 发送通知
-                try:
-                    channel_result = await self.channels[channel_name].send(
-                        user_id, message, priority
-                    )
-                    if channel_result.get('success'):
-                        successful_sends += 1
-                    
-                    results.append({
-                        'channel': channel_name,
-                        'success': channel_result.get('success', False),
-                        'message': channel_result.get('message', ''),
-                        'error': channel_result.get('error', '')
-                    })
-                    
-                except Exception as channel_error:
-                    results.append({
-                        'channel': channel_name,
-                        'success': False,
-                        'error': str(channel_error)
-                    })
+                dispatch.append(channel_name)
             
-            # 记录通知历史
-            notification_record = {
-                'id': len(MOCK_NOTIFICATION_HISTORY) + 1,
+            # 记录通知历史，后台发送完成的渠道会继续更新该记录
+            notification_record = notification_history.add({
                 'user_id': user_id,
                 'message': message,
                 'priority': priority,
                 'channels_attempted': target_channels,
                 'results': results,
-                'successful_sends': successful_sends,
+                'pending_channels': list(dispatch),
+                'successful_sends': 0,
                 'timestamp': datetime.now().isoformat(),
-                'status': 'success' if successful_sends > 0 else 'failed'
-            }
+                'status': 'pending' if dispatch else 'failed'
+            })
             
-            MOCK_NOTIFICATION_HISTORY.append(notification_record)
+            if dispatch:
+                if return_on_first_success is None:
+                    return_on_first_success = priority in self.first_success_priorities
+                # 在后台事件循环中发送：提前返回时，请求的事件循环关闭不会中断其余渠道
+                first_success = concurrent.futures.Future()
+                completion = background_loop.submit(self._fan_out(
+                    notification_record, user_id, message, priority, dispatch, first_success
+                ))
+                record = await asyncio.wrap_future(first_success if return_on_first_success else completion)
+            else:
+                record = self._snapshot(notification_record)
+            
+            successful_sends = record['successful_sends']
+            if successful_sends > 0 and record['pending_channels']:
+                message_text = f"已通过{successful_sends}个渠道发送通知，{len(record['pending_channels'])}个渠道在后台继续发送"
+            elif successful_sends > 0:
+                message_text = f'成功通过{successful_sends}个渠道发送通知'
+            else:
+                message_text = '通知发送失败'
             
             return {
                 'success': successful_sends > 0,
-                'data': notification_record,
-                'message': f'成功通过{successful_sends}个渠道发送通知' if successful_sends > 0 else '通知发送失败'
+                'data': record,
+                'message': message_text
             }
             
         except Exception as error:
@@ -137,39 +200,35 @@ class NotificationManager:
             }
     
     def get_user_preferences(self, user_id):
-        """获取用户通知偏好"""
-        return MOCK_USER_CONFIGS.get(user_id, {
-            'preferences': {
-                'telegram': {'enabled': True, 'priority': 'medium'},
-                'wechat_work': {'enabled': True, 'priority': 'medium'},
-                'email': {'enabled': True, 'priority': 'medium'}
-            },
-            'channels': ['telegram', 'wechat_work', 'email']
-        })
+        """获取用户通知偏好，未设置过的用户返回默认偏好（全部渠道启用）"""
+        stored = preference_store.get(user_id)
+        if stored is not None:
+            return stored
+        return {
+            'preferences': {channel: {'enabled': True, 'priority': 'medium'} for channel in self.channels},
+            'channels': list(self.channels)
+        }
     
     def update_user_preferences(self, user_id, preferences):
-        """更新用户通知偏好"""
-        if user_id not in MOCK_USER_CONFIGS:
-            MOCK_USER_CONFIGS[user_id] = {'preferences': {}, 'channels': []}
-        
-        MOCK_USER_CONFIGS[user_id]['preferences'].update(preferences)
-        
-        # 更新启用的渠道列表
-        enabled_channels = [
-            channel for channel, pref in preferences.items() 
-            if pref.get('enabled', False)
-        ]
-        MOCK_USER_CONFIGS[user_id]['channels'] = enabled_channels
-        
-        return {'success': True, 'message': '用户偏好更新成功'}
+        """更新用户通知偏好（只修改给出的渠道），参数错误时抛出ValueError"""
+        updated = preference_store.update(user_id, normalize_preferences(preferences, self.channels))
+        return {'success': True, 'data': updated, 'message': '用户偏好更新成功'}
+    
+    def update_preferences_bulk(self, updates):
+        """批量更新多个用户的通知偏好 [{'user_id', 'preferences'}]，在一个事务中写入"""
+        if not isinstance(updates, list) or not updates:
+            raise ValueError('updates必须为非空数组')
+        normalized = []
+        for update in updates:
+            if not isinstance(update, dict) or not str(update.get('user_id') or '').strip():
+                raise ValueError('每项更新都需要user_id')
+            normalized.append((str(update['user_id']).strip(),
+                               normalize_preferences(update.get('preferences'), self.channels)))
+        return preference_store.update_many(normalized)
     
     def get_notification_history(self, user_id, limit=10):
-        """获取用户通知历史"""
-        user_history = [
-            record for record in MOCK_NOTIFICATION_HISTORY 
-            if record['user_id'] == user_id
-        ]
-        return user_history[-limit:] if limit > 0 else user_history
+        """获取用户最近的通知历史"""
+        return notification_history.recent(user_id, limit)
     
     def test_channel_connectivity(self, channel_name):
         """测试渠道连通性"""
@@ -252,6 +311,57 @@ class EmailChannel:
 # 创建全局通知管理器实例
 notification_manager = NotificationManager()
 
+async def deliver_outbox_message(item):
+    """出站队列的投递函数：发送全部渠道，返回需要重试的渠道（渠道不存在、被禁用等不重试）"""
+    result = await notification_manager.send_notification(
+        item['user_id'], item['message'], item['priority'], item['channels'] or None,
+        return_on_first_success=False
+    )
+    record = result.get('data')
+    if record is None:
+        return {'delivered': False, 'retry_channels': item['channels'] or None, 'error': result.get('error')}
+    failed = [channel for channel in record['results'] if not channel['success']]
+    return {
+        'delivered': record['successful_sends'] > 0,
+        'retry_channels': [channel['channel'] for channel in failed if channel.get('retryable')],
+        'error': '; '.join(f"{channel['channel']}: {channel['error']}" for channel in failed) or None,
+        'results': record['results'],
+        'notification_id': record['id']
+    }
+
+def enqueue_notification(user_id, message, priority, channels=None):
+    """写入出站队列并唤醒投递协程，返回202响应数据"""
+    message_id = notification_outbox.enqueue(user_id, message, priority, channels)
+    # 本进程内的投递协程按需启动，也可以通过 worker.py 独立部署
+    notification_worker_pool.start(deliver_outbox_message)
+    notification_worker_pool.notify()
+    return {
+        'message_id': message_id,
+        'status': 'pending',
+        'priority': priority,
+        'status_url': f'/api/notifications/outbox/{message_id}'
+    }
+
+# 合并阶段之后的消息写入出站队列
+notification_coalescer.set_sink(enqueue_notification)
+# 订阅提醒同样经过去重和摘要合并
+subscription_index.set_sink(notification_coalescer.submit)
+alert_rule_engine.set_sink(notification_coalescer.submit)
+
+QUEUE_MESSAGES = {
+    'pending': '通知已进入发送队列',
+    'buffered': '通知已加入摘要，稍后合并发送',
+    'suppressed': '时间窗口内已有相同内容的通知，本条不再发送'
+}
+
+def queue_notification(user_id, message, priority, channels=None):
+    """经过去重和摘要合并后入队，返回 (响应数据, HTTP状态码)"""
+    result = notification_coalescer.submit(user_id, message, priority, channels)
+    action = result.pop('action')
+    if action == 'suppressed':
+        return result, 200
+    return result, 202
+
 # 根路径路由
 @notifications_bp.route('/', methods=['GET'])
 def get_notifications_status():
@@ -261,15 +371,28 @@ def get_notifications_status():
         'endpoints': {
             'send': '/send - POST - 发送通知',
             'alert': '/alert - POST - 发送重要通知',
-            'preferences': '/preferences - GET/PUT - 用户偏好管理',
+            'preferences': '/preferences - GET/PUT - 用户偏好管理，/preferences - PUT - 批量更新',
+            'targets': '/targets - GET - 按渠道和优先级查询目标用户',
+            'broadcast': '/broadcast - POST - 向启用某渠道的用户广播',
             'history': '/history - GET - 通知历史',
             'test': '/test - POST - 测试渠道连通性',
-            'test-connectivity': '/test-connectivity - GET - 测试所有渠道连通性'
+            'test-connectivity': '/test-connectivity - GET - 测试所有渠道连通性',
+            'outbox': '/outbox - GET - 出站队列统计，/outbox/<id> - GET - 查询消息投递状态',
+            'dead-letters': '/dead-letters - GET - 查看死信，/dead-letters/replay - POST - 重新投递死信',
+            'subscriptions': '/subscriptions - GET/POST - 文章订阅管理，/subscriptions/<id> - GET/PUT/DELETE，'
+                             '/subscriptions/match - POST - 测试文章命中的订阅',
+            'rules': '/rules - GET/POST - 告警规则管理，/rules/<id> - GET/PUT/DELETE，/rules/evaluate - POST - 测试规则求值'
         },
         'supported_channels': ['telegram', 'wechat_work', 'email'],
         'features': [
             '多渠道统一接口',
-            '用户偏好设置',
+            '多渠道并发发送（单渠道超时、首个送达即返回）',
+            '持久化发送队列（指数退避重试、死信重放）',
+            '重复通知去重与低优先级通知摘要合并',
+            '按优先级加权公平调度投递（按优先级统计排队时间）',
+            '按关键词、股票、来源和情绪订阅文章提醒（倒排索引匹配）',
+            '用户自定义告警规则（表达式编译为闭包，共享谓词）',
+            '用户偏好设置（持久化存储、按渠道和优先级索引、批量更新）',
             '优先级管理',
             '历史记录追踪',
             '连通性测试',
@@ -289,8 +412,12 @@ async def send_alert_notification():
         "title": "重要市场分析报告",
         "message": "发现重要市场信号，请及时查看详细分析",
         "analysis_result": {...},
-        "urgency": "high"
+        "urgency": "high",
+        "sync": false,
+        "return_on_first_success": true
     }
+    默认写入出站队列并返回202；sync=true时在请求中直接发送，
+    high紧急程度对应urgent优先级，默认在第一个渠道送达后即返回，其余渠道在后台继续发送
     """
     try:
         data = request.get_json()
@@ -329,9 +456,18 @@ async def send_alert_notification():
         # 发送给默认用户（可以配置为系统管理员或特定用户）
         user_id = 'system_admin'
         
-        # 发送通知
+        # 默认写入出站队列后立即返回，sync=true时在请求中直接发送
+        if not data.get('sync'):
+            queued, status_code = queue_notification(user_id, full_message, priority)
+            return jsonify_chinese({
+                'success': True,
+                'data': queued,
+                'message': QUEUE_MESSAGES[queued['status']]
+            }), status_code
+        
         result = await notification_manager.send_notification(
-            user_id, full_message, priority
+            user_id, full_message, priority,
+            return_on_first_success=data.get('return_on_first_success')
         )
         
         if result['success']:
@@ -363,8 +499,11 @@ async def send_general_notification():
     {
         "message": "通知内容",
         "channels": ["telegram", "wechat_work", "email"],
-        "priority": "normal"
+        "priority": "normal",
+        "sync": false
     }
+    默认写入出站队列并返回202，失败的渠道按指数退避重试；sync=true时在请求中直接发送
+    时间窗口内内容相同的通知不再发送（返回200和suppressed），低优先级通知合并为摘要发送
     """
     try:
         data = request.get_json()
@@ -382,9 +521,18 @@ async def send_general_notification():
         # 默认用户ID
         user_id = 'system_user'
         
-        # 发送通知
+        # 默认写入出站队列后立即返回，sync=true时在请求中直接发送
+        if not data.get('sync'):
+            queued, status_code = queue_notification(user_id, message, priority, channels)
+            return jsonify_chinese({
+                'success': True,
+                'data': queued,
+                'message': QUEUE_MESSAGES[queued['status']]
+            }), status_code
+        
         result = await notification_manager.send_notification(
-            user_id, message, priority, channels
+            user_id, message, priority, channels,
+            return_on_first_success=data.get('return_on_first_success')
         )
         
         if result['success']:
@@ -474,10 +622,138 @@ def update_user_preferences(user_id):
         
         result = notification_manager.update_user_preferences(user_id, data)
         return jsonify_chinese(result)
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
     except Exception as e:
         logger.error(f'更新用户偏好错误: {str(e)}')
         return jsonify_chinese({'error': '更新用户偏好失败', 'message': str(e)}), 500
 
+# 批量更新用户偏好
+@notifications_bp.route('/preferences', methods=['PUT'])
+def update_preferences_bulk():
+    """
+    批量更新用户偏好
+    {"updates": [{"user_id": "user1", "preferences": {"email": {"enabled": true, "priority": "high"}}}, ...]}
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        updated = notification_manager.update_preferences_bulk(data.get('updates'))
+        return jsonify_chinese({
+            'success': True,
+            'data': {'users': len(data['updates']), 'updated': updated},
+            'message': '用户偏好批量更新成功'
+        })
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'批量更新用户偏好错误: {str(e)}')
+        return jsonify_chinese({'error': '批量更新用户偏好失败', 'message': str(e)}), 500
+
+# 单次查询目标用户的数量上限
+MAX_TARGETS_LIMIT = 10000
+
+def _parse_priorities(value):
+    """解析 "high,urgent" 或数组形式的渠道优先级筛选条件"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ValueError('priorities必须为数组')
+    priorities = [str(item).strip() for item in value if str(item).strip()]
+    unknown = [priority for priority in priorities if priority not in PRIORITIES]
+    if unknown:
+        raise ValueError(f"不支持的优先级: {', '.join(unknown)}，只能为 {', '.join(PRIORITIES)}")
+    return priorities or None
+
+# 按渠道和渠道优先级查询目标用户（偏好的二级索引查询）
+@notifications_bp.route('/targets', methods=['GET'])
+def get_targets():
+    try:
+        channel = request.args.get('channel', '').strip()
+        if channel not in notification_manager.channels:
+            return jsonify_chinese({'error': '请提供有效的channel参数'}), 400
+        limit = int(request.args.get('limit', 1000))
+        if not 1 <= limit <= MAX_TARGETS_LIMIT:
+            return jsonify_chinese({'error': f'limit必须在1到{MAX_TARGETS_LIMIT}之间'}), 400
+        users = preference_store.targets(
+            channel, _parse_priorities(request.args.get('priority')), limit=limit, after=request.args.get('after')
+        )
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'users': users,
+                'count': len(users),
+                'next_after': users[-1] if len(users) == limit else None
+            },
+            'message': '目标用户查询成功'
+        })
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'查询目标用户错误: {str(e)}')
+        return jsonify_chinese({'error': '查询目标用户失败', 'message': str(e)}), 500
+
+# 广播时每批解析和入队的用户数
+BROADCAST_BATCH_SIZE = 5000
+
+# 向启用了某渠道的全部用户广播
+@notifications_bp.route('/broadcast', methods=['POST'])
+def broadcast_notification():
+    """
+    广播通知
+    {
+        "message": "市场休市通知",
+        "channel": "email",
+        "priorities": ["high", "urgent"],
+        "priority": "medium"
+    }
+    按 (渠道, 渠道优先级) 索引分批查出目标用户，每批在一个事务中写入出站队列，只通过指定渠道发送
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        message = data.get('message', '')
+        channel = data.get('channel', '')
+        priority = data.get('priority', 'medium')
+        if not message:
+            return jsonify_chinese({'error': '请提供通知内容'}), 400
+        if channel not in notification_manager.channels:
+            return jsonify_chinese({'error': '请提供有效的channel参数'}), 400
+        if priority not in PRIORITIES:
+            return jsonify_chinese({'error': f"priority只能为 {', '.join(PRIORITIES)}"}), 400
+        priorities = _parse_priorities(data.get('priorities'))
+
+        recipients, after = 0, None
+        while True:
+            users = preference_store.targets(channel, priorities, limit=BROADCAST_BATCH_SIZE, after=after)
+            if not users:
+                break
+            notification_outbox.enqueue_many([
+                {'user_id': user_id, 'message': message, 'priority': priority, 'channels': [channel]}
+                for user_id in users
+            ])
+            recipients += len(users)
+            after = users[-1]
+            if len(users) < BROADCAST_BATCH_SIZE:
+                break
+        if recipients:
+            notification_worker_pool.start(deliver_outbox_message)
+            notification_worker_pool.notify()
+        return jsonify_chinese({
+            'success': True,
+            'data': {'recipients': recipients, 'channel': channel, 'priorities': priorities, 'status': 'pending'},
+            'message': f'广播已进入发送队列，共{recipients}个用户'
+        }), 202
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'广播通知错误: {str(e)}')
+        return jsonify_chinese({'error': '广播通知失败', 'message': str(e)}), 500
+
 # 获取通知历史
 @notifications_bp.route('/history/<user_id>', methods=['GET'])
 def get_notification_history(user_id):
@@ -538,4 +814,265 @@ def get_channels_status():
         })
     except Exception as e:
         logger.error(f'获取渠道状态错误: {str(e)}')
-        return jsonify_chinese({'error': '获取渠道状态失败', 'message': str(e)}), 500
\ No newline at end of file
+        return jsonify_chinese({'error': '获取渠道状态失败', 'message': str(e)}), 500
+# 文章订阅：查询用户的订阅 / 创建订阅
+@notifications_bp.route('/subscriptions', methods=['GET', 'POST'])
+def manage_subscriptions():
+    try:
+        if request.method == 'GET':
+            user_id = request.args.get('user_id', '').strip()
+            if not user_id:
+                return jsonify_chinese({'error': 'user_id不能为空'}), 400
+            subscriptions = subscription_index.list_for_user(user_id)
+            return jsonify_chinese({
+                'success': True,
+                'data': {'subscriptions': subscriptions, 'total_count': len(subscriptions)},
+                'message': '订阅列表获取成功'
+            })
+
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        user_id = str(data.get('user_id') or '').strip()
+        if not user_id:
+            return jsonify_chinese({'error': 'user_id不能为空'}), 400
+        subscription = subscription_index.create(user_id, data)
+        return jsonify_chinese({
+            'success': True,
+            'data': subscription,
+            'message': '订阅创建成功'
+        }), 201
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'订阅管理错误: {str(e)}')
+        return jsonify_chinese({'error': '订阅管理失败', 'message': str(e)}), 500
+
+# 单个订阅的查询、修改和删除
+@notifications_bp.route('/subscriptions/<int:subscription_id>', methods=['GET', 'PUT', 'DELETE'])
+def manage_subscription(subscription_id):
+    try:
+        if request.method == 'GET':
+            subscription = subscription_index.get(subscription_id)
+        elif request.method == 'PUT':
+            data = request.get_json()
+            if not data:
+                return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+            subscription = subscription_index.update(subscription_id, data)
+        else:
+            subscription = {'id': subscription_id} if subscription_index.delete(subscription_id) else None
+        if subscription is None:
+            return jsonify_chinese({'error': '订阅不存在'}), 404
+        return jsonify_chinese({
+            'success': True,
+            'data': subscription,
+            'message': {'GET': '订阅获取成功', 'PUT': '订阅更新成功', 'DELETE': '订阅已删除'}[request.method]
+        })
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'订阅管理错误: {str(e)}')
+        return jsonify_chinese({'error': '订阅管理失败', 'message': str(e)}), 500
+
+# 测试文章命中的订阅（不发送通知）
+@notifications_bp.route('/subscriptions/match', methods=['POST'])
+def match_subscriptions():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        article = {
+            'title': data.get('title', ''),
+            'content': data.get('content', ''),
+            'source': data.get('source'),
+            'tickers': data.get('tickers')
+        }
+        if article['tickers'] is None:
+            ticker_recognizer.tag(article)
+        analysis = {'sentiment': data.get('sentiment'), 'sentiment_score': data.get('sentiment_score')}
+        matched = subscription_index.match(article, analysis)
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'matched': matched,
+                'users': sorted({subscription['user_id'] for subscription in matched}),
+                'tickers': article.get('tickers') or [],
+                'index': subscription_index.get_stats()
+            },
+            'message': f'命中{len(matched)}个订阅'
+        })
+    except Exception as e:
+        logger.error(f'订阅匹配错误: {str(e)}')
+        return jsonify_chinese({'error': '订阅匹配失败', 'message': str(e)}), 500
+
+# 告警规则：查询用户的规则 / 创建规则
+@notifications_bp.route('/rules', methods=['GET', 'POST'])
+def manage_alert_rules():
+    try:
+        if request.method == 'GET':
+            user_id = request.args.get('user_id', '').strip()
+            if not user_id:
+                return jsonify_chinese({'error': 'user_id不能为空'}), 400
+            rules = alert_rule_engine.list_for_user(user_id)
+            return jsonify_chinese({
+                'success': True,
+                'data': {'rules': rules, 'total_count': len(rules)},
+                'message': '告警规则获取成功'
+            })
+
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        user_id = str(data.get('user_id') or '').strip()
+        if not user_id:
+            return jsonify_chinese({'error': 'user_id不能为空'}), 400
+        rule = alert_rule_engine.create(user_id, data)
+        return jsonify_chinese({
+            'success': True,
+            'data': rule,
+            'message': '告警规则创建成功'
+        }), 201
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'告警规则管理错误: {str(e)}')
+        return jsonify_chinese({'error': '告警规则管理失败', 'message': str(e)}), 500
+
+# 单条告警规则的查询、修改和删除
+@notifications_bp.route('/rules/<int:rule_id>', methods=['GET', 'PUT', 'DELETE'])
+def manage_alert_rule(rule_id):
+    try:
+        if request.method == 'GET':
+            rule = alert_rule_engine.get(rule_id)
+        elif request.method == 'PUT':
+            data = request.get_json()
+            if not data:
+                return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+            rule = alert_rule_engine.update(rule_id, data)
+        else:
+            rule = {'id': rule_id} if alert_rule_engine.delete(rule_id) else None
+        if rule is None:
+            return jsonify_chinese({'error': '告警规则不存在'}), 404
+        return jsonify_chinese({
+            'success': True,
+            'data': rule,
+            'message': {'GET': '告警规则获取成功', 'PUT': '告警规则更新成功', 'DELETE': '告警规则已删除'}[request.method]
+        })
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'告警规则管理错误: {str(e)}')
+        return jsonify_chinese({'error': '告警规则管理失败', 'message': str(e)}), 500
+
+# 测试文章命中的告警规则（不发送通知）
+@notifications_bp.route('/rules/evaluate', methods=['POST'])
+def evaluate_alert_rules():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify_chinese({'error': '请提供JSON格式的请求体'}), 400
+        article = data.get('article') or {}
+        analysis = data.get('analysis') or {}
+        if not isinstance(article, dict) or not isinstance(analysis, dict):
+            return jsonify_chinese({'error': 'article和analysis必须为对象'}), 400
+        if 'tickers' not in article:
+            ticker_recognizer.tag(article)
+        matched = alert_rule_engine.evaluate(article, analysis)
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'matched': matched,
+                'users': sorted({rule['user_id'] for rule in matched}),
+                'engine': alert_rule_engine.get_stats()
+            },
+            'message': f'命中{len(matched)}条告警规则'
+        })
+    except Exception as e:
+        logger.error(f'告警规则求值错误: {str(e)}')
+        return jsonify_chinese({'error': '告警规则求值失败', 'message': str(e)}), 500
+
+# 出站队列统计
+@notifications_bp.route('/outbox', methods=['GET'])
+def get_outbox_stats():
+    try:
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'queue': notification_outbox.get_stats(),
+                'priorities': notification_outbox.get_priority_stats(),
+                'workers': notification_worker_pool.size,
+                'workers_running': notification_worker_pool.running,
+                'coalescer': notification_coalescer.get_stats(),
+                'preferences': preference_store.get_stats()
+            },
+            'message': '出站队列状态获取成功'
+        })
+    except Exception as e:
+        logger.error(f'获取出站队列状态错误: {str(e)}')
+        return jsonify_chinese({'error': '获取出站队列状态失败', 'message': str(e)}), 500
+
+# 查询单条通知的投递状态
+@notifications_bp.route('/outbox/<message_id>', methods=['GET'])
+def get_outbox_message(message_id):
+    try:
+        message = notification_outbox.get(message_id)
+        if message is None:
+            return jsonify_chinese({'error': '通知不存在'}), 404
+        return jsonify_chinese({
+            'success': True,
+            'data': message,
+            'message': '通知状态获取成功'
+        })
+    except Exception as e:
+        logger.error(f'获取通知状态错误: {str(e)}')
+        return jsonify_chinese({'error': '获取通知状态失败', 'message': str(e)}), 500
+
+# 查看死信
+@notifications_bp.route('/dead-letters', methods=['GET'])
+def get_dead_letters():
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        offset = int(request.args.get('offset', 0))
+        messages = notification_outbox.list_dead(limit=limit, offset=offset)
+        return jsonify_chinese({
+            'success': True,
+            'data': {
+                'messages': messages,
+                'total_count': notification_outbox.get_stats()['dead']
+            },
+            'message': f'获取到{len(messages)}条死信'
+        })
+    except ValueError as e:
+        return jsonify_chinese({'error': '参数格式错误', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'获取死信错误: {str(e)}')
+        return jsonify_chinese({'error': '获取死信失败', 'message': str(e)}), 500
+
+# 重新投递死信
+@notifications_bp.route('/dead-letters/replay', methods=['POST'])
+def replay_dead_letters():
+    """
+    请求体格式:
+    {"ids": ["..."]}  指定消息ID；{"all": true} 重放全部死信
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        message_ids = data.get('ids')
+        if message_ids is None and not data.get('all'):
+            return jsonify_chinese({'error': '请提供ids或all=true'}), 400
+        if message_ids is not None and not isinstance(message_ids, list):
+            return jsonify_chinese({'error': 'ids参数必须为数组'}), 400
+        
+        replayed = notification_outbox.replay(message_ids)
+        if replayed:
+            notification_worker_pool.start(deliver_outbox_message)
+            notification_worker_pool.notify()
+        
+        return jsonify_chinese({
+            'success': True,
+            'data': {'replayed': replayed},
+            'message': f'已重新投递{replayed}条死信'
+        })
+    except Exception as e:
+        logger.error(f'重放死信错误: {str(e)}')
+        return jsonify_chinese({'error': '重放死信失败', 'message': str(e)}), 500
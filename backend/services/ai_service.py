@@ -6,70 +6,160 @@ import hashlib
 import hmac
 import time
 import json
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
 from datetime import datetime
+from services.sentiment_lexicon import local_sentiment_analyzer
+from services.analysis_stream import PartialFieldExtractor
+from services.analysis_parser import analysis_parser, AnalysisParseError
+from services.provider_router import ProviderRouter, HedgeBudget, CIRCUIT_CLOSED
+from services.background import background_loop
+from services.concurrency import AdaptiveConcurrencyLimiter, OUTCOME_SUCCESS, OUTCOME_OVERLOAD, OUTCOME_ERROR
+from services.usage_tracker import usage_tracker, usage_route, PROBE_ROUTE
+from services.story_cluster import story_clusterer, StoryCluster
+from services.ticker_recognizer import ticker_recognizer
 
 logger = logging.getLogger(__name__)
 
+# 分析提示版本：修改分析提示或输出字段时递增，已保存的分析结果按版本区分
+PROMPT_VERSION = 'v1'
+
+class AIProviderError(Exception):
+    """AI服务提供商返回的错误，携带HTTP状态码和Retry-After提示"""
+    
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
 class AIServiceManager:
     """
     国内AI服务管理器
     支持：混元、元宝、DeepSeek等主流国内AI接口
+    通过 register_provider 注册提供商，按延迟和错误率的EWMA为每个请求选择最健康的提供商
     """
     
     def __init__(self):
-        self.providers = {
-            'hunyuan': {
-                'name': '腾讯混元',
-                'base_url': 'https://hunyuan.cloud.tencent.com/hunyuan',
-                'api_key': os.getenv('HUNYUAN_API_KEY'),
-                'secret_id': os.getenv('HUNYUAN_SECRET_ID'),
-                'available': False,
-                'last_error': None
-            }
-        }
-        
+        self.providers = {}
         self.current_provider = None
-        self.fallback_order = ['hunyuan']
+        self.fallback_order = []
         self._initialized = False
         
+        # 按提供商类型分发请求，新的类型只需注册对应的请求函数
+        self.request_handlers = {
+            'hunyuan': self._make_hunyuan_request,
+            'openai': self._make_openai_compatible_request
+        }
+        self.stream_handlers = {
+            'hunyuan': self._stream_hunyuan_request,
+            'openai': self._stream_openai_compatible_request
+        }
+        self.router = ProviderRouter()
+        # 每个提供商的AIMD自适应并发限制
+        self.adaptive_concurrency = os.getenv('AI_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+        self.limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+        
+        # 对冲请求：主请求超过观测到的p95延迟仍未返回时，向另一个提供商发出备用请求
+        self.hedge_enabled = os.getenv('AI_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_min_samples = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+        self.hedge_default_delay = float(os.getenv('AI_HEDGE_DEFAULT_DELAY', 2.0))
+        self.hedge_budget = HedgeBudget()
+        self.hedge_stats = {'requests': 0, 'fired': 0, 'won': 0, 'skipped_budget': 0, 'skipped_unavailable': 0}
+        
+        # 后台健康探测：结果按TTL缓存，状态接口只读取缓存
+        self.probe_ttl = float(os.getenv('AI_PROBE_TTL', 300))
+        self.probe_interval = float(os.getenv('AI_PROBE_INTERVAL', 60))
+        self.probe_results: Dict[str, Dict[str, Any]] = {}
+        self._probes_in_flight = set()
+        self._probe_task = None
+        
+        self.register_provider('hunyuan', {
+            'name': '腾讯混元',
+            'type': 'hunyuan',
+            'base_url': os.getenv('HUNYUAN_BASE_URL', 'https://hunyuan.cloud.tencent.com/hunyuan'),
+            'api_key': os.getenv('HUNYUAN_API_KEY'),
+            'secret_id': os.getenv('HUNYUAN_SECRET_ID')
+        })
+        self.register_provider('deepseek', {
+            'name': 'DeepSeek',
+            'type': 'openai',
+            'base_url': os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com/v1'),
+            'api_key': os.getenv('DEEPSEEK_API_KEY'),
+            'model': os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
+        })
+        # 任意OpenAI兼容接口
+        if os.getenv('OPENAI_COMPATIBLE_BASE_URL'):
+            self.register_provider('openai_compatible', {
+                'name': os.getenv('OPENAI_COMPATIBLE_NAME', 'OpenAI兼容服务'),
+                'type': 'openai',
+                'base_url': os.getenv('OPENAI_COMPATIBLE_BASE_URL'),
+                'api_key': os.getenv('OPENAI_COMPATIBLE_API_KEY'),
+                'model': os.getenv('OPENAI_COMPATIBLE_MODEL', 'gpt-3.5-turbo')
+            })
+        
+        # 本地词典快速通道：情绪明确的文章不再调用大模型
+        self.local_fast_path = os.getenv('LOCAL_SENTIMENT_FAST_PATH', 'true').lower() == 'true'
+        self.local_stats = {'local_resolved': 0, 'escalated': 0}
+        
+        # 事件聚类：同一事件的多篇文章只由代表文章调用大模型，其他成员继承结果
+        self.story_clustering = os.getenv('STORY_CLUSTERING', 'true').lower() == 'true'
+        self.story_wait = float(os.getenv('STORY_CLUSTER_WAIT', 20))
+        
+    def register_provider(self, provider_key: str, config: Dict[str, Any]):
+        """
+        注册AI服务提供商
+        config需包含name、type（hunyuan/openai）、base_url、api_key，openai类型可指定model
+        """
+        if config.get('type') not in self.request_handlers:
+            raise ValueError(f"不支持的提供商类型: {config.get('type')}")
+        
+        self.providers[provider_key] = {
+            'secret_id': None,
+            'model': None,
+            **config,
+            'key': provider_key,
+            'available': False,
+            'last_error': None
+        }
+        if provider_key not in self.fallback_order:
+            self.fallback_order.append(provider_key)
+        self.router.register(provider_key)
+        if provider_key not in self.limiters:
+            self.limiters[provider_key] = AdaptiveConcurrencyLimiter(config['name'])
+    
+    def _is_configured(self, provider: Dict[str, Any]) -> bool:
+        """检查提供商是否已配置必需的密钥"""
+        if provider['type'] == 'hunyuan':
+            return bool(provider['api_key'] and provider['secret_id'])
+        return bool(provider['api_key'] and provider['base_url'])
+    
+    def get_routable_providers(self) -> List[str]:
+        """按健康度排序的可路由提供商（已配置且熔断器未打开）"""
+        configured = [key for key in self.fallback_order if self._is_configured(self.providers[key])]
+        return self.router.rank(configured)
+    
     async def initialize_providers(self):
-        """初始化AI服务提供商可用性检测"""
+        """
+        初始化AI服务提供商
+        不再同步发送测试请求：已配置的提供商直接参与路由，可用性由后台健康探测和熔断器维护
+        """
         if self._initialized:
             return
-            
-        has_available_provider = False
         
         for key, provider in self.providers.items():
             # 检查API密钥是否存在
-            if not provider['api_key'] or not provider['secret_id']:
-                logger.warning(f"⚠️ {provider['name']} API密钥或SecretId未配置")
+            if not self._is_configured(provider):
+                logger.warning(f"⚠️ {provider['name']} API密钥未配置")
                 provider['available'] = False
                 continue
-            
-            # 测试服务可用性
-            try:
-                provider['available'] = await self.test_provider_availability(key)
-                if provider['available']:
-                    has_available_provider = True
-                    logger.info(f"✅ {provider['name']} 服务可用")
-                else:
-                    logger.warning(f"❌ {provider['name']} 服务不可用")
-            except Exception as e:
-                provider['available'] = False
-                provider['last_error'] = str(e)
-                logger.error(f"❌ {provider['name']} 服务测试失败: {e}")
+            provider['available'] = self.router.health[key].is_routable()
         
         # 设置当前可用的提供商
-        if has_available_provider:
-            for key in self.fallback_order:
-                if self.providers[key]['available']:
-                    self.current_provider = key
-                    logger.info(f"🎯 当前使用AI服务: {self.providers[key]['name']}")
-                    break
+        if any(provider['available'] for provider in self.providers.values()):
+            self.select_optimal_provider()
         else:
             logger.warning("⚠️ 没有可用的AI服务提供商，将使用基础分析模式")
         
+        self.start_health_probing()
         self._initialized = True
     
     async def ensure_initialized(self):
@@ -77,47 +167,260 @@ class AIServiceManager:
         if not self._initialized:
             await self.initialize_providers()
     
-    async def test_provider_availability(self, provider_key: str) -> bool:
-        """测试服务提供商可用性"""
+    def start_health_probing(self):
+        """启动后台健康探测（重复调用不会重复启动）"""
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        if not any(self._is_configured(provider) for provider in self.providers.values()):
+            return
+        self._probe_task = background_loop.run_periodic(self.refresh_probes, self.probe_interval)
+    
+    async def refresh_probes(self, force: bool = False):
+        """探测缓存已过期的提供商"""
+        now = time.monotonic()
+        expired = [
+            key for key, provider in self.providers.items()
+            if self._is_configured(provider) and (
+                force or now - self.probe_results.get(key, {}).get('_checked_monotonic', float('-inf')) >= self.probe_ttl
+            )
+        ]
+        if expired:
+            await asyncio.gather(*(self.probe_provider(key) for key in expired))
+    
+    async def probe_provider(self, provider_key: str) -> bool:
+        """
+        低成本健康探测：OpenAI兼容接口查询模型列表，混元发送max_tokens=1的极短请求
+        结果写入缓存，成功时可直接关闭熔断器
+        """
+        # 同一提供商的探测正在进行时不重复发送
+        if provider_key in self._probes_in_flight:
+            return self.probe_results.get(provider_key, {}).get('ok', False)
+        self._probes_in_flight.add(provider_key)
         try:
-            provider = self.providers[provider_key]
-            test_prompt = '测试连接，请回复"OK"'
-            
-            response = await self.make_request(provider_key, test_prompt, 50)
-            
-            # 清除之前的错误信息
-            provider['last_error'] = None
-            
-            return response and 'OK' in response
+            return await self._run_probe(provider_key)
+        finally:
+            self._probes_in_flight.discard(provider_key)
+    
+    async def _run_probe(self, provider_key: str) -> bool:
+        provider = self.providers[provider_key]
+        health = self.router.health[provider_key]
+        start_time = time.monotonic()
+        # 探测请求的用量记在probe接口下，不占用正常请求的预算
+        route_token = usage_route.set(PROBE_ROUTE)
+        try:
+            if provider['type'] == 'openai':
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(
+                        f"{provider['base_url']}/models",
+                        headers=self._openai_compatible_headers(provider),
+                        timeout=aiohttp.ClientTimeout(total=5)
+                    ) as response:
+                        if response.status != 200:
+                            raise await self._build_provider_error(response)
+            else:
+                await self.request_handlers[provider['type']](provider, '1', 1)
+            ok, error_message = True, None
+            health.record_probe_success()
         except Exception as error:
-            logger.warning(f"{self.providers[provider_key]['name']} 连接测试失败: {str(error)}")
-            
-            # 记录具体的错误信息
-            self.providers[provider_key]['last_error'] = self.extract_error_message(error)
-            
-            return False
+            ok, error_message = False, self.extract_error_message(error)
+            health.record_failure()
+            logger.warning(f"{provider['name']} 健康探测失败: {str(error)}")
+        finally:
+            usage_route.reset(route_token)
+        
+        self.probe_results[provider_key] = {
+            'ok': ok,
+            'error': error_message,
+            'latency_ms': round((time.monotonic() - start_time) * 1000, 1),
+            'checked_at': datetime.now().isoformat(),
+            '_checked_monotonic': time.monotonic()
+        }
+        provider['available'] = health.is_routable()
+        provider['last_error'] = error_message
+        return ok
+    
+    def get_probe_result(self, provider_key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的探测结果（不包含内部字段）"""
+        result = self.probe_results.get(provider_key)
+        if result is None:
+            return None
+        return {
+            **{key: value for key, value in result.items() if not key.startswith('_')},
+            'expired': time.monotonic() - result['_checked_monotonic'] >= self.probe_ttl
+        }
+    
+    async def test_provider_availability(self, provider_key: str) -> bool:
+        """测试服务提供商可用性（低成本探测）"""
+        return await self.probe_provider(provider_key)
     
     def select_optimal_provider(self):
         """选择最优的AI服务提供商"""
-        for provider_key in self.fallback_order:
-            provider = self.providers[provider_key]
-            if provider['available']:
-                self.current_provider = provider_key
-                logger.info(f"✅ 选择 {provider['name']} 作为主要AI服务提供商")
-                return
+        routable = self.get_routable_providers()
+        if routable:
+            self.current_provider = routable[0]
+            logger.info(f"✅ 选择 {self.providers[self.current_provider]['name']} 作为主要AI服务提供商")
+            return
         
         logger.warning("⚠️ 没有可用的AI服务提供商，请检查API密钥配置")
         self.current_provider = None
     
-    async def make_request(self, provider_key: str, prompt: str, max_tokens: int = 1000) -> Optional[str]:
-        """向AI服务提供商发送请求"""
+    async def make_request(self, provider_key: str, prompt: str, max_tokens: int = 1000, hedge: bool = None,
+                           admission: Optional[object] = None) -> Optional[str]:
+        """
+        向AI服务提供商发送请求
+        hedge为True（或未指定且全局开启对冲）时，主请求超过p95延迟未返回会向其他提供商发出对冲请求
+        admission为调用方从熔断器allow_request()取得的放行凭证，请求被取消时归还
+        """
+        if hedge is None:
+            hedge = self.hedge_enabled
+        if hedge:
+            return await self._make_hedged_request(provider_key, prompt, max_tokens, admission)
+        return await self._make_single_request(provider_key, prompt, max_tokens, admission)
+    
+    async def _make_single_request(self, provider_key: str, prompt: str, max_tokens: int,
+                                   admission: Optional[object] = None) -> Optional[str]:
+        """发送单个请求，并记录延迟和成败用于健康度路由"""
         provider = self.providers[provider_key]
+        handler = self.request_handlers.get(provider['type'])
+        if handler is None:
+            return None
+        
+        health = self.router.health[provider_key]
+        limiter = self.limiters[provider_key] if self.adaptive_concurrency else None
+        try:
+            started_at = await limiter.acquire() if limiter else None
+        except asyncio.CancelledError:
+            health.release(admission)
+            raise
+        
+        start_time = time.monotonic()
+        try:
+            response = await handler(provider, prompt, max_tokens)
+        except asyncio.CancelledError:
+            # 对冲中落败被取消的请求不计入统计
+            health.release(admission)
+            if limiter:
+                limiter.release(started_at, OUTCOME_ERROR)
+            raise
+        except Exception as error:
+            health.record_failure(time.monotonic() - start_time)
+            provider['last_error'] = self.extract_error_message(error)
+            provider['available'] = health.is_routable()
+            if limiter:
+                self._release_failed(limiter, started_at, error)
+            raise
         
-        if provider_key == 'hunyuan':
-            return await self._make_hunyuan_request(provider, prompt, max_tokens)
+        latency = time.monotonic() - start_time
+        if limiter:
+            limiter.release(started_at, OUTCOME_SUCCESS, latency=latency)
+        health.record_success(latency)
+        provider['available'] = True
+        provider['last_error'] = None
+        return response
+    
+    @staticmethod
+    def _release_failed(limiter: AdaptiveConcurrencyLimiter, started_at: float, error: Exception):
+        """请求失败时归还并发名额：限流（429/503）和超时视为过载，减小并发上限"""
+        overloaded = isinstance(error, asyncio.TimeoutError) or (
+            isinstance(error, AIProviderError) and error.status_code in (429, 503)
+        )
+        limiter.release(
+            started_at,
+            OUTCOME_OVERLOAD if overloaded else OUTCOME_ERROR,
+            retry_after=getattr(error, 'retry_after', None)
+        )
+    
+    def _get_hedge_delay(self, provider_key: str) -> float:
+        """对冲触发延迟：样本充足时取主提供商的p95延迟"""
+        health = self.router.health[provider_key]
+        if len(health.latency_samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(0.05, health.latency_percentile(0.95))
+    
+    def _select_hedge_provider(self, primary_key: str) -> Tuple[Optional[str], Optional[object]]:
+        """
+        选择对冲请求的提供商，返回 (提供商key, 放行凭证)：优先其他健康的提供商，
+        否则在主提供商熔断器关闭时向其再发一次；半开状态下主请求就是探测，不再重复发送
+        """
+        for provider_key in self.get_routable_providers():
+            if provider_key == primary_key:
+                continue
+            admission = self.router.health[provider_key].allow_request()
+            if admission is not None:
+                return provider_key, admission
+        health = self.router.health[primary_key]
+        if health.state == CIRCUIT_CLOSED:
+            admission = health.allow_request()
+            if admission is not None:
+                return primary_key, admission
+        return None, None
+    
+    async def _make_hedged_request(self, provider_key: str, prompt: str, max_tokens: int,
+                                   admission: Optional[object] = None) -> Optional[str]:
+        """对冲请求：先到先得，取消落败的请求"""
+        self.hedge_stats['requests'] += 1
+        self.hedge_budget.record_request()
+        
+        primary = asyncio.ensure_future(self._make_single_request(provider_key, prompt, max_tokens, admission))
+        done, _ = await asyncio.wait({primary}, timeout=self._get_hedge_delay(provider_key))
+        if done:
+            return primary.result()
+        
+        hedge_key, hedge_admission = self._select_hedge_provider(provider_key)
+        if hedge_key is None:
+            self.hedge_stats['skipped_unavailable'] += 1
+            return await primary
+        if not self.hedge_budget.try_spend():
+            self.router.health[hedge_key].release(hedge_admission)
+            self.hedge_stats['skipped_budget'] += 1
+            return await primary
+        
+        self.hedge_stats['fired'] += 1
+        logger.info(f"🔀 {self.providers[provider_key]['name']} 响应超过p95延迟，向 {self.providers[hedge_key]['name']} 发出对冲请求")
+        hedge = asyncio.ensure_future(self._make_single_request(hedge_key, prompt, max_tokens, hedge_admission))
+        
+        pending = {primary, hedge}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_stats['won'] += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # 取消落败的请求并等待其结束，让它们归还并发名额和探测凭证
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def route_request(self, prompt: str, max_tokens: int = 1000) -> Tuple[Optional[str], Optional[str]]:
+        """
+        按健康度依次尝试提供商，返回 (响应文本, 提供商key)
+        某个提供商失败时自动顺延到下一个，熔断的提供商在冷却后通过半开探测自动恢复
+        """
+        last_error = None
+        for provider_key in self.get_routable_providers():
+            # 提供商当日预算用尽时跳过
+            if usage_tracker.check_budget(provider=provider_key):
+                continue
+            admission = self.router.health[provider_key].allow_request()
+            if admission is None:
+                continue
+            try:
+                response = await self.make_request(provider_key, prompt, max_tokens, admission=admission)
+                self.current_provider = provider_key
+                return response, provider_key
+            except Exception as error:
+                last_error = error
+                logger.warning(f"⚠️ {self.providers[provider_key]['name']} 请求失败，尝试下一个提供商: {str(error)}")
         
-        # 可以添加其他AI服务提供商的实现
-        return None
+        if last_error is not None:
+            raise last_error
+        return None, None
     
     def _generate_hunyuan_signature(self, secret_key: str, timestamp: int) -> str:
         """生成腾讯混元API签名"""
@@ -158,11 +461,15 @@ class AIServiceManager:
                 ) as response:
                     if response.status == 200:
                         result = await response.json()
-                        return result.get('choices', [{}])[0].get('message', {}).get('content', '')
+                        content = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+                        usage_tracker.record_response(provider['key'], prompt, content, result.get('usage'))
+                        return content
                     else:
-                        error_text = await response.text()
-                        raise Exception(f"API请求失败: {response.status} - {error_text}")
+                        raise await self._build_provider_error(response)
                         
+        except asyncio.TimeoutError:
+            logger.error("腾讯混元请求超时")
+            raise
         except aiohttp.ClientError as error:
             logger.error(f"腾讯混元网络请求错误: {str(error)}")
             raise Exception(f"网络连接错误: {str(error)}")
@@ -170,6 +477,59 @@ class AIServiceManager:
             logger.error(f"腾讯混元API调用失败: {str(error)}")
             raise error
     
+    def _openai_compatible_headers(self, provider: Dict) -> Dict[str, str]:
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {provider["api_key"]}'
+        }
+    
+    async def _make_openai_compatible_request(self, provider: Dict, prompt: str, max_tokens: int) -> Optional[str]:
+        """OpenAI兼容接口请求（DeepSeek等）"""
+        payload = {
+            'model': provider['model'],
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': max_tokens,
+            'temperature': 0.7,
+            'top_p': 0.9
+        }
+        
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    f"{provider['base_url']}/chat/completions",
+                    headers=self._openai_compatible_headers(provider),
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        content = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+                        usage_tracker.record_response(provider['key'], prompt, content, result.get('usage'))
+                        return content
+                    else:
+                        raise await self._build_provider_error(response)
+                        
+        except asyncio.TimeoutError:
+            logger.error(f"{provider['name']}请求超时")
+            raise
+        except aiohttp.ClientError as error:
+            logger.error(f"{provider['name']}网络请求错误: {str(error)}")
+            raise Exception(f"网络连接错误: {str(error)}")
+    
+    async def _build_provider_error(self, response: aiohttp.ClientResponse) -> AIProviderError:
+        """根据非200响应构建错误"""
+        error_text = await response.text()
+        retry_after = response.headers.get('Retry-After')
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        return AIProviderError(
+            f"API请求失败: {response.status} - {error_text}",
+            status_code=response.status,
+            retry_after=retry_after
+        )
+    
     def extract_error_message(self, error: Exception) -> str:
         """从错误中提取有用的错误信息"""
         error_msg = str(error)
@@ -193,11 +553,16 @@ class AIServiceManager:
         for key, provider in self.providers.items():
             provider_status[key] = {
                 'name': provider['name'],
+                'type': provider['type'],
+                'model': provider.get('model'),
                 'available': provider['available'],
                 'has_api_key': bool(provider['api_key']),
-                'configured': bool(provider['api_key'] and provider['secret_id']),
+                'configured': self._is_configured(provider),
                 'base_url': provider['base_url'],
-                'last_error': provider.get('last_error')
+                'last_error': provider.get('last_error'),
+                'health': self.router.health[key].snapshot(),
+                'concurrency': self.limiters[key].snapshot() if self.adaptive_concurrency else None,
+                'probe': self.get_probe_result(key)
             }
             
             if provider['api_key']:
@@ -215,25 +580,47 @@ class AIServiceManager:
             else:
                 status_messages.append(f"{provider['name']}: API密钥未配置")
         
+        routable = self.get_routable_providers()
+        
         return {
             'current_provider': self.current_provider,
             'providers': provider_status,
             'fallback_order': self.fallback_order,
+            'routing_order': routable,
             'has_configured_api_keys': has_configured_api_keys,
-            'service_available': bool(self.current_provider),
+            'service_available': bool(routable),
             'message': '\n'.join(status_messages),
-            'detailed_status': provider_status
+            'detailed_status': provider_status,
+            'response_parsing': analysis_parser.get_stats(),
+            'hedging': {
+                'enabled': self.hedge_enabled,
+                'budget_ratio': self.hedge_budget.ratio,
+                **self.hedge_stats
+            },
+            'story_clustering': {
+                'enabled': self.story_clustering,
+                **story_clusterer.get_stats()
+            },
+            'local_analysis': {
+                'fast_path_enabled': self.local_fast_path,
+                'ambiguity_threshold': local_sentiment_analyzer.ambiguity_threshold,
+                **self.local_stats
+            }
         }
     
     def get_provider_status(self) -> Dict[str, Any]:
         """获取提供商状态（兼容性方法）"""
         return self.get_service_status()
     
-    async def test_connectivity(self, provider_key: str = None) -> Dict[str, Any]:
-        """测试AI服务连通性"""
+    async def test_connectivity(self, provider_key: str = None, refresh: bool = False) -> Dict[str, Any]:
+        """
+        查询AI服务连通性
+        只读取后台探测的缓存结果；缓存缺失或refresh且已过期时在后台触发探测，不阻塞当前请求
+        """
         try:
             if not provider_key:
-                provider_key = self.current_provider
+                routable = self.get_routable_providers()
+                provider_key = self.current_provider or (routable[0] if routable else None)
             
             if not provider_key:
                 return {
@@ -243,18 +630,32 @@ class AIServiceManager:
                 }
             
             provider = self.providers[provider_key]
+            configured = self._is_configured(provider)
+            probe = self.get_probe_result(provider_key)
+            
+            probe_pending = False
+            if configured and (probe is None or (refresh and probe['expired'])):
+                background_loop.submit(self.probe_provider(provider_key))
+                probe_pending = True
             
-            # 测试连接
-            test_result = await self.test_provider_availability(provider_key)
+            if probe is not None:
+                test_result = probe['ok'] and provider['available']
+                message = f"{provider['name']}连通性测试{'成功' if test_result else '失败'}"
+            else:
+                test_result = False
+                message = f"{provider['name']}健康探测进行中" if configured else f"{provider['name']}API密钥未配置"
             
             return {
                 'success': test_result,
                 'provider': provider['name'],
                 'provider_key': provider_key,
-                'configured': bool(provider['api_key'] and provider['secret_id']),
+                'configured': configured,
                 'available': provider['available'],
                 'last_error': provider.get('last_error'),
-                'message': f"{provider['name']}连通性测试{'成功' if test_result else '失败'}",
+                'probe': probe,
+                'probe_pending': probe_pending,
+                'health': self.router.health[provider_key].snapshot(),
+                'message': message,
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -266,18 +667,124 @@ class AIServiceManager:
                 'timestamp': datetime.now().isoformat()
             }
     
-    async def analyze_content(self, content: str, title: str = "", source_credibility: float = 0.8) -> Dict[str, Any]:
-        """分析文章内容"""
-        if not self.current_provider:
+    async def analyze_content(self, content: str, title: str = "", source_credibility: float = 0.8,
+                              tickers: List[str] = None) -> Dict[str, Any]:
+        """
+        分析文章内容
+        tickers为文章中识别出的股票代码（调用方已打标签时传入，未传入时在此识别），用于事件聚类和结果继承
+        """
+        await self.ensure_initialized()
+        
+        if not self.get_routable_providers():
             # 使用基础分析模式
             return self._get_fallback_analysis(content, title, source_credibility)
         
+        story, entities = None, set()
+        if self.story_clustering:
+            if tickers is None and ticker_recognizer.enabled:
+                tickers = [entity['code'] for entity in ticker_recognizer.recognize(f'{title}\n{content}')]
+            entities = set(tickers or ())
+            story = story_clusterer.assign(content, title, entities=entities)[0]
+        
+        # 本地词典评分明确的文章直接返回，只有模糊的文章才升级到大模型
+        if self.local_fast_path:
+            local_result = local_sentiment_analyzer.analyze(content, title, source_credibility)
+            if not local_result['ambiguous']:
+                self.local_stats['local_resolved'] += 1
+                return self._tag_story(local_result, story)
+            self.local_stats['escalated'] += 1
+        
+        # token预算用尽时降级为本地分析
+        budget_reason = usage_tracker.check_budget()
+        if budget_reason:
+            return self._tag_story(
+                self._get_budget_limited_analysis(content, title, source_credibility, budget_reason), story
+            )
+        
+        # 同一事件已有代表文章在分析时等待并继承其结果；没有识别出股票的文章无法确认是否同一标的，单独分析
+        owner = False
+        if story is not None and entities:
+            future, owner = story_clusterer.begin_analysis(story, entities)
+            if not owner:
+                inherited = await self._inherit_story_analysis(future, story, entities, content, title, source_credibility)
+                if inherited is not None:
+                    return self._tag_story(inherited, story, inherited=True)
+        
+        result = None
         try:
-            # 限制内容长度，优化API调用成本
-            truncated_content = content[:4000]
+            analysis_prompt = self._build_analysis_prompt(content, title)
+            
+            response, provider_key = await self.route_request(analysis_prompt, 1000)
             
-            # 构建分析提示
-            analysis_prompt = f"""
+            if response:
+                result = self._parse_analysis_response(response, source_credibility, provider_key)
+                if result is None:
+                    # 输出无法修复时才重新请求模型
+                    result = await self._reask_analysis(response, source_credibility)
+                
+        except Exception as error:
+            logger.error(f"AI分析失败: {str(error)}")
+        finally:
+            if owner:
+                story_clusterer.finish_analysis(story, result)
+        
+        if result is None:
+            result = self._get_fallback_analysis(content, title, source_credibility)
+        return self._tag_story(result, story)
+    
+    async def _inherit_story_analysis(self, future, story: StoryCluster, entities: set, content: str, title: str,
+                                      source_credibility: float) -> Optional[Dict[str, Any]]:
+        """
+        继承事件代表文章的情绪结论，并按本文的本地词典评分微调情绪得分
+        要点、风险、建议和个股影响针对具体文章和标的，由本文的本地分析生成，不从代表文章复制。
+        等待超时、代表分析失败、与代表文章没有共同股票或本文情绪方向与代表结论相反时返回None，由调用方单独分析
+        """
+        try:
+            # shield：超时只放弃等待，不取消其他成员共享的future
+            representative = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.story_wait)
+        except asyncio.TimeoutError:
+            return None
+        if not representative or entities.isdisjoint(story.representative_entities):
+            return None
+        
+        # 需要升级到大模型的文章本地结论都是模糊的，按命中词条的得分方向判断是否与代表结论相反
+        local_result = local_sentiment_analyzer.analyze(content, title, source_credibility)
+        direction = local_result['sentiment_score'] - 0.5 if local_result['matched_terms'] else 0.0
+        sentiment = representative.get('sentiment', 'neutral')
+        if (sentiment == 'positive' and direction < 0) or (sentiment == 'negative' and direction > 0):
+            return None
+        
+        result = {key: value for key, value in local_result.items() if key not in ('ambiguous', 'matched_terms')}
+        result.update({
+            'sentiment': sentiment,
+            'sentiment_score': round(
+                0.8 * representative.get('sentiment_score', 0.5) + 0.2 * local_result['sentiment_score'], 3
+            ),
+            'stock_impact': {'positive': '利好', 'negative': '利空'}.get(sentiment, '影响待评估'),
+            'ai_provider': representative.get('ai_provider'),
+            'local_analysis': False,
+            'analysis_timestamp': datetime.now().isoformat()
+        })
+        return result
+    
+    def _tag_story(self, result: Dict[str, Any], story: Optional[StoryCluster], inherited: bool = False) -> Dict[str, Any]:
+        """在分析结果中标记所属事件"""
+        if story is None:
+            return result
+        result['story_id'] = story.id
+        result['story_size'] = story.size
+        if inherited:
+            result['story_inherited'] = True
+        story_clusterer.record_sentiment(story, result.get('sentiment', 'neutral'), inherited)
+        return result
+    
+    def _build_analysis_prompt(self, content: str, title: str = "") -> str:
+        """构建分析提示"""
+        # 限制内容长度，优化API调用成本
+        truncated_content = content[:4000]
+        
+        # 字段顺序固定为情绪、风险、建议、要点、影响，便于流式输出时尽早得到情绪
+        return f"""
 请分析以下股票新闻文章，提供专业的投资分析：
 
 标题：{title}
@@ -290,50 +797,266 @@ class AIServiceManager:
 4. 关键信息提取
 5. 对相关股票的影响分析
 
-请以JSON格式返回分析结果。
+请以JSON格式返回分析结果，字段按以下顺序输出：
+sentiment（positive/negative/neutral）、risk_level（low/medium/high）、investment_advice、key_points（字符串数组）、stock_impact。
 """
-            
-            response = await self.make_request(self.current_provider, analysis_prompt, 1000)
-            
-            if response:
-                return self._parse_analysis_response(response, source_credibility)
+    
+    async def analyze_content_stream(self, content: str, title: str = "", source_credibility: float = 0.8) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式分析文章内容
+        依次产出事件：token（模型增量文本）、field（已完整的结构化字段）、result（最终分析结果）
+        """
+        await self.ensure_initialized()
+        
+        routable = self.get_routable_providers()
+        provider_key = routable[0] if routable else None
+        if not provider_key:
+            result = self._get_fallback_analysis(content, title, source_credibility)
+        elif self.local_fast_path:
+            result = local_sentiment_analyzer.analyze(content, title, source_credibility)
+            if result['ambiguous']:
+                self.local_stats['escalated'] += 1
+                result = None
             else:
-                return self._get_fallback_analysis(content, title, source_credibility)
-                
+                self.local_stats['local_resolved'] += 1
+        else:
+            result = None
+        
+        if result is None:
+            budget_reason = usage_tracker.check_budget(provider=provider_key)
+            if budget_reason:
+                result = self._get_budget_limited_analysis(content, title, source_credibility, budget_reason)
+        
+        # 半开状态的提供商只放行一个探测请求，未获放行时降级处理
+        admission = self.router.health[provider_key].allow_request() if result is None else None
+        if result is None and admission is None:
+            result = self._get_fallback_analysis(content, title, source_credibility)
+        
+        # 无需调用大模型时，直接按顺序输出字段和结果
+        if result is not None:
+            for name in PartialFieldExtractor().fields:
+                yield {'event': 'field', 'data': {'name': name, 'value': result.get(name)}}
+            yield {'event': 'result', 'data': result}
+            return
+        
+        yield {'event': 'meta', 'data': {'provider': self.providers[provider_key]['name']}}
+        
+        extractor = PartialFieldExtractor()
+        try:
+            prompt = self._build_analysis_prompt(content, title)
+            async for token in self.stream_request(provider_key, prompt, 1000, admission=admission):
+                yield {'event': 'token', 'data': {'text': token}}
+                for field in extractor.feed(token):
+                    yield {'event': 'field', 'data': field}
+            
+            result = self._parse_analysis_response(extractor.buffer, source_credibility, provider_key) if extractor.buffer else None
+            if result is None:
+                if extractor.buffer:
+                    analysis_parser.record('failed')
+                result = self._get_fallback_analysis(content, title, source_credibility)
         except Exception as error:
-            logger.error(f"AI分析失败: {str(error)}")
-            return self._get_fallback_analysis(content, title, source_credibility)
+            logger.error(f"AI流式分析失败: {str(error)}")
+            yield {'event': 'error', 'data': {'message': self.extract_error_message(error)}}
+            result = self._get_fallback_analysis(content, title, source_credibility)
+        
+        yield {'event': 'result', 'data': result}
+    
+    async def stream_request(self, provider_key: str, prompt: str, max_tokens: int = 1000,
+                             admission: Optional[object] = None) -> AsyncIterator[str]:
+        """
+        向AI服务提供商发送流式请求，逐段产出模型输出文本
+        整个流式响应期间占用提供商的一个自适应并发名额，结束时按结果（成功、限流、失败）调整并发上限
+        admission为allow_request()取得的放行凭证，流被关闭时归还
+        """
+        provider = self.providers[provider_key]
+        handler = self.stream_handlers.get(provider['type'])
+        if handler is None:
+            return
+        
+        health = self.router.health[provider_key]
+        limiter = self.limiters[provider_key] if self.adaptive_concurrency else None
+        try:
+            started_at = await limiter.acquire() if limiter else None
+        except asyncio.CancelledError:
+            health.release(admission)
+            raise
+        
+        start_time = time.monotonic()
+        completion = []
+        try:
+            async for token in handler(provider, prompt, max_tokens):
+                completion.append(token)
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开导致流被关闭时不计入成败统计
+            health.release(admission)
+            if limiter:
+                limiter.release(started_at, OUTCOME_ERROR)
+            raise
+        except Exception as error:
+            health.record_failure(time.monotonic() - start_time)
+            provider['last_error'] = self.extract_error_message(error)
+            provider['available'] = health.is_routable()
+            if limiter:
+                self._release_failed(limiter, started_at, error)
+            raise
+        
+        latency = time.monotonic() - start_time
+        if limiter:
+            limiter.release(started_at, OUTCOME_SUCCESS, latency=latency)
+        health.record_success(latency)
+        provider['available'] = True
+        provider['last_error'] = None
+        usage_tracker.record_response(provider_key, prompt, ''.join(completion))
+    
+    async def _stream_hunyuan_request(self, provider: Dict, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        """腾讯混元流式API请求"""
+        timestamp = int(time.time())
+        signature = self._generate_hunyuan_signature(provider['api_key'], timestamp)
+        
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'Authorization': f'{provider["secret_id"]}',
+            'X-TC-Timestamp': str(timestamp),
+            'X-TC-Signature': signature
+        }
+        
+        payload = {
+            'prompt': prompt,
+            'max_tokens': max_tokens,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'stream': True
+        }
+        
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    f"{provider['base_url']}/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=60, sock_read=30)
+                ) as response:
+                    if response.status != 200:
+                        raise await self._build_provider_error(response)
+                    
+                    async for delta in self._iter_stream_deltas(response):
+                        yield delta
+                            
+        except aiohttp.ClientError as error:
+            logger.error(f"腾讯混元流式请求网络错误: {str(error)}")
+            raise Exception(f"网络连接错误: {str(error)}")
+    
+    async def _stream_openai_compatible_request(self, provider: Dict, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        """OpenAI兼容接口流式请求"""
+        payload = {
+            'model': provider['model'],
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': max_tokens,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'stream': True
+        }
+        
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    f"{provider['base_url']}/chat/completions",
+                    headers={**self._openai_compatible_headers(provider), 'Accept': 'text/event-stream'},
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=60, sock_read=30)
+                ) as response:
+                    if response.status != 200:
+                        raise await self._build_provider_error(response)
+                    
+                    async for delta in self._iter_stream_deltas(response):
+                        yield delta
+                            
+        except aiohttp.ClientError as error:
+            logger.error(f"{provider['name']}流式请求网络错误: {str(error)}")
+            raise Exception(f"网络连接错误: {str(error)}")
+    
+    async def _iter_stream_deltas(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """解析SSE流式响应中的增量文本"""
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            delta = chunk.get('choices', [{}])[0].get('delta', {}).get('content')
+            if delta:
+                yield delta
     
-    def _parse_analysis_response(self, response: str, source_credibility: float) -> Dict[str, Any]:
-        """解析AI分析响应"""
-        # 这里应该根据实际的AI响应格式进行解析
-        # 简化处理，返回基础分析结果
+    def _parse_analysis_response(self, response: str, source_credibility: float, provider_key: str = None,
+                                 record_outcome: bool = True) -> Optional[Dict[str, Any]]:
+        """解析AI分析响应，无法解析或修复时返回None"""
+        try:
+            parsed, outcome = analysis_parser.parse(response)
+        except AnalysisParseError as error:
+            logger.warning(f"AI分析结果解析失败: {str(error)}")
+            return None
+        
+        if record_outcome:
+            analysis_parser.record(outcome)
         return {
-            'sentiment': 'neutral',
-            'sentiment_score': 0.5,
-            'risk_level': 'medium',
-            'investment_advice': 'hold',
-            'key_points': ['基础分析模式'],
-            'stock_impact': '中性影响',
-            'confidence': 0.6 * source_credibility,
+            **parsed,
+            'confidence': round(0.6 * source_credibility, 3),
             'analysis_timestamp': datetime.now().isoformat(),
-            'ai_provider': self.providers[self.current_provider]['name']
+            'ai_provider': self.providers[provider_key or self.current_provider]['name'],
+            'parse_outcome': outcome
         }
     
+    async def _reask_analysis(self, previous_response: str, source_credibility: float) -> Optional[Dict[str, Any]]:
+        """要求模型将上一次的输出改写为合法JSON"""
+        reask_prompt = f"""
+以下内容应为股票新闻分析的JSON对象，但格式无效：
+
+{previous_response[:2000]}
+
+请只输出一个合法的JSON对象，不要包含任何其他文字，字段为：
+sentiment（positive/negative/neutral）、risk_level（low/medium/high）、investment_advice、key_points（字符串数组）、stock_impact。
+"""
+        try:
+            response, provider_key = await self.route_request(reask_prompt, 500)
+        except Exception as error:
+            logger.error(f"AI分析结果重新请求失败: {str(error)}")
+            response = None
+        
+        result = self._parse_analysis_response(
+            response, source_credibility, provider_key, record_outcome=False
+        ) if response else None
+        if result is None:
+            analysis_parser.record('failed')
+            return None
+        
+        # 重新请求后成功解析的结果单独计数
+        analysis_parser.record('reasked')
+        result['parse_outcome'] = 'reasked'
+        return result
+    
+    def _get_budget_limited_analysis(self, content: str, title: str, source_credibility: float, reason: str) -> Dict[str, Any]:
+        """预算用尽时的本地分析结果"""
+        logger.warning(f"💰 {reason}，降级为本地分析")
+        result = local_sentiment_analyzer.analyze(content, title, source_credibility)
+        result.update({'budget_limited': True, 'budget_reason': reason})
+        return result
+    
     def _get_fallback_analysis(self, content: str, title: str = "", source_credibility: float = 0.8) -> Dict[str, Any]:
-        """基础分析模式（降级处理）"""
-        return {
-            'sentiment': 'neutral',
-            'sentiment_score': 0.5,
-            'risk_level': 'medium',
-            'investment_advice': '观望',
-            'key_points': ['使用基础分析模式'],
-            'stock_impact': '影响待评估',
-            'confidence': 0.5 * source_credibility,
-            'analysis_timestamp': datetime.now().isoformat(),
+        """基础分析模式（降级处理），使用本地词典评分"""
+        result = local_sentiment_analyzer.analyze(content, title, source_credibility)
+        result.update({
+            'confidence': round(0.5 * source_credibility, 3),
             'ai_provider': '基础分析模式',
             'fallback_mode': True
-        }
+        })
+        return result
 
 # 创建全局AI服务实例
 ai_service = AIServiceManager()
\ No newline at end of file
@@ -0,0 +1,732 @@
+import os
+import re
+import ast
+import json
+import math
+import time
+import logging
+import operator
+import threading
+from queue import Queue, Full
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES_DB_FILE = 'alert_rules.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    expression TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alert_rules_user ON alert_rules (user_id);
+CREATE TABLE IF NOT EXISTS alert_rules_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO alert_rules_version (id, version) VALUES (1, 0);
+"""
+
+PRIORITIES = {'low', 'normal', 'medium', 'high', 'urgent'}
+_PRIORITY_RANK = {'low': 0, 'normal': 1, 'medium': 1, 'high': 2, 'urgent': 3}
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_RULES_PER_USER = 100
+# matches 的正则长度上限，以及求值时只在字段的前多少个字符中查找
+MAX_PATTERN_LENGTH = 200
+MAX_MATCH_TEXT_LENGTH = 5000
+
+# 分析结果中的风险等级与工作流jq规则中的中文取值对应
+_RISK_LABELS = {'high': '高风险', 'medium': '中风险', 'low': '低风险'}
+
+# 发送函数：(user_id, message, priority, channels) -> 发送结果
+Sink = Callable[[str, str, str, Optional[List[str]]], Dict[str, Any]]
+
+
+class RuleSyntaxError(ValueError):
+    """规则表达式无法解析"""
+
+
+# ---------- 表达式解析 ----------
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|&&|\|\||[<>!()\[\],.])
+      | (?P<name>[^\W\d]\w*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in', 'contains', 'matches', 'true', 'false', 'null'}
+_COMPARISONS = {'==', '!=', '<', '<=', '>', '>=', 'in', 'contains', 'matches'}
+# 常量在左侧时交换操作数，使 "high" == risk_level 与 risk_level == "high" 成为同一个谓词
+_MIRRORED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+
+def _tokenize(expression: str) -> List[Tuple[str, Any]]:
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            raise RuleSyntaxError(f'无法识别的字符: {expression[position:position + 10]!r}')
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'number':
+            if not math.isfinite(float(text)):
+                raise RuleSyntaxError(f'数值超出范围: {text[:20]}')
+            tokens.append(('const', float(text)))
+        elif kind == 'string':
+            tokens.append(('const', ast.literal_eval(text)))
+        elif kind == 'name' and text.lower() in _KEYWORDS:
+            word = text.lower()
+            if word in ('true', 'false', 'null'):
+                tokens.append(('const', {'true': True, 'false': False, 'null': None}[word]))
+            else:
+                tokens.append(('op', word))
+        elif kind == 'op':
+            tokens.append(('op', {'&&': 'and', '||': 'or', '!': 'not'}.get(text, text)))
+        else:
+            tokens.append((kind, text))
+    return tokens
+
+
+class _Parser:
+    """
+    递归下降解析，生成由元组组成的语法树：
+    ('or', 子节点...)、('and', 子节点...)、('not', 子节点)、('cmp', 运算符, 左, 右)、('truthy', 字段)、
+    ('field', 路径元组)、('const', 值)
+    """
+
+    def __init__(self, tokens: List[Tuple[str, Any]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> Optional[Tuple[str, Any]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _accept(self, op: str) -> bool:
+        if self._peek() == ('op', op):
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, op: str):
+        if not self._accept(op):
+            raise RuleSyntaxError(f'缺少 {op}')
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise RuleSyntaxError('表达式不能为空')
+        node = self._or()
+        if self._peek() is not None:
+            raise RuleSyntaxError(f'多余的内容: {self._peek()[1]!r}')
+        return node
+
+    def _or(self) -> tuple:
+        nodes = [self._and()]
+        while self._accept('or'):
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ('or', *nodes)
+
+    def _and(self) -> tuple:
+        nodes = [self._not()]
+        while self._accept('and'):
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ('and', *nodes)
+
+    def _not(self) -> tuple:
+        if self._accept('not'):
+            return ('not', self._not())
+        return self._comparison()
+
+    def _comparison(self) -> tuple:
+        if self._accept('('):
+            node = self._or()
+            self._expect(')')
+            return node
+        left = self._operand()
+        token = self._peek()
+        if token is None or token[0] != 'op' or token[1] not in _COMPARISONS:
+            if left[0] != 'field':
+                raise RuleSyntaxError('常量不能单独作为条件')
+            return ('truthy', left)
+        self.position += 1
+        op = token[1]
+        right = self._operand()
+        if op == 'matches':
+            if right[0] != 'const' or not isinstance(right[1], str):
+                raise RuleSyntaxError('matches 右侧必须是正则表达式字符串')
+            _check_pattern(right[1])
+        if op in _MIRRORED and left[0] == 'const' and right[0] == 'field':
+            left, right, op = right, left, _MIRRORED[op]
+        return ('cmp', op, left, right)
+
+    def _operand(self) -> tuple:
+        token = self._peek()
+        if token is None:
+            raise RuleSyntaxError('表达式不完整')
+        self.position += 1
+        if token[0] == 'const':
+            return token
+        if token == ('op', '['):
+            values = []
+            if not self._accept(']'):
+                while True:
+                    item = self._operand()
+                    if item[0] != 'const':
+                        raise RuleSyntaxError('列表中只能包含常量')
+                    values.append(item[1])
+                    if self._accept(']'):
+                        break
+                    self._expect(',')
+            return ('const', tuple(values))
+        if token[0] == 'name':
+            path = [token[1]]
+            while self._accept('.'):
+                name = self._peek()
+                if name is None or name[0] != 'name':
+                    raise RuleSyntaxError('. 之后必须是字段名')
+                self.position += 1
+                path.append(name[1])
+            return ('field', tuple(path))
+        raise RuleSyntaxError(f'意外的符号: {token[1]!r}')
+
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def _subpatterns(op, av) -> List[Any]:
+    """正则语法树节点的子模式"""
+    if op in _REPEATS:
+        return [av[2]]
+    if op is sre_constants.SUBPATTERN:
+        return [av[3]]
+    if op is sre_constants.BRANCH:
+        return list(av[1])
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op is sre_constants.GROUPREF_EXISTS:
+        return [branch for branch in av[1:] if branch is not None]
+    if op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+        return [av]
+    return []
+
+
+def _is_ambiguous(subpattern) -> bool:
+    """子模式能否以多种方式匹配同一段文本：含有可变次数的量词或分支"""
+    for op, av in subpattern:
+        if op in _REPEATS and av[0] != av[1]:
+            return True
+        if op is sre_constants.BRANCH:
+            return True
+        if any(_is_ambiguous(child) for child in _subpatterns(op, av)):
+            return True
+    return False
+
+
+def _check_backtracking(subpattern):
+    """拒绝可能指数级回溯的结构：量词内嵌套可变量词或分支（如 (a+)+、(a|ab)*），以及反向引用"""
+    for op, av in subpattern:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            raise RuleSyntaxError('matches 正则不支持反向引用')
+        if op in _REPEATS and av[1] > 1 and _is_ambiguous(av[2]):
+            raise RuleSyntaxError('matches 正则的量词内不能再嵌套量词或分支')
+        for child in _subpatterns(op, av):
+            _check_backtracking(child)
+
+
+def _check_pattern(pattern: str):
+    """
+    校验 matches 的正则：规则对每篇新文章求值，一条回溯失控的正则会拖住所有用户的告警，
+    因此限制长度并拒绝嵌套量词等结构，求值时也只查找字段的前MAX_MATCH_TEXT_LENGTH个字符
+    """
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise RuleSyntaxError(f'matches 正则最长{MAX_PATTERN_LENGTH}个字符')
+    try:
+        re.compile(pattern)
+        tree = sre_parse.parse(pattern)
+    except re.error as error:
+        raise RuleSyntaxError(f'无效的正则表达式: {error}')
+    _check_backtracking(tree)
+
+
+def parse_expression(expression: str) -> tuple:
+    """解析规则表达式，语法错误时抛出RuleSyntaxError"""
+    if not isinstance(expression, str) or not expression.strip():
+        raise RuleSyntaxError('表达式不能为空')
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise RuleSyntaxError(f'表达式最长{MAX_EXPRESSION_LENGTH}个字符')
+    return _Parser(_tokenize(expression)).parse()
+
+
+# ---------- 编译 ----------
+
+_ORDERING = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+_NUMBERS = frozenset({int, float, bool})
+_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+def _lookup(context: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    value = context
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _ordered(op: str, left: Any, right: Any) -> bool:
+    """字段缺失或类型不可比较时为False"""
+    if left is None or right is None:
+        return False
+    try:
+        return _ORDERING[op](left, right)
+    except TypeError:
+        return False
+
+
+def _contains(container: Any, item: Any) -> bool:
+    """容器可以是列表或字符串"""
+    if item is None or not isinstance(container, (list, tuple, str)):
+        return False
+    try:
+        return item in container
+    except TypeError:
+        return False
+
+
+class PredicateTable:
+    """
+    共享谓词表
+    所有规则中相同的字段和比较条件（语法树相同）只登记一次，全部规则一起生成一个Python函数并编译为字节码：
+    函数先把用到的字段读到局部变量，每个谓词计算一次存入局部变量，每条规则是一个只引用局部变量的if语句。
+    表达式中的常量以repr写入源码，正则表达式和集合通过常量表传入，不执行任何用户提供的代码。
+    """
+
+    def __init__(self):
+        self._fields: Dict[Tuple[str, ...], int] = {}
+        self._predicates: Dict[tuple, int] = {}
+        self._lines: List[str] = []
+        self._constants: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._predicates)
+
+    def _field(self, path: Tuple[str, ...]) -> str:
+        index = self._fields.get(path)
+        if index is None:
+            index = self._fields[path] = len(self._fields)
+        return f'f{index}'
+
+    def _constant(self, value: Any) -> str:
+        self._constants.append(value)
+        return f'C[{len(self._constants) - 1}]'
+
+    def _operand(self, node: tuple) -> str:
+        return repr(node[1]) if node[0] == 'const' else self._field(node[1])
+
+    def _predicate_source(self, node: tuple) -> str:
+        """单个谓词的求值表达式，字段缺失或类型不可比较时为False"""
+        if node[0] == 'truthy':
+            return f'bool({self._field(node[1][1])})'
+        _, op, left_node, right_node = node
+        left, right = self._operand(left_node), self._operand(right_node)
+        if op in ('==', '!='):
+            return f'{left} {op} {right}'
+        if op == 'matches':
+            pattern = self._constant(re.compile(right_node[1]))
+            text = f'({left} if {left}.__class__ is str else str({left}))'
+            return f'({left} is not None and {pattern}.search({text}[:MATCH_LIMIT]) is not None)'
+        if op in _ORDERING:
+            if left_node[0] == 'field' and right_node[0] == 'const':
+                if type(right_node[1]) in _NUMBERS:
+                    return f'({left}.__class__ in NUMBERS and {left} {op} {right})'
+                if isinstance(right_node[1], str):
+                    return f'({left}.__class__ is str and {left} {op} {right})'
+            return f'ordered({op!r}, {left}, {right})'
+        if op == 'in' and right_node[0] == 'const' and isinstance(right_node[1], tuple):
+            members = self._constant(frozenset(right_node[1]))
+            return f'({left}.__class__ in SCALARS and {left} in {members})'
+        if op == 'contains':
+            return f'contains({left}, {right})'
+        return f'contains({right}, {left})'
+
+    def _condition(self, node: tuple) -> str:
+        """规则语法树转为只引用谓词局部变量的布尔表达式"""
+        kind = node[0]
+        if kind in ('and', 'or'):
+            return '(' + f' {kind} '.join(self._condition(child) for child in node[1:]) + ')'
+        if kind == 'not':
+            return f'(not {self._condition(node[1])})'
+        index = self._predicates.get(node)
+        if index is None:
+            index = self._predicates[node] = len(self._predicates)
+            self._lines.append(f'    p{index} = {self._predicate_source(node)}')
+        return f'p{index}'
+
+    def build(self, nodes: List[tuple]) -> Callable[[Dict[str, Any]], List[int]]:
+        """编译全部规则，返回函数：上下文 -> 命中的规则序号列表"""
+        rules = [f'    if {self._condition(node)}: hit({index})' for index, node in enumerate(nodes)]
+        fields = []
+        for path, index in self._fields.items():
+            if len(path) == 1:
+                fields.append(f'    f{index} = get({path[0]!r})')
+            else:
+                fields.append(f'    f{index} = lookup(context, {path!r})')
+        source = '\n'.join([
+            'def evaluate(context):',
+            '    get = context.get',
+            '    hits = []',
+            '    hit = hits.append',
+            *fields,
+            *self._lines,
+            *rules,
+            '    return hits'
+        ])
+        namespace = {
+            'C': self._constants, 'NUMBERS': _NUMBERS, 'SCALARS': _SCALARS, 'MATCH_LIMIT': MAX_MATCH_TEXT_LENGTH,
+            'lookup': _lookup, 'ordered': _ordered, 'contains': _contains
+        }
+        exec(compile(source, '<alert_rules>', 'exec'), namespace)
+        return namespace['evaluate']
+
+
+def build_context(article: Dict[str, Any], analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    规则求值的上下文：文章字段和分析结果字段合并在顶层（同名时以分析结果为准），
+    另提供情绪强度（0~10）和中文风险等级，与工作流中的jq规则字段名兼容
+    """
+    context = {**article, **analysis}
+    source = article.get('source')
+    if isinstance(source, dict):
+        context['source'] = source.get('name')
+    context['tickers'] = article.get('tickers') or analysis.get('tickers') or []
+    score = analysis.get('sentiment_score')
+    if isinstance(score, (int, float)):
+        context.setdefault('sentiment_strength', round(abs(score - 0.5) * 20, 1))
+    context.setdefault('sentimentStrength', context.get('sentiment_strength'))
+    context.setdefault('riskLevel', _RISK_LABELS.get(analysis.get('risk_level'), analysis.get('risk_level')))
+    return context
+
+
+class AlertRuleEngine:
+    """
+    告警规则引擎
+    用户用表达式定义告警规则（如 sentiment_strength >= 7 or risk_level == "high"），规则保存在SQLite中；
+    加载时解析全部规则，经共享谓词表生成一个函数并编译为字节码，相同的条件只求值一次，
+    表达式相同的规则（如多个用户订阅同一条件）只求值一次。
+    每篇新分析的文章求值全部规则，命中的规则按用户合并后发送通知；
+    求值和发送在引擎自己的后台线程中进行（submit），不占用分析结果写入钩子的时间，队列满时丢弃并计数。
+    规则变更时递增数据库中的版本号，各进程在下次求值时发现版本变化并重新编译。
+    """
+
+    def __init__(self, db_file: str = ALERT_RULES_DB_FILE, reload_interval: float = 1.0, queue_size: int = None):
+        self.db_file = db_file
+        # 其他进程修改规则后，本进程最多在这段时间后发现（本进程的修改立即生效）
+        self.reload_interval = reload_interval
+        self.sink: Optional[Sink] = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        # 语法树相同的规则归为一组，每组只求值一次；编译后的函数返回命中的组序号
+        self._groups: List[List[Dict[str, Any]]] = []
+        self._evaluate: Callable[[Dict[str, Any]], List[int]] = lambda context: []
+        self._rule_count = 0
+        self._predicate_count = 0
+        self.stats = {'articles': 0, 'matched': 0, 'notified_users': 0, 'dropped': 0,
+                      'total_eval_ms': 0.0, 'max_eval_ms': 0.0}
+        self._lock = threading.Lock()
+
+        # 待求值的文章队列，由后台线程消费（首次提交时启动）
+        queue_size = queue_size if queue_size is not None else int(os.getenv('ALERT_RULES_QUEUE_SIZE', 1000))
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def set_sink(self, sink: Sink):
+        """注册通知发送函数（由通知路由模块注册）"""
+        self.sink = sink
+
+    @staticmethod
+    def _to_rule(row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'name': row['name'],
+            'expression': row['expression'],
+            'priority': row['priority'],
+            'channels': json.loads(row['channels']),
+            'enabled': bool(row['enabled']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    @staticmethod
+    def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+        """校验规则字段，表达式不合法时抛出RuleSyntaxError"""
+        expression = data.get('expression')
+        parse_expression(expression)
+        channels = data.get('channels') or []
+        if not isinstance(channels, list):
+            raise ValueError('channels必须为数组')
+        priority = data.get('priority') or 'high'
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority只能为 {', '.join(sorted(PRIORITIES))}")
+        return {
+            'name': str(data.get('name') or expression.strip()[:50]),
+            'expression': expression.strip(),
+            'priority': priority,
+            'channels': [str(channel) for channel in channels],
+            'enabled': bool(data.get('enabled', True))
+        }
+
+    def _refresh(self):
+        """版本号变化时重新加载并编译全部启用的规则（调用方需持有锁）"""
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        conn = self._connect()
+        try:
+            version = conn.execute('SELECT version FROM alert_rules_version WHERE id = 1').fetchone()['version']
+            if version == self._version:
+                return
+            rows = conn.execute('SELECT * FROM alert_rules WHERE enabled = 1 ORDER BY id').fetchall()
+        finally:
+            conn.close()
+        started = time.perf_counter()
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        count = 0
+        for row in rows:
+            rule = self._to_rule(row)
+            try:
+                node = parse_expression(rule['expression'])
+            except RuleSyntaxError as error:
+                logger.warning(f"⚠️ 告警规则{rule['id']}无法编译: {str(error)}")
+                continue
+            groups.setdefault(node, []).append(rule)
+            count += 1
+        table = PredicateTable()
+        self._evaluate = table.build(list(groups))
+        self._groups, self._rule_count, self._predicate_count, self._version = list(groups.values()), count, len(table), version
+        logger.info(f"🧮 告警规则已编译: {count}条规则, {len(groups)}个不同表达式, {len(table)}个共享谓词, "
+                    f"耗时{(time.perf_counter() - started) * 1000:.1f}ms")
+
+    # ---------- 增删改查 ----------
+
+    def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        fields = self._normalize(data)
+        now = time.time()
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                count = conn.execute('SELECT COUNT(*) AS count FROM alert_rules WHERE user_id = ?',
+                                     (user_id,)).fetchone()['count']
+                if count >= MAX_RULES_PER_USER:
+                    raise ValueError(f'每个用户最多{MAX_RULES_PER_USER}条规则')
+                cursor = conn.execute(
+                    """INSERT INTO alert_rules (user_id, name, expression, priority, channels, enabled, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (user_id, fields['name'], fields['expression'], fields['priority'],
+                     json.dumps(fields['channels'], ensure_ascii=False), int(fields['enabled']), now, now)
+                )
+                conn.execute('UPDATE alert_rules_version SET version = version + 1 WHERE id = 1')
+        finally:
+            conn.close()
+        self._checked_at = 0.0
+        return {'id': cursor.lastrowid, 'user_id': user_id, **fields, 'created_at': now, 'updated_at': now}
+
+    def get(self, rule_id: int) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM alert_rules WHERE id = ?', (rule_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_rule(row) if row is not None else None
+
+    def list_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM alert_rules WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+        finally:
+            conn.close()
+        return [self._to_rule(row) for row in rows]
+
+    def update(self, rule_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按给出的字段更新规则（未给出的字段保持不变），规则不存在时返回None"""
+        current = self.get(rule_id)
+        if current is None:
+            return None
+        fields = self._normalize({**current, **data})
+        now = time.time()
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                updated = conn.execute(
+                    """UPDATE alert_rules SET name = ?, expression = ?, priority = ?, channels = ?, enabled = ?,
+                       updated_at = ? WHERE id = ?""",
+                    (fields['name'], fields['expression'], fields['priority'],
+                     json.dumps(fields['channels'], ensure_ascii=False), int(fields['enabled']), now, rule_id)
+                ).rowcount
+                if not updated:
+                    return None
+                conn.execute('UPDATE alert_rules_version SET version = version + 1 WHERE id = 1')
+        finally:
+            conn.close()
+        self._checked_at = 0.0
+        return {**current, **fields, 'updated_at': now}
+
+    def delete(self, rule_id: int) -> bool:
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                deleted = conn.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,)).rowcount
+                if deleted:
+                    conn.execute('UPDATE alert_rules_version SET version = version + 1 WHERE id = 1')
+        finally:
+            conn.close()
+        self._checked_at = 0.0
+        return bool(deleted)
+
+    # ---------- 求值 ----------
+
+    def evaluate(self, article: Dict[str, Any], analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """对一篇文章求值全部规则，返回命中的规则"""
+        with self._lock:
+            self._refresh()
+            groups, evaluate = self._groups, self._evaluate
+        context = build_context(article, analysis)
+        started = time.perf_counter()
+        matched = []
+        try:
+            hits = evaluate(context)
+        except Exception as error:
+            logger.error(f"告警规则求值失败: {str(error)}")
+            hits = []
+        for index in hits:
+            matched.extend(groups[index])
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats['articles'] += 1
+            self.stats['matched'] += len(matched)
+            self.stats['total_eval_ms'] += elapsed
+            self.stats['max_eval_ms'] = max(self.stats['max_eval_ms'], elapsed)
+        return matched
+
+    @staticmethod
+    def format_message(article: Dict[str, Any], analysis: Dict[str, Any], rules: List[Dict[str, Any]]) -> str:
+        lines = [f"🚨 {'、'.join(rule['name'] for rule in rules[:3])}：{article.get('title') or '新文章'}"]
+        sentiment = analysis.get('sentiment')
+        if sentiment:
+            score = analysis.get('sentiment_score')
+            lines.append(f"情绪：{sentiment}{f' ({score:.2f})' if isinstance(score, (int, float)) else ''}")
+        if analysis.get('risk_level'):
+            lines.append(f"风险等级：{_RISK_LABELS.get(analysis['risk_level'], analysis['risk_level'])}")
+        if analysis.get('summary'):
+            lines.append(str(analysis['summary']))
+        return '\n'.join(lines)
+
+    def dispatch(self, article: Dict[str, Any], analysis: Dict[str, Any]) -> int:
+        """为新分析的文章发送命中规则的告警，同一用户只发一条，返回通知的用户数"""
+        matched = self.evaluate(article, analysis)
+        if not matched:
+            return 0
+        if self.sink is None:
+            logger.warning(f"⚠️ 未注册通知发送函数，跳过{len(matched)}条命中的告警规则")
+            return 0
+
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for rule in matched:
+            by_user.setdefault(rule['user_id'], []).append(rule)
+        notified = 0
+        for user_id, rules in by_user.items():
+            priority = max((rule['priority'] for rule in rules), key=lambda value: _PRIORITY_RANK.get(value, 1))
+            # 任一规则未限定渠道时使用用户启用的全部渠道
+            channels: Optional[List[str]] = []
+            for rule in rules:
+                if not rule['channels']:
+                    channels = None
+                    break
+                channels.extend(channel for channel in rule['channels'] if channel not in channels)
+            try:
+                self.sink(user_id, self.format_message(article, analysis, rules), priority, channels)
+                notified += 1
+            except Exception as error:
+                logger.error(f"发送规则告警失败 ({user_id}): {str(error)}")
+        with self._lock:
+            self.stats['notified_users'] += notified
+        logger.info(f"🚨 文章命中{len(matched)}条告警规则，已通知{notified}个用户")
+        return notified
+
+    def _run(self):
+        while True:
+            article, analysis = self._queue.get()
+            try:
+                self.dispatch(article, analysis)
+            except Exception as error:
+                logger.error(f"告警规则处理失败: {str(error)}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, article: Dict[str, Any], analysis: Dict[str, Any]) -> bool:
+        """把新分析的文章交给后台线程求值并发送告警，立即返回；队列已满时丢弃并返回False"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-rules', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((article, analysis))
+            return True
+        except Full:
+            with self._lock:
+                self.stats['dropped'] += 1
+            logger.warning("⚠️ 告警规则队列已满，跳过本篇文章")
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            articles = self.stats['articles']
+            return {
+                'rules': self._rule_count,
+                'distinct_expressions': len(self._groups),
+                'shared_predicates': self._predicate_count,
+                'articles': articles,
+                'matched': self.stats['matched'],
+                'notified_users': self.stats['notified_users'],
+                'queued': self._queue.qsize(),
+                'dropped': self.stats['dropped'],
+                'avg_eval_ms': round(self.stats['total_eval_ms'] / articles, 3) if articles else None,
+                'max_eval_ms': round(self.stats['max_eval_ms'], 3)
+            }
+
+
+# 创建全局告警规则引擎实例
+alert_rule_engine = AlertRuleEngine()
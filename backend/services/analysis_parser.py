@@ -0,0 +1,329 @@
+import re
+import json
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisParseError(ValueError):
+    """模型输出无法解析为有效的分析结果"""
+
+
+# 字段名别名（模型可能输出中文字段名）
+FIELD_ALIASES = {
+    'sentiment': ['sentiment', '情绪', '情绪分析', '市场情绪', '情感'],
+    'sentiment_score': ['sentiment_score', 'score', '情绪得分', '情绪分数', '得分'],
+    'risk_level': ['risk_level', 'risk', '风险', '风险等级', '风险评估', '风险等级评估'],
+    'investment_advice': ['investment_advice', 'advice', 'recommendation', '投资建议', '建议', '操作建议'],
+    'key_points': ['key_points', 'keypoints', 'key_info', '关键信息', '关键点', '要点', '关键信息提取'],
+    'stock_impact': ['stock_impact', 'impact', '影响', '股票影响', '对相关股票的影响', '对相关股票的影响分析', '影响分析'],
+}
+
+# 枚举字段取值的同义词
+ENUM_SYNONYMS = {
+    'sentiment': {
+        'positive': ['positive', 'bullish', '积极', '正面', '利好', '看涨', '乐观'],
+        'negative': ['negative', 'bearish', '消极', '负面', '利空', '看跌', '悲观'],
+        'neutral': ['neutral', 'mixed', '中性', '中立', '平稳', '持平'],
+    },
+    'risk_level': {
+        'low': ['low', '低', '低风险', '较低'],
+        'medium': ['medium', 'moderate', '中', '中等', '中风险', '中等风险', '适中'],
+        'high': ['high', '高', '高风险', '较高'],
+    },
+    'investment_advice': {
+        '买入': ['买入', 'buy', '增持', '加仓', 'strong buy'],
+        '持有': ['持有', 'hold', '继续持有'],
+        '卖出': ['卖出', 'sell', '减持', '减仓'],
+        '观望': ['观望', 'watch', 'wait', '等待', '谨慎观望'],
+    },
+}
+
+_DEFAULT_SCORES = {'positive': 0.75, 'negative': 0.25, 'neutral': 0.5}
+
+# 嵌套对象中可能存放取值的字段
+_NESTED_VALUE_KEYS = ['value', 'label', 'level', 'result', '结果', '等级', '结论', '评级']
+
+
+def _flatten_value(value: Any) -> Any:
+    """模型有时输出 {"结果": "积极", "理由": ...}，取出其中的主值"""
+    if isinstance(value, dict):
+        for key in _NESTED_VALUE_KEYS:
+            if key in value:
+                return value[key]
+        for item in value.values():
+            if isinstance(item, (str, int, float)):
+                return item
+    return value
+
+
+class AnalysisSchema:
+    """
+    分析结果模式
+    字段别名和枚举同义词在构造时编译为查找表，校验时每个字段只做常数次字典查询
+    """
+
+    def __init__(self):
+        self._key_lookup = {
+            alias.lower(): field for field, aliases in FIELD_ALIASES.items() for alias in aliases
+        }
+        self._enum_lookup = {
+            field: {synonym.lower(): canonical for canonical, synonyms in values.items() for synonym in synonyms}
+            for field, values in ENUM_SYNONYMS.items()
+        }
+        self._normalizers: Dict[str, Callable[[Any], Any]] = {
+            'sentiment': lambda value: self._normalize_enum('sentiment', value),
+            'risk_level': lambda value: self._normalize_enum('risk_level', value),
+            'investment_advice': lambda value: self._normalize_enum('investment_advice', value),
+            'sentiment_score': self._normalize_score,
+            'key_points': self._normalize_key_points,
+            'stock_impact': self._normalize_text,
+        }
+
+    def _normalize_enum(self, field: str, value: Any) -> Optional[str]:
+        value = _flatten_value(value)
+        if not isinstance(value, str):
+            return None
+        text = value.strip().lower()
+        lookup = self._enum_lookup[field]
+        if text in lookup:
+            return lookup[text]
+        # 允许 "积极（市场情绪回暖）" 这类带说明的取值
+        for synonym, canonical in lookup.items():
+            if text.startswith(synonym):
+                return canonical
+        return None
+
+    def _normalize_score(self, value: Any) -> Optional[float]:
+        value = _flatten_value(value)
+        try:
+            score = float(value)
+        except (TypeError, ValueError):
+            return None
+        # 兼容 -1~1、0~10、0~100 等刻度
+        if -1.0 <= score < 0:
+            score = (score + 1) / 2
+        elif 1.0 < score <= 10.0:
+            score = score / 10
+        elif 10.0 < score <= 100.0:
+            score = score / 100
+        return round(min(1.0, max(0.0, score)), 3)
+
+    def _normalize_key_points(self, value: Any) -> Optional[List[str]]:
+        if isinstance(value, str):
+            value = [part for part in re.split(r'[；;\n。]', value)]
+        if isinstance(value, dict):
+            value = [f"{key}: {item}" for key, item in value.items()]
+        if not isinstance(value, list):
+            return None
+        points = [str(_flatten_value(item)).strip() for item in value]
+        return [point for point in points if point][:10]
+
+    def _normalize_text(self, value: Any) -> Optional[str]:
+        if isinstance(value, list):
+            return '；'.join(str(item) for item in value)
+        if isinstance(value, dict):
+            return '；'.join(f"{key}: {item}" for key, item in value.items())
+        return str(value).strip() if value is not None else None
+
+    def validate(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """校验并规范化分析结果，情绪字段缺失或无法识别时抛出 AnalysisParseError"""
+        if not isinstance(raw, dict):
+            raise AnalysisParseError('分析结果不是JSON对象')
+
+        fields = {}
+        for key, value in raw.items():
+            field = self._key_lookup.get(str(key).strip().lower())
+            if field and field not in fields:
+                fields[field] = value
+
+        result = {}
+        for field, normalizer in self._normalizers.items():
+            if field in fields:
+                normalized = normalizer(fields[field])
+                if normalized is not None:
+                    result[field] = normalized
+
+        if 'sentiment' not in result:
+            raise AnalysisParseError('缺少有效的情绪字段')
+
+        result.setdefault('sentiment_score', _DEFAULT_SCORES[result['sentiment']])
+        result.setdefault('risk_level', 'medium')
+        result.setdefault('investment_advice', '观望')
+        result.setdefault('key_points', [])
+        result.setdefault('stock_impact', '影响待评估')
+        return result
+
+
+_CODE_FENCE = re.compile(r'```(?:json|JSON)?\s*(.*?)```', re.S)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_UNQUOTED_KEY = re.compile(r'([{,]\s*)([A-Za-z_一-龥][\w一-龥]*)\s*:')
+_SINGLE_QUOTED = re.compile(r"'((?:[^'\\\n]|\\.)*)'")
+_LINE_COMMENT = re.compile(r'^\s*//.*$', re.M)
+_PUNCTUATION_MAP = str.maketrans({'“': '"', '”': '"', '：': ':', '，': ',', '｛': '{', '｝': '}'})
+
+
+def extract_json_candidate(text: str) -> Optional[str]:
+    """从模型输出中找出JSON对象文本（支持代码块、前后附带说明文字、输出被截断）"""
+    fenced = _CODE_FENCE.search(text)
+    if fenced and '{' in fenced.group(1):
+        text = fenced.group(1)
+
+    start = text.find('{')
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    # 未闭合（输出被截断），交给修复步骤补全
+    return text[start:]
+
+
+_SCALAR = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+
+
+def _close_truncated(text: str) -> str:
+    """
+    补全被截断的输出：截断在字符串值中间时补上引号（去掉不完整的转义序列）；
+    截断在键、冒号之后或不完整的数字/字面量处时丢弃最后一个不完整的成员，再按嵌套顺序补全括号
+    """
+    # 每层 [闭合符, 状态]，状态为 key（等待键）、colon（等待冒号）、value（等待值）、comma（值已完整）
+    stack: List[List[str]] = []
+    # 最近一个完整元素之后的位置，以及在该处截断时需要补的闭合符
+    safe_end, safe_closers = 0, ''
+    in_string = is_key = escaped = False
+    escape_start = unicode_left = 0
+    scalar_start = None
+
+    def closers() -> str:
+        return ''.join(frame[0] for frame in reversed(stack))
+
+    def value_done(end: int):
+        nonlocal safe_end, safe_closers
+        if stack:
+            stack[-1][1] = 'comma'
+        safe_end, safe_closers = end, closers()
+
+    for index, char in enumerate(text):
+        if in_string:
+            if unicode_left:
+                unicode_left -= 1
+            elif escaped:
+                escaped = False
+                if char == 'u':
+                    unicode_left = 4
+            elif char == '\\':
+                escaped, escape_start = True, index
+            elif char == '"':
+                in_string = False
+                if is_key:
+                    stack[-1][1] = 'colon'
+                else:
+                    value_done(index + 1)
+            continue
+        if scalar_start is not None:
+            if char not in ',}] \t\r\n':
+                continue
+            scalar_start = None
+            value_done(index)
+        if char == '"':
+            in_string = True
+            is_key = bool(stack) and stack[-1] == ['}', 'key']
+        elif char in '{[':
+            stack.append(['}', 'key'] if char == '{' else [']', 'value'])
+            safe_end, safe_closers = index + 1, closers()
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            value_done(index + 1)
+            if not stack:
+                return text[:index + 1]
+        elif char == ':':
+            if stack:
+                stack[-1][1] = 'value'
+        elif char == ',':
+            if stack:
+                stack[-1][1] = 'key' if stack[-1][0] == '}' else 'value'
+        elif not char.isspace():
+            scalar_start = index
+
+    if in_string and not is_key:
+        if unicode_left or escaped:
+            text = text[:escape_start]
+        return text + '"' + closers()
+    if scalar_start is not None and _SCALAR.fullmatch(text[scalar_start:]):
+        return text + closers()
+    return text[:safe_end] + safe_closers
+
+
+def repair_json(text: str) -> str:
+    """低成本修复常见的JSON缺陷"""
+    text = text.translate(_PUNCTUATION_MAP)
+    text = _LINE_COMMENT.sub('', text)
+    text = _SINGLE_QUOTED.sub(lambda match: json.dumps(match.group(1), ensure_ascii=False), text)
+    text = _UNQUOTED_KEY.sub(r'\1"\2":', text)
+    text = re.sub(r'\bTrue\b', 'true', re.sub(r'\bFalse\b', 'false', re.sub(r'\bNone\b', 'null', text)))
+    text = _close_truncated(text)
+    return _TRAILING_COMMA.sub(r'\1', text)
+
+
+class AnalysisResponseParser:
+    """
+    模型分析输出解析器
+    依次尝试直接解析、修复后解析；两者都失败时由调用方决定是否重新请求模型
+    """
+
+    OUTCOMES = ['direct', 'repaired', 'reasked', 'failed']
+
+    def __init__(self, schema: AnalysisSchema = None):
+        self.schema = schema or AnalysisSchema()
+        self.stats = {outcome: 0 for outcome in self.OUTCOMES}
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def parse(self, response: str) -> Tuple[Dict[str, Any], str]:
+        """解析模型输出，返回 (规范化结果, 'direct'/'repaired')，无法恢复时抛出 AnalysisParseError"""
+        candidate = extract_json_candidate(response or '')
+        if candidate is None:
+            raise AnalysisParseError('输出中没有JSON对象')
+
+        try:
+            return self.schema.validate(json.loads(candidate)), 'direct'
+        except ValueError:
+            pass
+
+        try:
+            return self.schema.validate(json.loads(repair_json(candidate))), 'repaired'
+        except ValueError as error:
+            raise AnalysisParseError(f'JSON修复失败: {str(error)}')
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+# 创建全局解析器实例
+analysis_parser = AnalysisResponseParser()
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from services.sentiment_rollup import sentiment_rollup_store
+from services.market_mood import market_mood
+from services.sentiment_cube import sentiment_cube
+from services.ticker_index import ticker_index
+from services.analysis_store import analysis_store
+from services.subscription_index import subscription_index
+from services.alert_rules import alert_rule_engine
+from services.ai_service import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def _source_name(source: Any) -> Optional[str]:
+    """文章来源可能是字符串，也可能是 {'name': ..., 'credibility': ...}"""
+    if isinstance(source, dict):
+        return source.get('name')
+    return source
+
+
+def _source_credibility(article: Dict[str, Any], default: float = 0.8) -> float:
+    """来源可信度：source.credibility 或爬虫结果中的 sourceCredibility"""
+    source = article.get('source')
+    if isinstance(source, dict) and isinstance(source.get('credibility'), (int, float)):
+        return float(source['credibility'])
+    if isinstance(article.get('sourceCredibility'), (int, float)):
+        return float(article['sourceCredibility'])
+    return default
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        # 只取本地时间的年月日时，忽略时区后缀
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _article_key(article: Dict[str, Any]) -> str:
+    """分析结果存储和倒排索引中的文章标识：没有ID的文章按标题和正文生成"""
+    if article.get('id') is not None:
+        return str(article['id'])
+    text = f"{article.get('title') or ''}\n{article.get('content') or ''}"
+    return 'h:' + hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def record_analysis(article: Dict[str, Any], analysis: Dict[str, Any]):
+    """
+    分析结果写入钩子
+    单篇分析、批量分析和异步任务完成分析后调用，更新各类汇总；记录失败不影响分析结果返回
+    """
+    try:
+        # 没有ID的文章（如批量爬取结果）按内容生成标识，重新分析时才能识别为同一篇
+        article_id = _article_key(article)
+        published_at = _parse_time(article.get('publish_time'))
+        analysis_store.save(article_id, PROMPT_VERSION, analysis)
+        first_seen = sentiment_rollup_store.record(
+            sentiment=analysis.get('sentiment', 'neutral'),
+            score=analysis.get('sentiment_score'),
+            source=_source_name(article.get('source')),
+            category=article.get('category'),
+            timestamp=published_at,
+            article_id=article_id
+        )
+        tickers = article.get('tickers') or analysis.get('tickers') or []
+        if tickers:
+            ticker_index.record(
+                article_id=article_id,
+                tickers=tickers,
+                sentiment=analysis.get('sentiment', 'neutral'),
+                score=analysis.get('sentiment_score'),
+                title=article.get('title'),
+                source=_source_name(article.get('source')),
+                published_at=published_at.timestamp() if published_at else None
+            )
+        # 重新分析同一篇文章时只修正汇总和股票索引，不重复计入实时情绪和立方体
+        if not first_seen:
+            return
+        market_mood.record(analysis, _source_credibility(article))
+        sentiment_cube.record(
+            sentiment=analysis.get('sentiment', 'neutral'),
+            score=analysis.get('sentiment_score'),
+            source=_source_name(article.get('source')),
+            category=article.get('category'),
+            tickers=tickers,
+            timestamp=published_at.timestamp() if published_at else None
+        )
+        # 新文章才提醒订阅用户，重新分析不重复提醒
+        subscription_index.dispatch(article, analysis)
+        # 规则求值（含用户提供的正则）在告警引擎的后台线程中进行，不阻塞写入
+        alert_rule_engine.submit(article, analysis)
+    except Exception as error:
+        logger.error(f"记录分析结果失败: {str(error)}")
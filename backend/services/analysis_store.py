@@ -0,0 +1,104 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterable
+
+from services.storage import connect
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_DB_FILE = 'analysis_results.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_results (
+    article_id TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    sentiment TEXT,
+    sentiment_score REAL,
+    analysis TEXT NOT NULL,
+    analyzed_at REAL NOT NULL,
+    PRIMARY KEY (article_id, prompt_version)
+);
+"""
+
+# SQLite单条语句的参数个数上限较低，IN查询分批进行
+_IN_BATCH = 500
+
+
+class AnalysisStore:
+    """
+    分析结果持久化
+    以（文章ID, 提示版本）为主键保存每篇文章的分析结果，同一版本重新分析时覆盖；
+    修改分析提示后旧版本的结果仍保留，读取时优先返回当前版本，没有时返回最近一次的结果。
+    新闻接口按文章ID批量读取（主键索引上的IN查询），不重新分析。
+    """
+
+    def __init__(self, db_file: str = ANALYSIS_DB_FILE):
+        self.db_file = db_file
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def save(self, article_id: str, prompt_version: str, analysis: Dict[str, Any]):
+        conn = self._connect()
+        try:
+            conn.execute(
+                """INSERT OR REPLACE INTO analysis_results
+                   (article_id, prompt_version, sentiment, sentiment_score, analysis, analyzed_at) VALUES (?, ?, ?, ?, ?, ?)""",
+                (article_id, prompt_version, analysis.get('sentiment'), analysis.get('sentiment_score'),
+                 json.dumps(analysis, ensure_ascii=False), time.time())
+            )
+        finally:
+            conn.close()
+
+    def get_latest(self, article_ids: Iterable[Any], prompt_version: str) -> Dict[str, Dict[str, Any]]:
+        """批量获取文章的最新分析结果，返回 {文章ID: 分析结果}"""
+        article_ids = list(dict.fromkeys(str(article_id) for article_id in article_ids if article_id is not None))
+        results: Dict[str, Dict[str, Any]] = {}
+        if not article_ids:
+            return results
+        conn = self._connect()
+        try:
+            for offset in range(0, len(article_ids), _IN_BATCH):
+                batch = article_ids[offset:offset + _IN_BATCH]
+                # 排序后逐行覆盖：当前版本排在最后，其次是最近的分析
+                rows = conn.execute(
+                    f"""SELECT article_id, prompt_version, analysis, analyzed_at FROM analysis_results
+                        WHERE article_id IN ({','.join('?' * len(batch))})
+                        ORDER BY prompt_version = ?, analyzed_at""",
+                    [*batch, prompt_version]
+                ).fetchall()
+                for row in rows:
+                    analysis = json.loads(row['analysis'])
+                    analysis['prompt_version'] = row['prompt_version']
+                    analysis['analyzed_at'] = datetime.fromtimestamp(row['analyzed_at']).isoformat()
+                    results[row['article_id']] = analysis
+        finally:
+            conn.close()
+        return results
+
+    def attach(self, news_list: List[Dict[str, Any]], prompt_version: str) -> List[Dict[str, Any]]:
+        """返回嵌入了最新分析结果的新闻副本；已分析的新闻以分析结果的情绪为准"""
+        analyses = self.get_latest((news.get('id') for news in news_list), prompt_version)
+        attached = []
+        for news in news_list:
+            analysis = analyses.get(str(news.get('id')))
+            if analysis is None:
+                attached.append({**news, 'analysis': None})
+            else:
+                attached.append({**news, 'analysis': analysis, 'sentiment': analysis.get('sentiment', news.get('sentiment'))})
+        return attached
+
+
+# 创建全局分析结果存储实例
+analysis_store = AnalysisStore()
@@ -0,0 +1,92 @@
+import re
+import json
+import queue
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Any, Iterator, Callable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# 流式输出中按顺序提取的结构化字段
+STREAM_FIELDS = ['sentiment', 'risk_level', 'investment_advice', 'key_points', 'stock_impact']
+
+_STRING_FIELD_PATTERN = r'"{name}"\s*:\s*"((?:[^"\\]|\\.)*)"'
+_ARRAY_FIELD_PATTERN = r'"{name}"\s*:\s*(\[(?:[^\[\]"]|"(?:[^"\\]|\\.)*")*\])'
+
+_STREAM_END = object()
+
+
+class PartialFieldExtractor:
+    """
+    增量字段提取器
+    在模型输出尚未完整时，从已到达的文本中提取已经完整的字段
+    """
+
+    def __init__(self, fields: List[str] = None):
+        self.fields = fields or STREAM_FIELDS
+        self.buffer = ''
+        self.emitted = set()
+        self._patterns = {
+            name: re.compile((_ARRAY_FIELD_PATTERN if name == 'key_points' else _STRING_FIELD_PATTERN).format(name=name))
+            for name in self.fields
+        }
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """追加文本，返回新出现的完整字段"""
+        self.buffer += text
+        new_fields = []
+        for name in self.fields:
+            if name in self.emitted:
+                continue
+            match = self._patterns[name].search(self.buffer)
+            if not match:
+                continue
+            try:
+                value = json.loads(match.group(1) if name == 'key_points' else f'"{match.group(1)}"')
+            except ValueError:
+                continue
+            self.emitted.add(name)
+            new_fields.append({'name': name, 'value': value})
+        return new_fields
+
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化为Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iterate_in_thread(agen_factory: Callable[[], AsyncIterator[Any]]) -> Iterator[Any]:
+    """
+    在独立线程的事件循环中运行异步生成器，并以同步迭代器的方式返回结果
+    Flask的异步视图在返回后即关闭事件循环，流式响应需要自己的事件循环
+    """
+    items: queue.Queue = queue.Queue()
+    stop_event = threading.Event()
+
+    async def produce():
+        try:
+            async for item in agen_factory():
+                if stop_event.is_set():
+                    break
+                items.put(item)
+        except Exception as error:
+            logger.error(f"流式分析错误: {str(error)}")
+            items.put(error)
+        finally:
+            items.put(_STREAM_END)
+
+    thread = threading.Thread(target=lambda: asyncio.run(produce()), daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # 客户端断开时通知生产者停止
+        stop_event.set()
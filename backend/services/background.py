@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """
+    后台事件循环
+    Flask的异步视图在请求结束后关闭事件循环，需要跨请求运行的任务（健康探测、后台投递等）统一在这里执行
+    """
+
+    def __init__(self, name: str = 'background-loop'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取后台事件循环，首次调用时启动线程"""
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                ready = threading.Event()
+
+                def run():
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                logger.info("🔄 后台事件循环已启动")
+            return self._loop
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """提交协程到后台事件循环执行"""
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def run_periodic(self, func: Callable[[], Awaitable[Any]], interval: float) -> concurrent.futures.Future:
+        """以固定间隔在后台重复执行协程函数"""
+        async def runner():
+            while True:
+                try:
+                    await func()
+                except Exception as error:
+                    logger.error(f"后台周期任务执行失败: {str(error)}")
+                await asyncio.sleep(interval)
+
+        return self.submit(runner())
+
+
+# 创建全局后台事件循环实例
+background_loop = BackgroundLoop()
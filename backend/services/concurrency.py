@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 请求结果分类
+OUTCOME_SUCCESS = 'success'
+OUTCOME_OVERLOAD = 'overload'
+OUTCOME_ERROR = 'error'
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD自适应并发限制器
+    延迟和错误率正常且并发已用满时加性增加上限（每轮约+1），遇到429、超时或延迟明显升高时乘性减小；
+    提供商返回Retry-After时在提示时间内暂停放行新请求。
+    Flask每个请求、每个任务工作线程都有独立的事件循环，因此用线程锁保护状态，跨循环唤醒等待者。
+    """
+
+    def __init__(self, name: str, initial_limit: float = None, min_limit: float = None, max_limit: float = None,
+                 backoff: float = None, latency_tolerance: float = None, baseline_alpha: float = 0.05,
+                 recent_alpha: float = 0.3):
+        self.name = name
+        self.min_limit = min_limit if min_limit is not None else float(os.getenv('AI_CONCURRENCY_MIN', 1))
+        self.max_limit = max_limit if max_limit is not None else float(os.getenv('AI_CONCURRENCY_MAX', 32))
+        initial = initial_limit if initial_limit is not None else float(os.getenv('AI_CONCURRENCY_INITIAL', 8))
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.backoff = backoff if backoff is not None else float(os.getenv('AI_CONCURRENCY_BACKOFF', 0.5))
+        # 延迟超过基线的倍数视为拥塞
+        self.latency_tolerance = latency_tolerance if latency_tolerance is not None else float(
+            os.getenv('AI_CONCURRENCY_LATENCY_TOLERANCE', 2.0)
+        )
+        # 基线为长期延迟均值，拥塞判断使用短期均值，避免单个长尾请求触发降速
+        self.baseline_alpha = baseline_alpha
+        self.recent_alpha = recent_alpha
+
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self.recent_latency: Optional[float] = None
+        self.blocked_until = 0.0
+        self.stats = {'increases': 0, 'decreases': 0, 'throttled': 0, 'retry_after_pauses': 0}
+
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    async def acquire(self) -> float:
+        """获取一个并发名额，返回请求开始时间（传给 release）"""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                wait_seconds = self.blocked_until - now
+                if wait_seconds <= 0 and self._has_capacity() and not self._waiters:
+                    self.in_flight += 1
+                    return now
+                if wait_seconds <= 0:
+                    loop = asyncio.get_running_loop()
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+                    self.stats['throttled'] += 1
+
+            if wait_seconds > 0:
+                await asyncio.sleep(wait_seconds)
+                continue
+
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                        granted = False
+                    except ValueError:
+                        # 已被分配名额（唤醒回调尚未执行或刚执行完），归还名额
+                        granted = True
+                if granted:
+                    self._release_slot()
+                raise
+            return time.monotonic()
+
+    def _grant(self, waiter: asyncio.Future):
+        """在等待者所在的事件循环中执行"""
+        if waiter.cancelled():
+            return
+        waiter.set_result(True)
+
+    def _wake_waiters(self):
+        """名额空出时按先到先得唤醒等待者（调用方需持有锁）"""
+        while self._waiters and self._has_capacity() and time.monotonic() >= self.blocked_until:
+            loop, waiter = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, waiter)
+            except RuntimeError:
+                # 等待者所在的事件循环已关闭
+                self.in_flight -= 1
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._wake_waiters()
+
+    def release(self, started_at: float, outcome: str, latency: float = None, retry_after: float = None):
+        """请求结束时归还名额，并根据结果调整并发上限"""
+        now = time.monotonic()
+        with self._lock:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight = max(0, self.in_flight - 1)
+
+            if outcome == OUTCOME_SUCCESS and latency is not None:
+                self.recent_latency = latency if self.recent_latency is None else (
+                    self.recent_alpha * latency + (1 - self.recent_alpha) * self.recent_latency
+                )
+                congested = self.baseline_latency is not None and \
+                    self.recent_latency > self.baseline_latency * self.latency_tolerance
+                self.baseline_latency = latency if self.baseline_latency is None else (
+                    self.baseline_alpha * latency + (1 - self.baseline_alpha) * self.baseline_latency
+                )
+                if congested:
+                    self._decrease(started_at, now, '延迟升高')
+                elif saturated and self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self.stats['increases'] += 1
+            elif outcome == OUTCOME_OVERLOAD:
+                self._decrease(started_at, now, '提供商限流或超时')
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+                    self.stats['retry_after_pauses'] += 1
+
+            self._wake_waiters()
+            blocked_for = self.blocked_until - now
+
+        if blocked_for > 0 and self._waiters:
+            # 暂停结束后唤醒等待者
+            threading.Timer(blocked_for, self._release_pause).start()
+
+    def _release_pause(self):
+        with self._lock:
+            self._wake_waiters()
+
+    def _decrease(self, started_at: float, now: float, reason: str):
+        """乘性减小上限；上次减小之前发出的请求不再重复触发（调用方需持有锁）"""
+        if started_at < self._last_decrease:
+            return
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._last_decrease = now
+        self.stats['decreases'] += 1
+        logger.warning(f"🐢 {self.name} {reason}，并发上限 {previous:.1f} -> {self.limit:.1f}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'waiting': len(self._waiters),
+                'baseline_latency_ms': round(self.baseline_latency * 1000, 1) if self.baseline_latency is not None else None,
+                'recent_latency_ms': round(self.recent_latency * 1000, 1) if self.recent_latency is not None else None,
+                'paused_seconds': round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                **self.stats
+            }
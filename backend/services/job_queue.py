@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Callable, Awaitable
+from datetime import datetime
+
+from services.storage import connect, transaction
+from services.usage_tracker import usage_tracker, usage_route
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_FILE = 'analysis_jobs.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    article TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    claimed_at REAL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, seq);
+CREATE INDEX IF NOT EXISTS idx_job_items_job ON job_items (job_id, idx);
+"""
+
+# 条目处理函数：输入文章，返回与批量分析一致的单篇结果
+ItemProcessor = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class AnalysisJobQueue:
+    """
+    持久化分析任务队列
+    任务和条目保存在SQLite中，进程重启后未完成的条目会被重新领取
+    """
+
+    def __init__(self, db_file: str = JOB_DB_FILE, lease_seconds: int = 300, max_attempts: int = 3):
+        self.db_file = db_file
+        # 条目被领取后超过租约时间仍未完成，视为工作线程已失效，可被重新领取
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def submit(self, articles: List[Dict[str, Any]]) -> str:
+        """提交批量分析任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            with transaction(conn):
+                conn.execute(
+                    'INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (job_id, 'queued', len(articles), now, now)
+                )
+                conn.executemany(
+                    'INSERT INTO job_items (job_id, idx, article) VALUES (?, ?, ?)',
+                    [(job_id, idx, json.dumps(article, ensure_ascii=False)) for idx, article in enumerate(articles)]
+                )
+        finally:
+            conn.close()
+        logger.info(f"📥 分析任务已入队: {job_id}，共{len(articles)}篇文章")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取一个待处理条目"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                row = conn.execute(
+                    """SELECT seq, job_id, idx, article, attempts FROM job_items
+                       WHERE status = 'pending' OR (status = 'running' AND claimed_at < ?)
+                       ORDER BY seq LIMIT 1""",
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE job_items SET status = 'running', worker_id = ?, claimed_at = ?, attempts = attempts + 1 WHERE seq = ?",
+                    (worker_id, now, row['seq'])
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (datetime.now().isoformat(), row['job_id'])
+                )
+            return {
+                'seq': row['seq'],
+                'job_id': row['job_id'],
+                'idx': row['idx'],
+                'article': json.loads(row['article']),
+                'attempts': row['attempts'] + 1
+            }
+        finally:
+            conn.close()
+
+    def complete(self, item: Dict[str, Any], result: Dict[str, Any]):
+        """记录条目结果并更新任务进度"""
+        success = bool(result.get('success'))
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                updated = conn.execute(
+                    "UPDATE job_items SET status = ?, result = ?, finished_at = ? WHERE seq = ? AND status = 'running'",
+                    ('done' if success else 'failed', json.dumps(result, ensure_ascii=False), now, item['seq'])
+                ).rowcount
+                if not updated:
+                    return
+                conn.execute(
+                    f"UPDATE jobs SET {'completed = completed + 1' if success else 'failed = failed + 1'}, updated_at = ? WHERE id = ?",
+                    (now, item['job_id'])
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'completed' WHERE id = ? AND completed + failed >= total",
+                    (item['job_id'],)
+                )
+        finally:
+            conn.close()
+
+    def release(self, item: Dict[str, Any], error: str):
+        """处理异常时释放条目，超过最大重试次数则记为失败"""
+        if item['attempts'] >= self.max_attempts:
+            self.complete(item, {'success': False, 'error': error, 'article_id': item['article'].get('id')})
+            return
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE job_items SET status = 'pending', worker_id = NULL WHERE seq = ?", (item['seq'],))
+        finally:
+            conn.close()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务进度"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        finished = job['completed'] + job['failed']
+        job['pending'] = job['total'] - finished
+        job['progress'] = round(finished / job['total'], 4) if job['total'] else 1.0
+        return job
+
+    def get_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """获取任务中已完成条目的结果（按文章顺序）"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """SELECT idx, status, result FROM job_items
+                   WHERE job_id = ? AND status IN ('done', 'failed')
+                   ORDER BY idx LIMIT ? OFFSET ?""",
+                (job_id, limit, offset)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'index': row['idx'], **json.loads(row['result'])} for row in rows]
+
+    def get_queue_stats(self) -> Dict[str, int]:
+        """获取队列中各状态条目数量"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM job_items GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        return {row['status']: row['count'] for row in rows}
+
+
+class AnalysisWorkerPool:
+    """
+    分析任务工作线程池
+    每个工作线程运行独立的事件循环，从持久化队列领取条目处理
+    """
+
+    def __init__(self, job_queue: AnalysisJobQueue, size: int = None, poll_interval: float = 1.0):
+        self.job_queue = job_queue
+        self.size = size if size is not None else int(os.getenv('ANALYSIS_WORKERS', 2))
+        self.poll_interval = poll_interval
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.processor: Optional[ItemProcessor] = None
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, processor: ItemProcessor):
+        """启动工作线程（重复调用不会重复启动）"""
+        with self._lock:
+            self.processor = processor
+            if self.running or self.size <= 0:
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, args=(f"worker-{os.getpid()}-{i}",), daemon=True)
+                for i in range(self.size)
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"🚀 分析任务工作线程已启动: {self.size}个")
+
+    def notify(self):
+        """有新任务时唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id: str):
+        asyncio.run(self._worker_loop(worker_id))
+
+    @staticmethod
+    async def _wait(event: threading.Event, timeout: float, step: float = 0.05):
+        """在事件循环中等待线程事件（或超时）：按短间隔检查，不阻塞循环上的其他协程"""
+        deadline = time.monotonic() + timeout
+        while not event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(step, remaining))
+
+    async def _worker_loop(self, worker_id: str):
+        usage_route.set('jobs')
+        while not self._stopping.is_set():
+            # 预算用尽且配置为排队时暂缓领取，待预算恢复（次日）后继续处理
+            if usage_tracker.exhausted_action == 'queue' and usage_tracker.check_budget():
+                await self._wait(self._stopping, self.poll_interval * 30)
+                continue
+            
+            item = self.job_queue.claim(worker_id)
+            if item is None:
+                await self._wait(self._wakeup, self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                result = await self.processor(item['article'])
+                self.job_queue.complete(item, result)
+            except Exception as error:
+                logger.error(f"分析任务条目处理失败 ({item['job_id']}#{item['idx']}): {str(error)}")
+                self.job_queue.release(item, str(error))
+
+
+# 创建全局任务队列和工作线程池实例
+analysis_job_queue = AnalysisJobQueue()
+analysis_worker_pool = AnalysisWorkerPool(analysis_job_queue)
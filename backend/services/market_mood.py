@@ -0,0 +1,168 @@
+import time
+import threading
+from typing import Dict, List, Any, Iterable
+
+# 滚动窗口（分钟）
+WINDOWS = {'15m': 15, '1h': 60, '1d': 1440}
+
+_SENTIMENT_INDEX = {'positive': 0, 'negative': 1, 'neutral': 2}
+
+# 加权极性超过该阈值才判定为整体积极/消极
+_MOOD_THRESHOLD = 0.15
+
+
+def summarize_mood(counts: List[int], weighted_sum: float, weight_sum: float) -> Dict[str, Any]:
+    """
+    根据情绪计数和可信度加权极性生成市场情绪结论（marketAnalysis）
+    极性取值 -1~1；置信度综合了主导情绪的占比和样本量
+    """
+    total = sum(counts)
+    if total == 0 or weight_sum <= 0:
+        return {
+            'overallSentiment': 'neutral',
+            'score': 0.0,
+            'confidence': 0.0,
+            'recommendation': '暂无足够的新闻样本，建议观望',
+            'articleCount': 0
+        }
+
+    score = weighted_sum / weight_sum
+    if score >= _MOOD_THRESHOLD:
+        overall = 'positive'
+    elif score <= -_MOOD_THRESHOLD:
+        overall = 'negative'
+    else:
+        overall = 'neutral'
+
+    agreement = counts[_SENTIMENT_INDEX[overall]] / total
+    confidence = round(agreement * min(1.0, total / 20), 2)
+
+    if overall == 'positive':
+        recommendation = '市场情绪偏积极，可关注业绩确定性高的优质标的' if confidence >= 0.5 else '情绪有所回暖，建议结合其他信息源验证'
+    elif overall == 'negative':
+        recommendation = '市场情绪偏谨慎，建议控制仓位、防范风险' if confidence >= 0.5 else '利空信号增多，建议观望'
+    else:
+        recommendation = '市场情绪平稳，建议观望'
+
+    return {
+        'overallSentiment': overall,
+        'score': round(score, 3),
+        'confidence': confidence,
+        'recommendation': recommendation,
+        'articleCount': total
+    }
+
+
+def polarity(analysis: Dict[str, Any]) -> float:
+    """情绪得分（0~1）换算为极性（-1~1）"""
+    score = analysis.get('sentiment_score')
+    if score is None:
+        return {'positive': 0.5, 'negative': -0.5}.get(analysis.get('sentiment'), 0.0)
+    return max(-1.0, min(1.0, (float(score) - 0.5) * 2))
+
+
+def summarize_analyses(items: Iterable[Dict[str, Any]], credibility: float = 0.8) -> Dict[str, Any]:
+    """对一组分析结果（如一次批量分析）生成市场情绪结论"""
+    counts = [0, 0, 0]
+    weighted_sum = weight_sum = 0.0
+    for analysis in items:
+        counts[_SENTIMENT_INDEX.get(analysis.get('sentiment'), 2)] += 1
+        weighted_sum += credibility * polarity(analysis)
+        weight_sum += credibility
+    return summarize_mood(counts, weighted_sum, weight_sum)
+
+
+class MarketMoodAggregator:
+    """
+    实时滚动市场情绪
+    最近1440分钟每分钟一个桶，存放在固定大小的环形数组中；每个窗口维护运行中的合计值，
+    记录一篇文章只更新当前分钟桶和各窗口合计（O(1)），时间推进时扣除滑出窗口的桶（均摊O(1)），
+    查询直接读取合计值，耗时与文章数无关。
+    """
+
+    def __init__(self, size: int = 1440, clock=time.time):
+        self.size = size
+        self.clock = clock
+        self._minutes = [-1] * size
+        self._counts = [[0, 0, 0] for _ in range(size)]
+        self._weighted = [0.0] * size
+        self._weights = [0.0] * size
+
+        self._window_counts = {name: [0, 0, 0] for name in WINDOWS}
+        self._window_weighted = {name: 0.0 for name in WINDOWS}
+        self._window_weights = {name: 0.0 for name in WINDOWS}
+        # 各窗口中最早的（尚未扣除的）分钟
+        self._window_tail: Dict[str, int] = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+    def _advance(self, minute: int):
+        """推进到当前分钟，扣除滑出各窗口的桶（调用方需持有锁）"""
+        if self._current is not None and minute <= self._current:
+            return
+        for name, length in WINDOWS.items():
+            oldest = minute - length + 1
+            tail = self._window_tail.get(name, oldest)
+            if oldest - tail >= length:
+                # 长时间没有数据，整个窗口已过期
+                self._window_counts[name] = [0, 0, 0]
+                self._window_weighted[name] = self._window_weights[name] = 0.0
+                tail = oldest
+            while tail < oldest:
+                slot = tail % self.size
+                if self._minutes[slot] == tail:
+                    counts = self._counts[slot]
+                    window_counts = self._window_counts[name]
+                    for index in range(3):
+                        window_counts[index] -= counts[index]
+                    self._window_weighted[name] -= self._weighted[slot]
+                    self._window_weights[name] -= self._weights[slot]
+                tail += 1
+            self._window_tail[name] = tail
+        self._current = minute
+
+    def record(self, analysis: Dict[str, Any], credibility: float = 0.8, timestamp: float = None):
+        """记录一篇文章的分析结果"""
+        minute = int((timestamp if timestamp is not None else self.clock()) // 60)
+        index = _SENTIMENT_INDEX.get(analysis.get('sentiment'), 2)
+        weighted = credibility * polarity(analysis)
+
+        with self._lock:
+            self._advance(minute)
+            if self._current - minute >= self.size:
+                return
+            slot = minute % self.size
+            if self._minutes[slot] != minute:
+                # 复用环形数组中已过期的桶
+                self._minutes[slot] = minute
+                self._counts[slot] = [0, 0, 0]
+                self._weighted[slot] = self._weights[slot] = 0.0
+            self._counts[slot][index] += 1
+            self._weighted[slot] += weighted
+            self._weights[slot] += credibility
+
+            for name in WINDOWS:
+                # 迟到的数据只计入仍覆盖该分钟的窗口
+                if minute >= self._window_tail[name]:
+                    self._window_counts[name][index] += 1
+                    self._window_weighted[name] += weighted
+                    self._window_weights[name] += credibility
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取各窗口的当前市场情绪"""
+        with self._lock:
+            self._advance(int(self.clock() // 60))
+            windows = {}
+            for name in WINDOWS:
+                counts = list(self._window_counts[name])
+                windows[name] = {
+                    'positive_count': counts[0],
+                    'negative_count': counts[1],
+                    'neutral_count': counts[2],
+                    **summarize_mood(counts, self._window_weighted[name], self._window_weights[name])
+                }
+        return windows
+
+
+# 创建全局市场情绪实例
+market_mood = MarketMoodAggregator()
@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from services.background import background_loop
+
+logger = logging.getLogger(__name__)
+
+# 发送函数：(user_id, message, priority, channels) -> 入队结果（含message_id）
+Sink = Callable[[str, str, str, Optional[List[str]]], Dict[str, Any]]
+
+# 摘要的优先级取合并消息中最高的一个
+_PRIORITY_RANK = {'low': 0, 'normal': 1, 'medium': 1, 'high': 2, 'urgent': 3}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _parse_set(value: str):
+    return {item.strip() for item in (value or '').split(',') if item.strip()}
+
+
+def content_hash(message: str, channels: Optional[List[str]] = None) -> str:
+    """
+    消息内容指纹：只忽略空白和大小写，数字保留（不同股票代码、不同价格的警报不是重复消息）；
+    目标渠道不同的消息各自去重
+    """
+    normalized = _WHITESPACE.sub(' ', message.strip().lower())
+    target = ','.join(sorted(set(channels))) if channels else '*'
+    return hashlib.sha1(f"{target}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+class NotificationCoalescer:
+    """
+    通知合并
+    位于发送接口和出站队列之间：时间窗口内发往相同渠道、内容相同的消息（按内容指纹）直接丢弃；
+    低优先级消息按（用户, 渠道）缓冲，达到条数上限或等待时间到期时合并为一条摘要发送；
+    urgent消息不经过本阶段直接发送。
+    缓冲中的消息只保存在内存中，最长等待时间即为进程异常退出时可能丢失的范围。
+    """
+
+    def __init__(self, dedupe_window: float = None, digest_interval: float = None, digest_max_size: int = None,
+                 bypass_priorities: set = None, digest_priorities: set = None, max_fingerprints: int = 100000):
+        self.dedupe_window = dedupe_window if dedupe_window is not None else float(
+            os.getenv('NOTIFICATION_DEDUPE_WINDOW', 300)
+        )
+        self.digest_interval = digest_interval if digest_interval is not None else float(
+            os.getenv('NOTIFICATION_DIGEST_INTERVAL', 60)
+        )
+        self.digest_max_size = digest_max_size if digest_max_size is not None else int(
+            os.getenv('NOTIFICATION_DIGEST_MAX_SIZE', 10)
+        )
+        self.bypass_priorities = bypass_priorities if bypass_priorities is not None else _parse_set(
+            os.getenv('NOTIFICATION_BYPASS_PRIORITIES', 'urgent')
+        )
+        self.digest_priorities = digest_priorities if digest_priorities is not None else _parse_set(
+            os.getenv('NOTIFICATION_DIGEST_PRIORITIES', 'low,normal,medium')
+        )
+        self.max_fingerprints = max_fingerprints
+        self.sink: Optional[Sink] = None
+
+        # (用户, 指纹) -> (首次出现时间, 消息ID)，按插入顺序即时间顺序过期
+        self._fingerprints: 'OrderedDict[Tuple[str, str], Tuple[float, Optional[str]]]' = OrderedDict()
+        # (用户, 渠道) -> 缓冲中的消息
+        self._buffers: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        self.stats = {'received': 0, 'bypassed': 0, 'suppressed': 0, 'buffered': 0, 'digests': 0, 'sent': 0}
+        self._lock = threading.Lock()
+
+    def set_sink(self, sink: Sink):
+        """注册实际发送函数（由通知路由模块注册为写入出站队列）"""
+        self.sink = sink
+
+    def _expire(self, now: float):
+        """移除窗口外的指纹（调用方需持有锁）"""
+        fingerprints = self._fingerprints
+        while fingerprints:
+            key, (seen_at, _) = next(iter(fingerprints.items()))
+            if now - seen_at <= self.dedupe_window and len(fingerprints) <= self.max_fingerprints:
+                break
+            fingerprints.popitem(last=False)
+
+    def _send(self, user_id: str, message: str, priority: str, channels: Optional[List[str]],
+              fingerprint: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+        try:
+            result = self.sink(user_id, message, priority, channels)
+        except Exception:
+            # 发送失败时撤销指纹，调用方重试不会被当作重复消息
+            if fingerprint is not None:
+                with self._lock:
+                    self._fingerprints.pop(fingerprint, None)
+            raise
+        with self._lock:
+            self.stats['sent'] += 1
+            # 记下消息ID，之后的重复消息可指向已发送的消息
+            if fingerprint is not None and fingerprint in self._fingerprints:
+                self._fingerprints[fingerprint] = (self._fingerprints[fingerprint][0], result.get('message_id'))
+        return result
+
+    def submit(self, user_id: str, message: str, priority: str = 'medium',
+               channels: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        提交一条通知，返回处理结果，action为：
+        sent（已写入出站队列）、suppressed（重复消息被丢弃）、buffered（等待合并为摘要）
+        """
+        messages = None
+        with self._lock:
+            self.stats['received'] += 1
+            if priority in self.bypass_priorities:
+                self.stats['bypassed'] += 1
+                fingerprint = None
+            else:
+                now = time.time()
+                self._expire(now)
+                fingerprint = (user_id, content_hash(message, channels))
+                duplicate = self._fingerprints.get(fingerprint)
+                if duplicate is not None:
+                    self.stats['suppressed'] += 1
+                    return {
+                        'action': 'suppressed',
+                        'status': 'suppressed',
+                        'duplicate_of': duplicate[1],
+                        'window_seconds': self.dedupe_window
+                    }
+                self._fingerprints[fingerprint] = (now, None)
+
+                if priority in self.digest_priorities:
+                    key = (user_id, tuple(channels or ()))
+                    buffer = self._buffers.setdefault(key, [])
+                    buffer.append({'message': message, 'priority': priority, 'received_at': now})
+                    self.stats['buffered'] += 1
+                    if len(buffer) == 1:
+                        self._schedule_flush(key)
+                    if len(buffer) < self.digest_max_size:
+                        return {
+                            'action': 'buffered',
+                            'status': 'buffered',
+                            'digest_size': len(buffer),
+                            'flush_in_seconds': round(max(0.0, buffer[0]['received_at'] + self.digest_interval - now), 1)
+                        }
+                    # 达到条数上限，立即合并发送
+                    messages = self._buffers.pop(key)
+
+        if messages is not None:
+            return {'action': 'sent', **self._send_digest(user_id, list(key[1]) or None, messages)}
+        return {'action': 'sent', **self._send(user_id, message, priority, channels, fingerprint)}
+
+    def _schedule_flush(self, key: Tuple[str, Tuple[str, ...]]):
+        """缓冲开始时安排定时合并（调用方需持有锁）"""
+        loop = background_loop.get_loop()
+        loop.call_soon_threadsafe(loop.call_later, self.digest_interval, self._flush_key, key)
+
+    def _flush_key(self, key: Tuple[str, Tuple[str, ...]], now: float = None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            buffer = self._buffers.get(key)
+            # 缓冲已因达到条数上限被发送，且之后又有新消息进入时，按新缓冲的开始时间判断
+            if not buffer:
+                return
+            if now - buffer[0]['received_at'] < self.digest_interval - 0.01:
+                return
+            messages = self._buffers.pop(key)
+        try:
+            self._send_digest(key[0], list(key[1]) or None, messages)
+        except Exception as error:
+            logger.error(f"发送通知摘要失败: {str(error)}")
+
+    def _send_digest(self, user_id: str, channels: Optional[List[str]], messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """合并缓冲的消息，只有一条时原样发送"""
+        if len(messages) == 1:
+            return self._send(user_id, messages[0]['message'], messages[0]['priority'], channels)
+        priority = max((item['priority'] for item in messages), key=lambda value: _PRIORITY_RANK.get(value, 1))
+        lines = [f"📋 通知摘要（{len(messages)}条）"]
+        lines.extend(f"{index}. {item['message']}" for index, item in enumerate(messages, 1))
+        with self._lock:
+            self.stats['digests'] += 1
+        logger.info(f"📋 合并{len(messages)}条通知为摘要: {user_id}")
+        return {'digest_size': len(messages), **self._send(user_id, '\n\n'.join(lines), priority, channels)}
+
+    def flush_all(self):
+        """立即发送所有缓冲中的摘要（如进程退出前）"""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for key, messages in buffers.items():
+            self._send_digest(key[0], list(key[1]) or None, messages)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'pending_digests': len(self._buffers),
+                'pending_messages': sum(len(buffer) for buffer in self._buffers.values()),
+                'dedupe_window': self.dedupe_window,
+                'digest_interval': self.digest_interval,
+                'digest_max_size': self.digest_max_size
+            }
+
+
+# 创建全局通知合并实例
+notification_coalescer = NotificationCoalescer()
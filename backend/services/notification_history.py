@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Any
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB_FILE = 'notification_history.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    record TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notification_history_user ON notification_history (user_id, id);
+"""
+
+
+def _snapshot(record: Dict[str, Any]) -> Dict[str, Any]:
+    """记录可能仍在被后台发送协程更新，返回时复制一份（列表字段也复制）"""
+    return {key: list(value) if isinstance(value, list) else value for key, value in record.items()}
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps({key: value for key, value in _snapshot(record).items() if key != 'id'}, ensure_ascii=False)
+
+
+class NotificationHistory:
+    """
+    通知历史
+    保存在SQLite中，Web进程和 worker.py 的投递进程写入同一张表，ID由数据库自增分配，跨进程唯一且单调递增。
+    每个用户只保留最近per_user条，写入时在同一事务中删除更早的记录；
+    读取最近limit条按 (用户, ID) 索引倒序取limit行，开销与历史总量无关。
+    """
+
+    def __init__(self, db_file: str = HISTORY_DB_FILE, per_user: int = None):
+        self.db_file = db_file
+        self.per_user = per_user if per_user is not None else int(os.getenv('NOTIFICATION_HISTORY_PER_USER', 100))
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def add(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """分配ID并保存记录，返回保存的记录对象（调用方可继续更新后调用update）"""
+        user_id = record['user_id']
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                record_id = conn.execute(
+                    'INSERT INTO notification_history (user_id, record, created_at) VALUES (?, ?, ?)',
+                    (user_id, _dumps(record), time.time())
+                ).lastrowid
+                # 超出保留条数时删除该用户更早的记录
+                conn.execute(
+                    """DELETE FROM notification_history WHERE user_id = ? AND id <= (
+                           SELECT id FROM notification_history WHERE user_id = ?
+                           ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                    (user_id, user_id, self.per_user)
+                )
+        finally:
+            conn.close()
+        return {'id': record_id, **record}
+
+    def update(self, record: Dict[str, Any]):
+        """记录内容变化后（如后台渠道发送完成）写回"""
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE notification_history SET record = ? WHERE id = ?', (_dumps(record), record['id']))
+        except Exception as error:
+            logger.error(f"写入通知历史失败: {str(error)}")
+        finally:
+            conn.close()
+
+    def recent(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """获取用户最近的limit条记录（按时间正序），limit<=0时返回保留的全部记录"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT id, record FROM notification_history WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+                (user_id, limit if limit > 0 else -1)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'id': row['id'], **json.loads(row['record'])} for row in reversed(rows)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT COUNT(DISTINCT user_id) AS users, COUNT(*) AS records, MAX(id) AS last_id FROM notification_history'
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            'users': row['users'],
+            'records': row['records'],
+            'last_id': row['last_id'] or 0,
+            'per_user': self.per_user
+        }
+
+
+# 创建全局通知历史实例
+notification_history = NotificationHistory()
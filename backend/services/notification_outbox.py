@@ -0,0 +1,490 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Awaitable
+
+from services.storage import connect, transaction
+from services.background import background_loop
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DB_FILE = 'notification_outbox.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    worker_id TEXT,
+    claimed_at REAL,
+    last_error TEXT,
+    last_result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_priority ON notification_outbox (status, priority, next_attempt_at);
+"""
+
+# 投递函数：输入出站消息，返回 {'delivered': 是否送达, 'retry_channels': 需要重试的渠道, 'error': 错误信息, 'results': 各渠道结果}
+Deliverer = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+STATUSES = ['pending', 'sending', 'delivered', 'dead']
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    """解析 "urgent:8,high:4,low:1" 格式的优先级权重配置"""
+    weights = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            key, weight = item.split(':', 1)
+            try:
+                if float(weight) > 0:
+                    weights[key.strip()] = float(weight)
+                    continue
+            except ValueError:
+                pass
+            logger.warning(f"⚠️ 无效的优先级权重配置: {item}")
+    return weights
+
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+class PriorityScheduler:
+    """
+    多级优先级调度（加权公平队列）
+    每个有待投递消息的优先级维护一个虚拟时间，每投递一条增加 1/权重，每次选择虚拟时间最小的优先级；
+    积压时各优先级按权重比例获得投递机会（默认 urgent:high:medium:low = 8:4:2:1），低优先级不会被饿死。
+    空闲的优先级重新有消息时虚拟时间追平到当前值，不能用空闲期间积累的额度连续插队。
+    同时按优先级统计排队时间（从可投递到被领取）。
+    """
+
+    def __init__(self, weights: Dict[str, float] = None, default_priority: str = 'medium', sample_size: int = 1000):
+        self.weights = weights if weights is not None else _parse_weights(
+            os.getenv('NOTIFICATION_PRIORITY_WEIGHTS', 'urgent:8,high:4,medium:2,normal:2,low:1')
+        )
+        if default_priority not in self.weights:
+            self.weights[default_priority] = 1.0
+        self.default_priority = default_priority
+        self._passes = {priority: 0.0 for priority in self.weights}
+        self._virtual_time = 0.0
+        self._dispatched = {priority: 0 for priority in self.weights}
+        self._queue_times = {priority: deque(maxlen=sample_size) for priority in self.weights}
+        self._lock = threading.Lock()
+
+    def normalize(self, priority: str) -> str:
+        """未配置权重的优先级按默认优先级排队"""
+        return priority if priority in self.weights else self.default_priority
+
+    def order(self, backlogged: List[str]) -> List[str]:
+        """有待投递消息的优先级按调度顺序排列（虚拟时间小的在前，相同时权重大的在前）"""
+        with self._lock:
+            return sorted(backlogged, key=lambda priority: (
+                max(self._passes[priority], self._virtual_time), -self.weights[priority]
+            ))
+
+    def dispatched(self, priority: str, queue_time: float):
+        """记录一次投递：推进该优先级的虚拟时间并记录排队时间"""
+        with self._lock:
+            start = max(self._passes[priority], self._virtual_time)
+            self._virtual_time = start
+            self._passes[priority] = start + 1.0 / self.weights[priority]
+            self._dispatched[priority] += 1
+            self._queue_times[priority].append(max(0.0, queue_time))
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats = {}
+            for priority, weight in self.weights.items():
+                samples = sorted(self._queue_times[priority])
+                queue_time = None
+                if samples:
+                    queue_time = {
+                        'avg_ms': round(sum(samples) / len(samples) * 1000, 1),
+                        'p50_ms': round(_percentile(samples, 0.5) * 1000, 1),
+                        'p95_ms': round(_percentile(samples, 0.95) * 1000, 1),
+                        'max_ms': round(samples[-1] * 1000, 1),
+                        'samples': len(samples)
+                    }
+                stats[priority] = {'weight': weight, 'dispatched': self._dispatched[priority], 'queue_time': queue_time}
+            return stats
+
+
+class NotificationOutbox:
+    """
+    持久化通知出站队列
+    /send 和 /alert 只写入队列即返回；工作协程领取到期的消息投递，失败的渠道按指数退避（带随机抖动）重试，
+    超过最大尝试次数或遇到不可重试的错误时移入死信，死信可查看并重新投递。
+    领取时由优先级调度器决定先投递哪个优先级的消息，同一优先级内按到期时间先后。
+    """
+
+    def __init__(self, db_file: str = OUTBOX_DB_FILE, max_attempts: int = None, base_delay: float = None,
+                 max_delay: float = None, lease_seconds: float = 120, scheduler: PriorityScheduler = None):
+        self.db_file = db_file
+        self.scheduler = scheduler if scheduler is not None else PriorityScheduler()
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv('NOTIFICATION_RETRY_BASE_DELAY', 2))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('NOTIFICATION_RETRY_MAX_DELAY', 300))
+        # 消息被领取后超过租约时间仍未完成，视为工作协程已失效，可被重新领取
+        self.lease_seconds = lease_seconds
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _to_message(row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'message': row['message'],
+            'priority': row['priority'],
+            'channels': json.loads(row['channels']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'next_attempt_at': _format_time(row['next_attempt_at']) if row['status'] == 'pending' else None,
+            'last_error': row['last_error'],
+            'last_result': json.loads(row['last_result']) if row['last_result'] else None,
+            'created_at': _format_time(row['created_at']),
+            'updated_at': _format_time(row['updated_at'])
+        }
+
+    def backoff(self, attempts: int) -> float:
+        """第attempts次失败后的重试间隔：指数增长，上限max_delay，加入±20%抖动避免集中重试"""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def enqueue(self, user_id: str, message: str, priority: str = 'medium', channels: List[str] = None) -> str:
+        """写入出站队列，返回消息ID"""
+        message_id = uuid.uuid4().hex
+        priority = self.scheduler.normalize(priority)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                """INSERT INTO notification_outbox
+                   (id, user_id, message, priority, channels, next_attempt_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (message_id, user_id, message, priority, json.dumps(channels or [], ensure_ascii=False), now, now, now)
+            )
+        finally:
+            conn.close()
+        logger.info(f"📮 通知已入队: {message_id} ({priority})")
+        return message_id
+
+    def _next_due_row(self, conn, now: float):
+        """按优先级调度选择下一条到期消息：每个优先级各取队首（索引查询），再由调度器决定顺序"""
+        # 租约过期的消息已经被领取过，优先重新领取
+        row = conn.execute(
+            """SELECT * FROM notification_outbox WHERE status = 'sending' AND claimed_at < ?
+               ORDER BY claimed_at LIMIT 1""",
+            (now - self.lease_seconds,)
+        ).fetchone()
+        if row is not None:
+            return row, None
+        heads = {}
+        for priority in self.scheduler.weights:
+            head = conn.execute(
+                """SELECT * FROM notification_outbox
+                   WHERE status = 'pending' AND priority = ? AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at, seq LIMIT 1""",
+                (priority, now)
+            ).fetchone()
+            if head is not None:
+                heads[priority] = head
+        if not heads:
+            # 兼容调度器配置之外的优先级（如修改权重配置前入队的消息），避免永远不被领取
+            row = conn.execute(
+                """SELECT * FROM notification_outbox WHERE status = 'pending' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at, seq LIMIT 1""",
+                (now,)
+            ).fetchone()
+            return row, None
+        priority = self.scheduler.order(list(heads))[0]
+        return heads[priority], priority
+
+    def enqueue_many(self, items: List[Dict[str, Any]]) -> List[str]:
+        """批量写入出站队列（一个事务），items为 {'user_id', 'message', 'priority', 'channels'}，返回消息ID列表"""
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, item['user_id'], item['message'], self.scheduler.normalize(item.get('priority', 'medium')),
+             json.dumps(item.get('channels') or [], ensure_ascii=False), now, now, now)
+            for item in items
+        ]
+        if not rows:
+            return []
+        conn = self._connect()
+        try:
+            with transaction(conn):
+                conn.executemany(
+                    """INSERT INTO notification_outbox
+                       (id, user_id, message, priority, channels, next_attempt_at, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    rows
+                )
+        finally:
+            conn.close()
+        logger.info(f"📮 {len(rows)}条通知已批量入队")
+        return [row[0] for row in rows]
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取一条到期的消息"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                row, priority = self._next_due_row(conn, now)
+                if row is None:
+                    return None
+                conn.execute(
+                    """UPDATE notification_outbox SET status = 'sending', worker_id = ?, claimed_at = ?,
+                       attempts = attempts + 1, updated_at = ? WHERE seq = ?""",
+                    (worker_id, now, now, row['seq'])
+                )
+            if priority is not None:
+                # 排队时间：从可以投递（入队或重试到期）到被领取
+                self.scheduler.dispatched(priority, now - row['next_attempt_at'])
+            message = self._to_message(row)
+            message['attempts'] += 1
+            return message
+        finally:
+            conn.close()
+
+    def next_due(self) -> Optional[float]:
+        """最近一条待投递消息的到期时间，用于工作协程决定休眠多久"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM notification_outbox WHERE status = 'pending'"
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['due']
+
+    def _update(self, message_id: str, status: str, error: str = None, result: Dict[str, Any] = None,
+                channels: List[str] = None, next_attempt_at: float = None):
+        now = time.time()
+        assignments = ['status = ?', 'last_error = ?', 'last_result = ?', 'worker_id = NULL', 'updated_at = ?']
+        params: List[Any] = [status, error, json.dumps(result, ensure_ascii=False) if result is not None else None, now]
+        if channels is not None:
+            assignments.append('channels = ?')
+            params.append(json.dumps(channels, ensure_ascii=False))
+        if next_attempt_at is not None:
+            assignments.append('next_attempt_at = ?')
+            params.append(next_attempt_at)
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE notification_outbox SET {', '.join(assignments)} WHERE id = ? AND status = 'sending'",
+                [*params, message_id]
+            )
+        finally:
+            conn.close()
+
+    def complete(self, item: Dict[str, Any], result: Dict[str, Any]):
+        self._update(item['id'], 'delivered', result=result)
+
+    def fail(self, item: Dict[str, Any], error: str, retry_channels: List[str] = None, result: Dict[str, Any] = None):
+        """
+        投递失败：只重试失败的渠道（未指定时重试全部渠道），按指数退避安排下次投递；
+        没有可重试的渠道或超过最大尝试次数时移入死信
+        """
+        channels = retry_channels if retry_channels is not None else item['channels']
+        if item['attempts'] >= self.max_attempts or (retry_channels is not None and not retry_channels):
+            self._update(item['id'], 'dead', error=error, result=result)
+            logger.warning(f"☠️ 通知投递失败，已移入死信: {item['id']} ({error})")
+            return
+        self._update(item['id'], 'pending', error=error, result=result, channels=channels,
+                     next_attempt_at=time.time() + self.backoff(item['attempts']))
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM notification_outbox WHERE id = ?', (message_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_message(row) if row is not None else None
+
+    def list_dead(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """查看死信（最近的在前）"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM notification_outbox WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._to_message(row) for row in rows]
+
+    def replay(self, message_ids: List[str] = None) -> int:
+        """将死信重新放回队列（重置尝试次数），未指定ID时重放全部死信，返回重放条数"""
+        now = time.time()
+        sql = """UPDATE notification_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?
+                 WHERE status = 'dead'"""
+        params: List[Any] = [now, now]
+        if message_ids is not None:
+            if not message_ids:
+                return 0
+            sql += f" AND id IN ({','.join('?' * len(message_ids))})"
+            params.extend(message_ids)
+        conn = self._connect()
+        try:
+            replayed = conn.execute(sql, params).rowcount
+        finally:
+            conn.close()
+        if replayed:
+            logger.info(f"🔁 已重放{replayed}条死信通知")
+        return replayed
+
+    def get_stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM notification_outbox GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        stats = {status: 0 for status in STATUSES}
+        stats.update({row['status']: row['count'] for row in rows})
+        return stats
+
+    def get_priority_stats(self) -> Dict[str, Dict[str, Any]]:
+        """按优先级的积压量、最早到期消息的等待时间、权重、已投递条数和排队时间分布"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """SELECT priority, COUNT(*) AS pending, MIN(next_attempt_at) AS oldest_due
+                   FROM notification_outbox WHERE status = 'pending' GROUP BY priority"""
+            ).fetchall()
+        finally:
+            conn.close()
+        backlog = {row['priority']: row for row in rows}
+        stats = self.scheduler.get_stats()
+        for priority, item in stats.items():
+            row = backlog.get(priority)
+            item['pending'] = row['pending'] if row is not None else 0
+            item['oldest_wait_ms'] = (
+                round(max(0.0, now - row['oldest_due']) * 1000, 1) if row is not None and row['oldest_due'] <= now else None
+            )
+        return stats
+
+
+class NotificationWorkerPool:
+    """
+    通知投递工作协程池
+    工作协程运行在后台事件循环中（投递主要是网络等待，协程即可并发），从出站队列领取到期的消息投递
+    """
+
+    def __init__(self, outbox: NotificationOutbox, size: int = None, poll_interval: float = 5.0):
+        self.outbox = outbox
+        self.size = size if size is not None else int(os.getenv('NOTIFICATION_WORKERS', 4))
+        self.poll_interval = poll_interval
+        self.deliverer: Optional[Deliverer] = None
+        self._tasks = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self, deliverer: Deliverer):
+        """注册投递函数并启动工作协程（重复调用不会重复启动）"""
+        with self._lock:
+            self.deliverer = deliverer
+            if self.running or self.size <= 0:
+                return
+            self._stopping = False
+            self._loop = background_loop.get_loop()
+            self._wakeup = asyncio.Event()
+            self._tasks = [
+                background_loop.submit(self._worker_loop(f"notifier-{os.getpid()}-{i}"))
+                for i in range(self.size)
+            ]
+            logger.info(f"🚀 通知投递工作协程已启动: {self.size}个")
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作协程：正在投递的消息投递完成后退出，超时未退出的协程被取消（其租约到期后消息会被重新领取）"""
+        with self._lock:
+            if not self.running:
+                return
+            self._stopping = True
+            self.notify()
+            tasks = self._tasks
+        _, pending = concurrent.futures.wait(tasks, timeout)
+        for task in pending:
+            task.cancel()
+        logger.info("🛑 通知投递工作协程已停止")
+
+    def notify(self):
+        """有新消息时唤醒空闲的工作协程"""
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _sleep(self):
+        due = self.outbox.next_due()
+        timeout = self.poll_interval if due is None else min(self.poll_interval, max(0.0, due - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker_loop(self, worker_id: str):
+        while not self._stopping:
+            try:
+                item = self.outbox.claim(worker_id)
+            except Exception as error:
+                logger.error(f"领取通知失败: {str(error)}")
+                item = None
+            if item is None:
+                await self._sleep()
+                continue
+
+            try:
+                outcome = await self.deliverer(item)
+            except Exception as error:
+                logger.error(f"通知投递异常 ({item['id']}): {str(error)}")
+                self.outbox.fail(item, str(error))
+                continue
+
+            if outcome.get('delivered') and not outcome.get('retry_channels'):
+                self.outbox.complete(item, outcome)
+            else:
+                # retry_channels为None表示整条消息发送出错，重试全部渠道；空列表表示没有可重试的渠道
+                self.outbox.fail(item, outcome.get('error') or '通知发送失败',
+                                 retry_channels=outcome.get('retry_channels'), result=outcome)
+
+
+# 创建全局通知出站队列和工作协程池实例
+notification_outbox = NotificationOutbox()
+notification_worker_pool = NotificationWorkerPool(notification_outbox)
@@ -0,0 +1,262 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+PREFERENCE_DB_FILE = 'notification_preferences.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_preferences (
+    user_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    enabled INTEGER NOT NULL,
+    priority TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, channel)
+);
+CREATE INDEX IF NOT EXISTS idx_channel_preferences_target ON channel_preferences (channel, enabled, priority, user_id);
+CREATE TABLE IF NOT EXISTS channel_preferences_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO channel_preferences_version (id, version) VALUES (1, 0);
+"""
+
+PRIORITIES = ['low', 'normal', 'medium', 'high', 'urgent']
+_PRIORITY_RANK = {'low': 0, 'normal': 1, 'medium': 1, 'high': 2, 'urgent': 3}
+
+# 单次批量更新的用户数上限
+MAX_BULK_USERS = 10000
+
+
+def normalize_preferences(preferences: Dict[str, Any], known_channels: Iterable[str] = None) -> Dict[str, Dict[str, Any]]:
+    """校验渠道偏好 {渠道: {'enabled': bool, 'priority': str}}，参数错误时抛出ValueError"""
+    if not isinstance(preferences, dict) or not preferences:
+        raise ValueError('preferences必须为非空对象')
+    known = set(known_channels) if known_channels is not None else None
+    normalized = {}
+    for channel, preference in preferences.items():
+        if known is not None and channel not in known:
+            raise ValueError(f'不支持的渠道: {channel}')
+        if not isinstance(preference, dict):
+            raise ValueError(f'{channel}的偏好必须为对象')
+        priority = preference.get('priority', 'medium')
+        if priority not in _PRIORITY_RANK:
+            raise ValueError(f"priority只能为 {', '.join(PRIORITIES)}")
+        normalized[channel] = {'enabled': bool(preference.get('enabled', True)), 'priority': priority}
+    return normalized
+
+
+class PreferenceStore:
+    """
+    用户通知偏好存储
+    每个（用户, 渠道）一行保存在SQLite中，(渠道, 是否启用, 优先级, 用户) 二级索引使
+    "所有启用了邮件且优先级为high的用户"这类查询只扫描命中的索引范围，不遍历全部用户。
+    发送通知时使用按用户编译的路由表（启用的渠道按优先级从高到低排列、禁用的渠道集合），
+    路由表按LRU缓存在内存中，本进程更新偏好时立即失效；其他进程更新时递增数据库中的版本号，
+    各进程最多在reload_interval秒后发现版本变化并清空缓存。
+    """
+
+    def __init__(self, db_file: str = PREFERENCE_DB_FILE, cache_size: int = None, reload_interval: float = 1.0):
+        self.db_file = db_file
+        self.cache_size = cache_size if cache_size is not None else int(
+            os.getenv('NOTIFICATION_ROUTE_CACHE_SIZE', 10000)
+        )
+        self.reload_interval = reload_interval
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+        self._routes: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        # 每次失效递增，读取数据库期间发生过失效时不缓存读到的结果
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    # ---------- 路由表 ----------
+
+    @staticmethod
+    def _compile(rows) -> Dict[str, Any]:
+        """由用户的偏好行编译路由表"""
+        preferences = {row['channel']: {'enabled': bool(row['enabled']), 'priority': row['priority']} for row in rows}
+        enabled = sorted(
+            (channel for channel, preference in preferences.items() if preference['enabled']),
+            key=lambda channel: -_PRIORITY_RANK[preferences[channel]['priority']]
+        )
+        return {
+            'preferences': preferences,
+            'channels': enabled,
+            'disabled': frozenset(channel for channel, preference in preferences.items() if not preference['enabled'])
+        }
+
+    def _check_version(self, conn):
+        """其他进程更新偏好后清空缓存（调用方需持有锁）"""
+        self._checked_at = time.monotonic()
+        version = conn.execute('SELECT version FROM channel_preferences_version WHERE id = 1').fetchone()['version']
+        if version != self._version:
+            if self._version is not None:
+                self._routes.clear()
+                self._generation += 1
+                self.stats['invalidations'] += 1
+            self._version = version
+
+    def route(self, user_id: str) -> Dict[str, Any]:
+        """
+        获取用户的路由表 {'preferences', 'channels'（启用的渠道，按优先级从高到低）, 'disabled'}；
+        没有保存过偏好的用户 preferences 和 channels 为空
+        """
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.reload_interval:
+                conn = self._connect()
+                try:
+                    self._check_version(conn)
+                finally:
+                    conn.close()
+            route = self._routes.get(user_id)
+            if route is not None:
+                self._routes.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return route
+            self.stats['misses'] += 1
+            generation = self._generation
+
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT channel, enabled, priority FROM channel_preferences WHERE user_id = ?',
+                                (user_id,)).fetchall()
+        finally:
+            conn.close()
+        route = self._compile(rows)
+        with self._lock:
+            if generation != self._generation:
+                return route
+            self._routes[user_id] = route
+            if len(self._routes) > self.cache_size:
+                self._routes.popitem(last=False)
+        return route
+
+    @staticmethod
+    def _bump_version(conn) -> int:
+        """递增数据库中的版本号（调用方需在事务中），返回新版本号"""
+        conn.execute('UPDATE channel_preferences_version SET version = version + 1 WHERE id = 1')
+        return conn.execute('SELECT version FROM channel_preferences_version WHERE id = 1').fetchone()['version']
+
+    def _invalidate(self, user_ids: Iterable[str], version: int):
+        """
+        移除本进程中这些用户的路由表（调用方需在事务提交之后调用）
+        提交前失效的话，期间开始的读取仍读到旧数据，又会以新的generation缓存下来
+        """
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._routes.pop(user_id, None)
+            # 此前已与数据库同步时只需逐个失效，否则下次读取时整体清空
+            if self._version is not None and self._version == version - 1:
+                self._version = version
+            else:
+                self._checked_at = 0.0
+
+    # ---------- 读写 ----------
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """用户的偏好 {'preferences', 'channels'}，没有保存过时返回None"""
+        route = self.route(user_id)
+        if not route['preferences']:
+            return None
+        return {
+            'preferences': {channel: dict(preference) for channel, preference in route['preferences'].items()},
+            'channels': list(route['channels'])
+        }
+
+    def update_many(self, updates: List[Tuple[str, Dict[str, Dict[str, Any]]]]) -> int:
+        """批量更新 [(用户ID, {渠道: 偏好})]（已规范化），在一个事务中写入，返回更新的行数"""
+        if len(updates) > MAX_BULK_USERS:
+            raise ValueError(f'单次最多更新{MAX_BULK_USERS}个用户')
+        now = time.time()
+        rows = [
+            (user_id, channel, int(preference['enabled']), preference['priority'], now)
+            for user_id, preferences in updates
+            for channel, preference in preferences.items()
+        ]
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                conn.executemany(
+                    """INSERT INTO channel_preferences (user_id, channel, enabled, priority, updated_at)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (user_id, channel) DO UPDATE SET
+                       enabled = excluded.enabled, priority = excluded.priority, updated_at = excluded.updated_at""",
+                    rows
+                )
+                version = self._bump_version(conn)
+        finally:
+            conn.close()
+        self._invalidate({user_id for user_id, _ in updates}, version)
+        logger.info(f"⚙️ 已更新{len(updates)}个用户的通知偏好（{len(rows)}项）")
+        return len(rows)
+
+    def update(self, user_id: str, preferences: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """更新单个用户的偏好（只修改给出的渠道），返回更新后的偏好"""
+        self.update_many([(user_id, preferences)])
+        return self.get(user_id)
+
+    def targets(self, channel: str, priorities: List[str] = None, limit: int = None, after: str = None) -> List[str]:
+        """
+        启用了某渠道（可限定渠道优先级）的用户，按用户ID排序；after为上一页最后一个用户ID
+        查询只扫描 (渠道, 启用, 优先级) 索引中命中的范围
+        """
+        sql = 'SELECT user_id FROM channel_preferences WHERE channel = ? AND enabled = 1'
+        params: List[Any] = [channel]
+        if priorities:
+            sql += f" AND priority IN ({','.join('?' * len(priorities))})"
+            params.extend(priorities)
+        if after is not None:
+            sql += ' AND user_id > ?'
+            params.append(after)
+        sql += ' ORDER BY user_id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        conn = self._connect()
+        try:
+            return [row['user_id'] for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """SELECT channel, priority, COUNT(*) AS count FROM channel_preferences
+                   WHERE enabled = 1 GROUP BY channel, priority"""
+            ).fetchall()
+            users = conn.execute('SELECT COUNT(DISTINCT user_id) AS count FROM channel_preferences').fetchone()['count']
+        finally:
+            conn.close()
+        enabled: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            enabled.setdefault(row['channel'], {})[row['priority']] = row['count']
+        with self._lock:
+            return {'users': users, 'enabled': enabled, 'cached_routes': len(self._routes), **self.stats}
+
+
+# 创建全局用户偏好存储实例
+preference_store = PreferenceStore()
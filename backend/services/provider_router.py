@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+# 熔断器关闭时放行请求的凭证；半开状态下放行的凭证是当次探测名额
+_ADMITTED = object()
+
+
+class ProviderHealth:
+    """
+    AI服务提供商健康度统计
+    维护延迟和错误率的指数加权移动平均（EWMA），并内置带半开探测的熔断器
+    """
+
+    def __init__(self, alpha: float = None, failure_threshold: int = None,
+                 error_rate_threshold: float = None, open_seconds: float = None,
+                 max_open_seconds: float = 300.0):
+        self.alpha = alpha if alpha is not None else float(os.getenv('AI_HEALTH_EWMA_ALPHA', 0.2))
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(
+            os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', 3)
+        )
+        self.error_rate_threshold = error_rate_threshold if error_rate_threshold is not None else float(
+            os.getenv('AI_CIRCUIT_ERROR_RATE', 0.5)
+        )
+        self.base_open_seconds = open_seconds if open_seconds is not None else float(
+            os.getenv('AI_CIRCUIT_OPEN_SECONDS', 30)
+        )
+        self.max_open_seconds = max_open_seconds
+
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.consecutive_failures = 0
+        # 最近成功请求的延迟样本，用于计算对冲请求的触发延迟
+        self.latency_samples = deque(maxlen=256)
+
+        self.state = CIRCUIT_CLOSED
+        self.open_seconds = self.base_open_seconds
+        self.opened_at = 0.0
+        # 半开状态下正在进行的探测请求的凭证
+        self._probe: Optional[object] = None
+        self._lock = threading.Lock()
+
+    def _refresh_state(self, now: float):
+        if self.state == CIRCUIT_OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = CIRCUIT_HALF_OPEN
+            self._probe = None
+
+    def allow_request(self) -> Optional[object]:
+        """
+        判断是否允许发送请求，允许时返回放行凭证，否则返回None
+        半开状态下只放行一个探测请求，请求被取消时凭证交给release归还探测名额
+        """
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            if self.state == CIRCUIT_CLOSED:
+                return _ADMITTED
+            if self.state == CIRCUIT_HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+            return None
+
+    def is_routable(self) -> bool:
+        """不占用探测名额地判断当前是否可被路由"""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self.state == CIRCUIT_CLOSED or (self.state == CIRCUIT_HALF_OPEN and self._probe is None)
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latency_samples.append(latency)
+            self.total_requests += 1
+            self.consecutive_failures = 0
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                self.alpha * latency + (1 - self.alpha) * self.latency_ewma
+            )
+            self.error_ewma = (1 - self.alpha) * self.error_ewma
+            if self.state != CIRCUIT_CLOSED:
+                logger.info("✅ 熔断器探测成功，恢复正常路由")
+                self.state = CIRCUIT_CLOSED
+                self.open_seconds = self.base_open_seconds
+                # 恢复后错误率从阈值一半开始，避免轻微抖动再次熔断
+                self.error_ewma = min(self.error_ewma, self.error_rate_threshold / 2)
+            self._probe = None
+
+    def record_failure(self, latency: float = None):
+        with self._lock:
+            now = time.monotonic()
+            self.total_requests += 1
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.error_ewma = self.alpha + (1 - self.alpha) * self.error_ewma
+            if latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * self.latency_ewma
+                )
+
+            if self.state == CIRCUIT_HALF_OPEN:
+                # 探测失败，熔断时间加倍
+                self.open_seconds = min(self.open_seconds * 2, self.max_open_seconds)
+                self._trip(now)
+            elif self.state == CIRCUIT_CLOSED and (
+                self.consecutive_failures >= self.failure_threshold
+                or (self.total_requests >= self.failure_threshold and self.error_ewma >= self.error_rate_threshold)
+            ):
+                self._trip(now)
+            self._probe = None
+
+    def record_probe_success(self):
+        """后台健康探测成功：熔断中的提供商立即恢复路由，不影响延迟统计"""
+        with self._lock:
+            if self.state != CIRCUIT_CLOSED:
+                logger.info("✅ 健康探测成功，熔断器关闭")
+                self.state = CIRCUIT_CLOSED
+                self.open_seconds = self.base_open_seconds
+                self.consecutive_failures = 0
+                self.error_ewma = min(self.error_ewma, self.error_rate_threshold / 2)
+                self._probe = None
+
+    def release(self, token: Optional[object]):
+        """
+        请求被取消（如对冲请求中落败的一方）时归还放行凭证，不计入成败统计
+        只有凭证就是当前的探测名额时才释放，其他请求被取消不会放出第二个探测
+        """
+        with self._lock:
+            if token is not None and token is self._probe:
+                self._probe = None
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """最近成功请求延迟的分位数"""
+        with self._lock:
+            samples = sorted(self.latency_samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(percentile * len(samples)))
+        return samples[index]
+
+    def _trip(self, now: float):
+        self.state = CIRCUIT_OPEN
+        self.opened_at = now
+        logger.warning(f"⚡ 熔断器打开，{self.open_seconds:g}秒后进行半开探测")
+
+    def score(self, default_latency: float = 1.0) -> float:
+        """路由评分，越小越优：延迟按错误率惩罚"""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return latency * (1 + 4 * self.error_ewma)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return {
+                'state': self.state,
+                'latency_ewma_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                'error_rate_ewma': round(self.error_ewma, 4),
+                'total_requests': self.total_requests,
+                'total_failures': self.total_failures,
+                'consecutive_failures': self.consecutive_failures,
+                'open_seconds': self.open_seconds,
+                'latency_samples': len(self.latency_samples)
+            }
+
+
+class ProviderRouter:
+    """按健康度为每个请求选择最优的AI服务提供商"""
+
+    def __init__(self):
+        self.health: Dict[str, ProviderHealth] = {}
+
+    def register(self, provider_key: str):
+        if provider_key not in self.health:
+            self.health[provider_key] = ProviderHealth()
+
+    def rank(self, provider_keys: List[str]) -> List[str]:
+        """
+        返回按优先级排序的可路由提供商
+        半开状态的提供商排在最前，用真实请求完成探测；失败时调用方会顺延到下一个提供商
+        """
+        routable = [key for key in provider_keys if self.health[key].is_routable()]
+        order = {key: index for index, key in enumerate(provider_keys)}
+        return sorted(routable, key=lambda key: (
+            self.health[key].state != CIRCUIT_HALF_OPEN,
+            self.health[key].score(),
+            order[key]
+        ))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {key: health.snapshot() for key, health in self.health.items()}
+
+
+class HedgeBudget:
+    """
+    对冲请求预算（令牌桶）
+    每个请求积累 ratio 个令牌，每次对冲消耗1个令牌，保证对冲请求占比不超过 ratio
+    """
+
+    def __init__(self, ratio: float = None, max_tokens: float = 10.0):
+        self.ratio = ratio if ratio is not None else float(os.getenv('AI_HEDGE_BUDGET_RATIO', 0.05))
+        self.max_tokens = max_tokens
+        self.tokens = 1.0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+CUBE_DB_FILE = 'sentiment_cube.db'
+
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+DIMENSIONS = ['source', 'category', 'ticker']
+
+# 未指定查询起点时的默认时间跨度（秒）
+DEFAULT_SPANS = {'minute': 6 * 3600, 'hour': 7 * 86400, 'day': 90 * 86400}
+
+# 编码0表示"全部股票"：每篇文章额外写入一行ticker=0，不按股票分组时只读取这些行，避免一篇多股时重复计数
+ALL_TICKERS = 0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cube_dimensions (
+    code INTEGER PRIMARY KEY AUTOINCREMENT,
+    dim TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE (dim, value)
+);
+CREATE TABLE IF NOT EXISTS sentiment_cube (
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    source INTEGER NOT NULL,
+    category INTEGER NOT NULL,
+    ticker INTEGER NOT NULL,
+    positive INTEGER NOT NULL DEFAULT 0,
+    negative INTEGER NOT NULL DEFAULT 0,
+    neutral INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, bucket, source, category, ticker)
+);
+CREATE INDEX IF NOT EXISTS idx_sentiment_cube_bucket ON sentiment_cube (bucket);
+"""
+
+_UPSERT = """
+INSERT INTO sentiment_cube (resolution, bucket, source, category, ticker, positive, negative, neutral, score_sum)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, bucket, source, category, ticker) DO UPDATE SET
+    positive = positive + excluded.positive,
+    negative = negative + excluded.negative,
+    neutral = neutral + excluded.neutral,
+    score_sum = score_sum + excluded.score_sum
+"""
+
+
+class SentimentCube:
+    """
+    多粒度情绪数据立方体
+    以（时间桶 × 来源 × 分类 × 股票）为键预聚合情绪计数，维度取值编码为整数。
+    新数据写入分钟桶；超过保留期的分钟桶合并为小时桶，更早的小时桶合并为天桶。
+    查询按任意维度子集上卷，只读取立方体，不扫描原始分析结果。
+    """
+
+    def __init__(self, db_file: str = CUBE_DB_FILE, minute_retention_hours: float = None,
+                 hour_retention_days: float = None, tz_offset_hours: float = None,
+                 compact_interval: float = 600.0):
+        self.db_file = db_file
+        self.minute_retention = 3600 * (minute_retention_hours if minute_retention_hours is not None else float(
+            os.getenv('SENTIMENT_CUBE_MINUTE_RETENTION_HOURS', 48)
+        ))
+        self.hour_retention = 86400 * (hour_retention_days if hour_retention_days is not None else float(
+            os.getenv('SENTIMENT_CUBE_HOUR_RETENTION_DAYS', 30)
+        ))
+        # 天桶按本地时区（默认北京时间）切分
+        self.tz_offset = int(3600 * (tz_offset_hours if tz_offset_hours is not None else float(
+            os.getenv('SENTIMENT_CUBE_TZ_OFFSET_HOURS', 8)
+        )))
+        self.compact_interval = compact_interval
+
+        self._codes: Dict[Tuple[str, str], int] = {}
+        self._values: Dict[int, str] = {}
+        self._last_compact = 0.0
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def bucket_start(self, timestamp: float, resolution: int) -> int:
+        return int((timestamp + self.tz_offset) // resolution * resolution - self.tz_offset)
+
+    def _encode(self, conn, dim: str, value: Optional[str]) -> int:
+        value = value or ''
+        key = (dim, value)
+        code = self._codes.get(key)
+        if code is None:
+            conn.execute('INSERT OR IGNORE INTO cube_dimensions (dim, value) VALUES (?, ?)', key)
+            code = conn.execute('SELECT code FROM cube_dimensions WHERE dim = ? AND value = ?', key).fetchone()['code']
+            self._codes[key] = code
+            self._values[code] = value
+        return code
+
+    def _decode(self, conn, code: int) -> Optional[str]:
+        if code == ALL_TICKERS:
+            return None
+        if code not in self._values:
+            for row in conn.execute('SELECT code, dim, value FROM cube_dimensions'):
+                self._values[row['code']] = row['value']
+                self._codes[(row['dim'], row['value'])] = row['code']
+        return self._values.get(code, '')
+
+    def record(self, sentiment: str, score: Optional[float], source: str = None, category: str = None,
+               tickers: Iterable[str] = (), timestamp: float = None):
+        """写入一条分析结果到分钟桶"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        bucket = self.bucket_start(timestamp, RESOLUTIONS['minute'])
+        counts = (int(sentiment == 'positive'), int(sentiment == 'negative'),
+                  int(sentiment not in ('positive', 'negative')))
+        score = float(score) if score is not None else 0.5
+
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                source_code = self._encode(conn, 'source', source or '未知来源')
+                category_code = self._encode(conn, 'category', category or '未分类')
+                ticker_codes = [ALL_TICKERS] + sorted({self._encode(conn, 'ticker', ticker) for ticker in tickers if ticker})
+                conn.executemany(_UPSERT, [
+                    (RESOLUTIONS['minute'], bucket, source_code, category_code, ticker_code, *counts, score)
+                    for ticker_code in ticker_codes
+                ])
+        finally:
+            conn.close()
+
+        if time.time() - self._last_compact >= self.compact_interval:
+            self.compact()
+
+    def compact(self, now: float = None):
+        """降采样：超过保留期的分钟桶合并为小时桶，小时桶合并为天桶"""
+        now = now if now is not None else time.time()
+        self._last_compact = time.time()
+        steps = [
+            (RESOLUTIONS['minute'], RESOLUTIONS['hour'], self.bucket_start(now - self.minute_retention, RESOLUTIONS['hour'])),
+            (RESOLUTIONS['hour'], RESOLUTIONS['day'], self.bucket_start(now - self.hour_retention, RESOLUTIONS['day'])),
+        ]
+        conn = self._connect()
+        try:
+            for fine, coarse, cutoff in steps:
+                with transaction(conn, immediate=True):
+                    # 截止时间按粗粒度对齐，只合并完整的粗粒度桶
+                    conn.execute("""
+                        INSERT INTO sentiment_cube (resolution, bucket, source, category, ticker, positive, negative, neutral, score_sum)
+                        SELECT ?, (bucket + ?) / ? * ? - ?, source, category, ticker,
+                               SUM(positive), SUM(negative), SUM(neutral), SUM(score_sum)
+                        FROM sentiment_cube WHERE resolution = ? AND bucket < ?
+                        GROUP BY 2, source, category, ticker
+                        ON CONFLICT (resolution, bucket, source, category, ticker) DO UPDATE SET
+                            positive = positive + excluded.positive,
+                            negative = negative + excluded.negative,
+                            neutral = neutral + excluded.neutral,
+                            score_sum = score_sum + excluded.score_sum
+                    """, (coarse, self.tz_offset, coarse, coarse, self.tz_offset, fine, cutoff))
+                    moved = conn.execute(
+                        'DELETE FROM sentiment_cube WHERE resolution = ? AND bucket < ?', (fine, cutoff)
+                    ).rowcount
+                if moved:
+                    logger.info(f"🗜️ 情绪立方体降采样: {moved}个{fine}秒桶合并为{coarse}秒桶")
+        finally:
+            conn.close()
+
+    def query(self, resolution: str = 'hour', start: float = None, end: float = None,
+              group_by: List[str] = (), filters: Dict[str, str] = None) -> Dict[str, Any]:
+        """
+        按粒度和维度子集上卷查询
+        比请求粒度更粗的数据无法拆分，不参与查询；返回的 available_from 为该粒度数据的最早时间
+        """
+        size = RESOLUTIONS[resolution]
+        end = end if end is not None else time.time()
+        start = start if start is not None else end - DEFAULT_SPANS[resolution]
+        filters = {dim: value for dim, value in (filters or {}).items() if value}
+        use_tickers = 'ticker' in group_by or 'ticker' in filters
+
+        conn = self._connect()
+        try:
+            where = ['resolution <= ?', 'bucket >= ?', 'bucket < ?',
+                     'ticker != ?' if use_tickers else 'ticker = ?']
+            params: List[Any] = [size, self.bucket_start(start, size), end, ALL_TICKERS]
+            for dim, value in filters.items():
+                code = conn.execute(
+                    'SELECT code FROM cube_dimensions WHERE dim = ? AND value = ?', (dim, value)
+                ).fetchone()
+                if code is None:
+                    return {'points': [], 'available_from': None}
+                where.append(f'{dim} = ?')
+                params.append(code['code'])
+
+            group_columns = [dim for dim in DIMENSIONS if dim in group_by]
+            select_dims = ''.join(f', {dim}' for dim in group_columns)
+            rows = conn.execute(f"""
+                SELECT (bucket + ?) / ? * ? - ? AS slot{select_dims},
+                       SUM(positive) AS positive, SUM(negative) AS negative,
+                       SUM(neutral) AS neutral, SUM(score_sum) AS score_sum
+                FROM sentiment_cube WHERE {' AND '.join(where)}
+                GROUP BY slot{select_dims} ORDER BY slot
+            """, [self.tz_offset, size, size, self.tz_offset, *params]).fetchall()
+
+            earliest = conn.execute(
+                'SELECT MIN(bucket) AS bucket FROM sentiment_cube WHERE resolution <= ?', (size,)
+            ).fetchone()['bucket']
+
+            tz = timezone(timedelta(seconds=self.tz_offset))
+            points = []
+            for row in rows:
+                total = row['positive'] + row['negative'] + row['neutral']
+                point = {'bucket': datetime.fromtimestamp(row['slot'], tz).isoformat()}
+                for dim in group_columns:
+                    point[dim] = self._decode(conn, row[dim])
+                point.update({
+                    'positive': row['positive'],
+                    'negative': row['negative'],
+                    'neutral': row['neutral'],
+                    'total': total,
+                    'avg_score': round(row['score_sum'] / total, 3) if total else None
+                })
+                points.append(point)
+        finally:
+            conn.close()
+
+        return {
+            'points': points,
+            'available_from': datetime.fromtimestamp(earliest, tz).isoformat() if earliest is not None else None
+        }
+
+
+# 创建全局情绪立方体实例
+sentiment_cube = SentimentCube()
@@ -0,0 +1,240 @@
+import os
+import math
+import logging
+from typing import Dict, List, Any, Tuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 词条类型
+TERM_SENTIMENT = 'sentiment'
+TERM_NEGATION = 'negation'
+TERM_DEGREE = 'degree'
+TERM_NEUTRAL = 'neutral'  # 仅用于占位，防止"不断"、"未来"等被误判为否定词
+
+# 金融情绪词典（权重为正表示利好，为负表示利空）
+FINANCIAL_SENTIMENT_LEXICON = {
+    # 利好
+    '涨': 1.0, '上涨': 1.5, '大涨': 2.5, '暴涨': 2.5, '涨停': 3.0, '飙升': 2.5,
+    '走高': 1.2, '走强': 1.2, '反弹': 1.2, '回升': 1.2, '回暖': 1.5, '突破': 1.5,
+    '创新高': 2.0, '新高': 1.5, '领涨': 1.5, '利好': 2.5, '增持': 1.5, '回购': 1.5,
+    '降准': 2.0, '降息': 2.0, '宽松': 1.2, '超预期': 2.0, '好于预期': 1.8, '预增': 2.0,
+    '扭亏': 2.0, '扭亏为盈': 2.5, '净流入': 1.5, '强劲': 1.5, '强势': 1.2, '增长': 1.0,
+    '盈利': 1.0, '稳健': 0.5, '稳定': 0.5, '提振': 1.5, '信心': 0.8, '看好': 1.5,
+    '增强': 0.8, '充裕': 1.0, '复苏': 1.5, '景气': 1.0, '机会': 0.6, '中标': 1.5,
+    '获批': 1.5, '分红': 1.0, '释放': 0.6, '跌幅收窄': 1.2, '降幅收窄': 1.2,
+    '符合预期': 0.5, '积极': 1.0, '支撑': 0.8,
+    # 利空
+    '跌': -1.0, '下跌': -1.5, '大跌': -2.5, '暴跌': -3.0, '跌停': -3.0, '跌破': -2.0,
+    '走低': -1.2, '走弱': -1.2, '下滑': -1.5, '下降': -1.0, '下挫': -1.8, '回落': -1.0,
+    '业绩预警': -3.0, '预警': -1.5, '预减': -2.0, '首亏': -2.5, '亏损': -2.0,
+    '利空': -2.5, '减持': -1.5, '加息': -1.5, '收紧': -1.2, '净流出': -1.5,
+    '违约': -3.0, '爆雷': -3.0, '暴雷': -3.0, '退市': -3.0, '立案调查': -3.0,
+    '处罚': -2.0, '风险': -0.8, '低于预期': -2.0, '不及预期': -2.0, '萎缩': -1.5,
+    '疲软': -1.5, '承压': -1.2, '恐慌': -2.0, '抛售': -2.0, '商誉减值': -2.5,
+    '减值': -1.5, '破发': -2.0, '缩水': -1.5, '低迷': -1.5, '担忧': -1.2, '消极': -1.0,
+}
+
+# 否定词
+NEGATION_WORDS = ['不', '未', '没', '没有', '无', '非', '并未', '尚未', '难以', '不会', '未能', '避免']
+
+# 程度副词及其放大系数
+DEGREE_ADVERBS = {
+    '大幅': 2.0, '急剧': 2.0, '显著': 1.6, '明显': 1.5, '非常': 1.5, '极度': 2.0,
+    '持续': 1.3, '不断': 1.3, '进一步': 1.3, '较大': 1.4, '略': 0.6, '略微': 0.6,
+    '小幅': 0.6, '微': 0.5, '稍': 0.6, '稍微': 0.6, '有所': 0.7,
+}
+
+# 中性占位词，用于消解否定词的歧义前缀
+NEUTRAL_WORDS = ['未来', '无论', '非常规', '不少', '不仅', '不过', '不同', '并非常']
+
+# 句读符号会截断否定和程度修饰的作用范围
+CLAUSE_BREAKS = set('，。！？；,.!?;\n')
+
+
+class SentimentLexiconAnalyzer:
+    """
+    基于金融情绪词典的本地情绪分析器
+    使用字典树进行最长匹配扫描，支持否定词与程度副词修饰
+    """
+
+    def __init__(self, ambiguity_threshold: float = None, modifier_window: int = 4):
+        self.ambiguity_threshold = ambiguity_threshold if ambiguity_threshold is not None else float(
+            os.getenv('LOCAL_SENTIMENT_THRESHOLD', 0.35)
+        )
+        # 否定词/程度副词与情绪词之间允许的最大字符间隔
+        self.modifier_window = modifier_window
+        self.title_weight = 1.5
+        self._trie: Dict[str, Any] = {}
+        self._max_term_length = 0
+        self._build_trie()
+
+    def _add_term(self, term: str, kind: str, value: float):
+        node = self._trie
+        for char in term:
+            node = node.setdefault(char, {})
+        # 使用空字符串作为终止标记，存放词条类型和权重
+        node[''] = (kind, value, term)
+        self._max_term_length = max(self._max_term_length, len(term))
+
+    def _build_trie(self):
+        """构建词典字典树"""
+        for term in NEUTRAL_WORDS:
+            self._add_term(term, TERM_NEUTRAL, 0.0)
+        for term in NEGATION_WORDS:
+            self._add_term(term, TERM_NEGATION, -1.0)
+        for term, factor in DEGREE_ADVERBS.items():
+            self._add_term(term, TERM_DEGREE, factor)
+        for term, weight in FINANCIAL_SENTIMENT_LEXICON.items():
+            self._add_term(term, TERM_SENTIMENT, weight)
+
+    def scan(self, text: str) -> List[Tuple[int, str, float, str]]:
+        """最长匹配扫描文本，返回 (位置, 类型, 权重, 词条) 列表，子句分隔符以 None 类型返回"""
+        tokens = []
+        trie = self._trie
+        length = len(text)
+        i = 0
+        while i < length:
+            char = text[i]
+            if char in CLAUSE_BREAKS:
+                tokens.append((i, None, 0.0, char))
+                i += 1
+                continue
+
+            node = trie.get(char)
+            if node is None:
+                i += 1
+                continue
+
+            match = node.get('')
+            match_end = i + 1
+            j = i + 1
+            while j < length:
+                node = node.get(text[j])
+                if node is None:
+                    break
+                j += 1
+                if '' in node:
+                    match = node['']
+                    match_end = j
+
+            if match is None:
+                i += 1
+                continue
+
+            tokens.append((i, match[0], match[1], match[2]))
+            i = match_end
+        return tokens
+
+    def score_text(self, text: str) -> Tuple[float, float, List[Tuple[str, float]]]:
+        """计算文本情绪得分，返回 (利好总分, 利空总分, 命中词条列表)"""
+        positive = 0.0
+        negative = 0.0
+        hits = []
+
+        negated = False
+        degree = 1.0
+        modifier_end = -1
+
+        for position, kind, value, term in self.scan(text):
+            if kind is None:
+                negated = False
+                degree = 1.0
+                continue
+
+            # 修饰词超出作用窗口后失效
+            if position - modifier_end > self.modifier_window:
+                negated = False
+                degree = 1.0
+
+            if kind == TERM_NEGATION:
+                negated = not negated
+                modifier_end = position + len(term)
+            elif kind == TERM_DEGREE:
+                degree *= value
+                modifier_end = position + len(term)
+            elif kind == TERM_SENTIMENT:
+                contribution = value * degree
+                if negated:
+                    # 否定后情绪反转并减弱，如"不会下跌"弱于"上涨"
+                    contribution = -contribution * 0.6
+                if contribution > 0:
+                    positive += contribution
+                else:
+                    negative += -contribution
+                hits.append((('不' if negated else '') + term, contribution))
+                negated = False
+                degree = 1.0
+            else:
+                negated = False
+                degree = 1.0
+
+        return positive, negative, hits
+
+    def analyze(self, content: str, title: str = "", source_credibility: float = 0.8) -> Dict[str, Any]:
+        """分析文章情绪，返回与AI分析结果一致的结构"""
+        content_pos, content_neg, content_hits = self.score_text(content or '')
+        title_pos, title_neg, title_hits = self.score_text(title or '')
+
+        positive = content_pos + title_pos * self.title_weight
+        negative = content_neg + title_neg * self.title_weight
+        raw_score = positive - negative
+        # 压缩到[-1, 1]区间
+        polarity = math.tanh(raw_score / 4.0)
+
+        hits = title_hits + content_hits
+        conflict = min(positive, negative) / max(positive, negative) if max(positive, negative) > 0 else 0.0
+        ambiguous = not hits or abs(polarity) < self.ambiguity_threshold or conflict > 0.6
+
+        if polarity >= self.ambiguity_threshold:
+            sentiment = 'positive'
+        elif polarity <= -self.ambiguity_threshold:
+            sentiment = 'negative'
+        else:
+            sentiment = 'neutral'
+
+        if polarity <= -0.5:
+            risk_level = 'high'
+        elif polarity >= 0.3 and negative == 0:
+            risk_level = 'low'
+        else:
+            risk_level = 'medium'
+
+        if polarity >= 0.6:
+            advice = '买入'
+        elif polarity >= 0.2:
+            advice = '持有'
+        elif polarity <= -0.6:
+            advice = '卖出'
+        else:
+            advice = '观望'
+
+        return {
+            'sentiment': sentiment,
+            'sentiment_score': round((polarity + 1) / 2, 3),
+            'risk_level': risk_level,
+            'investment_advice': advice,
+            'key_points': self._build_key_points(hits),
+            'stock_impact': '利好' if sentiment == 'positive' else ('利空' if sentiment == 'negative' else '影响待评估'),
+            'confidence': round(min(1.0, abs(polarity) + 0.2) * source_credibility, 3),
+            'analysis_timestamp': datetime.now().isoformat(),
+            'ai_provider': '本地词典分析',
+            'local_analysis': True,
+            'ambiguous': ambiguous,
+            'matched_terms': [term for term, _ in hits]
+        }
+
+    def _build_key_points(self, hits: List[Tuple[str, float]]) -> List[str]:
+        """根据命中词条生成关键信息"""
+        positive_terms = list(dict.fromkeys(term for term, weight in hits if weight > 0))
+        negative_terms = list(dict.fromkeys(term for term, weight in hits if weight < 0))
+        key_points = []
+        if positive_terms:
+            key_points.append(f"利好因素: {'、'.join(positive_terms[:5])}")
+        if negative_terms:
+            key_points.append(f"利空因素: {'、'.join(negative_terms[:5])}")
+        return key_points or ['未识别到明显情绪信号']
+
+
+# 创建全局本地情绪分析实例
+local_sentiment_analyzer = SentimentLexiconAnalyzer()
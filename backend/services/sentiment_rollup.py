@@ -0,0 +1,173 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DB_FILE = 'sentiment_rollups.db'
+
+SENTIMENTS = ['positive', 'negative', 'neutral']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sentiment_daily (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, category, sentiment)
+);
+CREATE TABLE IF NOT EXISTS sentiment_hourly (
+    hour TEXT NOT NULL,
+    source TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, source, category, sentiment)
+);
+CREATE TABLE IF NOT EXISTS rollup_articles (
+    article_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    source TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    score REAL NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO {table} ({bucket}, source, category, sentiment, count, score_sum) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT ({bucket}, source, category, sentiment) DO UPDATE SET
+    count = count + excluded.count,
+    score_sum = score_sum + excluded.score_sum
+"""
+
+
+class SentimentRollupStore:
+    """
+    情绪汇总（物化视图）
+    每条分析写入时增量更新按天、按小时的计数桶（情绪 × 来源 × 分类），
+    趋势查询只读取预聚合的桶，耗时与天数成正比，与文章总数无关。
+    带文章ID的分析会记住上次计入的桶，重新分析时先扣减旧桶，避免重复计数。
+    """
+
+    def __init__(self, db_file: str = ROLLUP_DB_FILE):
+        self.db_file = db_file
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def _apply(self, conn, day: str, hour: str, source: str, category: str, sentiment: str, count: int, score: float):
+        conn.execute(_UPSERT.format(table='sentiment_daily', bucket='day'),
+                     (day, source, category, sentiment, count, score))
+        conn.execute(_UPSERT.format(table='sentiment_hourly', bucket='hour'),
+                     (hour, source, category, sentiment, count, score))
+
+    def record(self, sentiment: str, score: float, source: str = None, category: str = None,
+               timestamp: datetime = None, article_id: str = None) -> bool:
+        """记录一条分析结果，文章此前已计入时返回False"""
+        if sentiment not in SENTIMENTS:
+            sentiment = 'neutral'
+        timestamp = timestamp or datetime.now()
+        day = timestamp.strftime('%Y-%m-%d')
+        hour = timestamp.strftime('%Y-%m-%dT%H')
+        source = source or '未知来源'
+        category = category or '未分类'
+        score = float(score) if score is not None else 0.5
+
+        previous = None
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                if article_id is not None:
+                    previous = conn.execute(
+                        'SELECT * FROM rollup_articles WHERE article_id = ?', (article_id,)
+                    ).fetchone()
+                    if previous is not None:
+                        self._apply(conn, previous['day'], previous['hour'], previous['source'],
+                                    previous['category'], previous['sentiment'], -1, -previous['score'])
+                    conn.execute(
+                        """INSERT OR REPLACE INTO rollup_articles
+                           (article_id, day, hour, source, category, sentiment, score) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (article_id, day, hour, source, category, sentiment, score)
+                    )
+                self._apply(conn, day, hour, source, category, sentiment, 1, score)
+        finally:
+            conn.close()
+        return previous is None
+
+    def _query(self, table: str, bucket: str, since: str, source: str = None, category: str = None):
+        sql = f'SELECT {bucket} AS bucket, source, category, sentiment, count, score_sum FROM {table} WHERE {bucket} >= ?'
+        params: List[Any] = [since]
+        if source:
+            sql += ' AND source = ?'
+            params.append(source)
+        if category:
+            sql += ' AND category = ?'
+            params.append(category)
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def get_trend(self, days: int = 7, source: str = None, category: str = None,
+                  granularity: str = 'day') -> Dict[str, Any]:
+        """
+        获取情绪趋势（按时间倒序，缺失的时间桶补零）
+        granularity为day时返回最近days天，为hour时返回最近days*24小时
+        """
+        now = datetime.now()
+        if granularity == 'hour':
+            step, fmt, count = timedelta(hours=1), '%Y-%m-%dT%H', days * 24
+            table, bucket = 'sentiment_hourly', 'hour'
+        else:
+            step, fmt, count = timedelta(days=1), '%Y-%m-%d', days
+            table, bucket = 'sentiment_daily', 'day'
+        buckets = [(now - step * i).strftime(fmt) for i in range(count)]
+
+        points = {
+            key: {'positive_count': 0, 'negative_count': 0, 'neutral_count': 0, 'total_articles': 0, 'score_sum': 0.0}
+            for key in buckets
+        }
+        by_source: Dict[str, Dict[str, int]] = {}
+        by_category: Dict[str, Dict[str, int]] = {}
+
+        for row in self._query(table, bucket, buckets[-1], source, category):
+            point = points.get(row['bucket'])
+            if point is None or row['count'] <= 0:
+                continue
+            point[f"{row['sentiment']}_count"] += row['count']
+            point['total_articles'] += row['count']
+            point['score_sum'] += row['score_sum']
+            for breakdown, key in ((by_source, row['source']), (by_category, row['category'])):
+                totals = breakdown.setdefault(key, {'positive': 0, 'negative': 0, 'neutral': 0, 'total': 0})
+                totals[row['sentiment']] += row['count']
+                totals['total'] += row['count']
+
+        trend = []
+        for key in buckets:
+            point = points[key]
+            score_sum = point.pop('score_sum')
+            point['avg_score'] = round(score_sum / point['total_articles'], 3) if point['total_articles'] else None
+            trend.append({'date' if granularity != 'hour' else 'hour': key, **point})
+
+        return {'trend': trend, 'by_source': by_source, 'by_category': by_category}
+
+
+# 创建全局情绪汇总实例
+sentiment_rollup_store = SentimentRollupStore()
@@ -0,0 +1,41 @@
+import os
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# Vercel环境只有/tmp可写
+_DEFAULT_DATA_DIR = '/tmp/news_stock_analyze' if os.getenv('VERCEL') == '1' else os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'
+)
+
+
+def get_data_path(filename: str) -> str:
+    """获取数据文件路径，目录可通过DATA_DIR环境变量配置"""
+    data_dir = os.getenv('DATA_DIR', _DEFAULT_DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, filename)
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    """打开SQLite数据库连接（WAL模式，支持多线程/多进程并发读写）"""
+    conn = sqlite3.connect(get_data_path(filename), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+    """显式事务，immediate=True时立即获取写锁，用于"读取-更新"的原子操作"""
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
@@ -0,0 +1,257 @@
+import os
+import re
+import math
+import time
+import uuid
+import zlib
+import heapq
+import logging
+import threading
+import concurrent.futures
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Iterable, FrozenSet
+
+logger = logging.getLogger(__name__)
+
+# 哈希特征空间大小
+FEATURE_BITS = 20
+_FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+_CJK_RUN = re.compile(r'[一-鿿]+')
+_WORD = re.compile(r'[A-Za-z]+|\d+(?:\.\d+)?%?')
+
+
+def extract_terms(text: str) -> List[str]:
+    """中文按字符二元组切分，英文单词和数字（含百分比）整体作为一个词"""
+    terms = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(word.lower() for word in _WORD.findall(text))
+    return terms
+
+
+def _hash_term(term: str) -> int:
+    return zlib.crc32(term.encode('utf-8')) & _FEATURE_MASK
+
+
+class StoryCluster:
+    """一个市场事件（报道同一事件的多篇文章）"""
+
+    def __init__(self, cluster_id: str, title: str, article_id: Any, keywords: List[str], now: float,
+                 entities: Iterable[str] = ()):
+        self.id = cluster_id
+        self.headline = title
+        self.representative_id = article_id
+        self.keywords = keywords
+        self.centroid: Dict[int, float] = {}
+        self.size = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.titles = deque(maxlen=10)
+        self.sentiments = Counter()
+        # 代表文章的大模型分析结果，其他成员等待并继承
+        self.analysis_future: Optional[concurrent.futures.Future] = None
+        # 成员文章涉及的股票，以及代表文章涉及的股票（只有涉及相同股票的成员才继承代表分析）
+        self.entities = set(entities)
+        self.representative_entities: FrozenSet[str] = frozenset()
+        self.index_terms: List[int] = []
+
+    def to_event(self) -> Dict[str, Any]:
+        analysis = None
+        if self.analysis_future is not None and self.analysis_future.done() and not self.analysis_future.cancelled():
+            analysis = self.analysis_future.result()
+        return {
+            'story_id': self.id,
+            'headline': self.headline,
+            'keywords': self.keywords,
+            'tickers': sorted(self.entities),
+            'size': self.size,
+            'first_seen': datetime.fromtimestamp(self.first_seen).isoformat(),
+            'last_seen': datetime.fromtimestamp(self.last_seen).isoformat(),
+            'titles': list(self.titles),
+            'sentiment': analysis.get('sentiment') if analysis else None,
+            'sentiment_score': analysis.get('sentiment_score') if analysis else None,
+            'member_sentiments': dict(self.sentiments)
+        }
+
+
+class StoryClusterer:
+    """
+    在线事件聚类
+    文章转换为哈希TF-IDF向量（IDF随文档流在线更新），通过倒排索引找到候选事件，
+    与事件质心的余弦相似度超过阈值即归入该事件并增量更新质心，否则新建事件；
+    文章和事件都识别出股票但没有共同股票时不归入（同一模板的公告、不同公司的新闻文本相似，但不是同一事件）。
+    事件在时间窗口内无新文章即过期。聚类状态只保存在当前进程内存中。
+    """
+
+    def __init__(self, threshold: float = None, window_hours: float = None, max_centroid_terms: int = 200,
+                 index_terms: int = 20, max_events: int = 500):
+        self.threshold = threshold if threshold is not None else float(os.getenv('STORY_CLUSTER_THRESHOLD', 0.6))
+        self.window = 3600 * (window_hours if window_hours is not None else float(
+            os.getenv('STORY_CLUSTER_WINDOW_HOURS', 24)
+        ))
+        self.max_centroid_terms = max_centroid_terms
+        self.index_terms = index_terms
+
+        self.document_count = 0
+        self.document_frequency: Counter = Counter()
+        self.clusters: Dict[str, StoryCluster] = {}
+        self.inverted_index: Dict[int, set] = {}
+        # 最近的事件（含已过期的），用于事件流
+        self.events = deque(maxlen=max_events)
+        self.stats = {'articles': 0, 'clusters': 0, 'joined': 0, 'inherited': 0}
+        self._lock = threading.Lock()
+
+    def _vectorize(self, text: str) -> Tuple[Dict[int, float], List[str]]:
+        """返回L2归一化的TF-IDF向量和权重最高的词（调用方需持有锁）"""
+        counts = Counter(extract_terms(text))
+        features: Dict[int, float] = {}
+        texts: Dict[int, str] = {}
+        for term, count in counts.items():
+            feature = _hash_term(term)
+            features[feature] = features.get(feature, 0) + count
+            texts.setdefault(feature, term)
+
+        # 先更新文档频率，首篇文章也有非零IDF
+        self.document_count += 1
+        for feature in features:
+            self.document_frequency[feature] += 1
+
+        vector = {}
+        for feature, count in features.items():
+            idf = math.log((self.document_count + 1) / (self.document_frequency[feature] + 1)) + 1
+            vector[feature] = (1 + math.log(count)) * idf
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vector = {feature: weight / norm for feature, weight in vector.items()}
+
+        keywords = [texts[feature] for feature in heapq.nlargest(5, vector, key=vector.get) if len(texts[feature]) > 1]
+        return vector, keywords
+
+    @staticmethod
+    def _cosine(vector: Dict[int, float], centroid: Dict[int, float]) -> float:
+        norm = math.sqrt(sum(weight * weight for weight in centroid.values()))
+        if not norm:
+            return 0.0
+        if len(vector) > len(centroid):
+            vector, centroid = centroid, vector
+        return sum(weight * centroid.get(feature, 0.0) for feature, weight in vector.items()) / norm
+
+    def _index(self, cluster: StoryCluster):
+        """用质心中权重最高的词建立倒排索引（调用方需持有锁）"""
+        for feature in cluster.index_terms:
+            members = self.inverted_index.get(feature)
+            if members is not None:
+                members.discard(cluster.id)
+                if not members:
+                    del self.inverted_index[feature]
+        cluster.index_terms = heapq.nlargest(self.index_terms, cluster.centroid, key=cluster.centroid.get)
+        for feature in cluster.index_terms:
+            self.inverted_index.setdefault(feature, set()).add(cluster.id)
+
+    def _expire(self, now: float):
+        """移除时间窗口内没有新文章的事件（调用方需持有锁）"""
+        expired = [cluster for cluster in self.clusters.values() if now - cluster.last_seen > self.window]
+        for cluster in expired:
+            for feature in cluster.index_terms:
+                members = self.inverted_index.get(feature)
+                if members is not None:
+                    members.discard(cluster.id)
+                    if not members:
+                        del self.inverted_index[feature]
+            del self.clusters[cluster.id]
+
+    def assign(self, content: str, title: str = '', article_id: Any = None,
+               entities: Iterable[str] = ()) -> Tuple[StoryCluster, bool]:
+        """将文章归入事件，返回 (事件, 是否新建)；entities为文章中识别出的股票代码"""
+        now = time.time()
+        entities = set(entities)
+        # 标题更能代表事件，权重加倍
+        text = f"{title} {title} {(content or '')[:1000]}"
+        with self._lock:
+            if self.stats['articles'] % 100 == 0:
+                self._expire(now)
+            self.stats['articles'] += 1
+            vector, keywords = self._vectorize(text)
+
+            candidates = set()
+            for feature in heapq.nlargest(self.index_terms, vector, key=vector.get):
+                candidates.update(self.inverted_index.get(feature, ()))
+
+            best, best_score = None, 0.0
+            for cluster_id in candidates:
+                cluster = self.clusters[cluster_id]
+                if now - cluster.last_seen > self.window:
+                    continue
+                if entities and cluster.entities and entities.isdisjoint(cluster.entities):
+                    continue
+                score = self._cosine(vector, cluster.centroid)
+                if score > best_score:
+                    best, best_score = cluster, score
+
+            created = best is None or best_score < self.threshold
+            if created:
+                best = StoryCluster(uuid.uuid4().hex[:12], title or (content or '')[:40], article_id, keywords, now,
+                                    entities)
+                self.clusters[best.id] = best
+                self.events.append(best)
+                self.stats['clusters'] += 1
+            else:
+                self.stats['joined'] += 1
+
+            # 质心为成员向量之和，只保留权重最高的若干维
+            centroid = best.centroid
+            for feature, weight in vector.items():
+                centroid[feature] = centroid.get(feature, 0.0) + weight
+            if len(centroid) > self.max_centroid_terms * 2:
+                best.centroid = dict(heapq.nlargest(self.max_centroid_terms, centroid.items(), key=lambda item: item[1]))
+            best.entities.update(entities)
+            best.size += 1
+            best.last_seen = now
+            best.titles.append(title or (content or '')[:40])
+            self._index(best)
+            return best, created
+
+    def begin_analysis(self, cluster: StoryCluster, entities: Iterable[str] = ()) -> Tuple[concurrent.futures.Future, bool]:
+        """
+        获取事件的代表分析，返回 (future, 是否由调用方负责分析)
+        第一个需要大模型分析的成员成为代表（记下其涉及的股票），其他成员等待其结果
+        """
+        with self._lock:
+            if cluster.analysis_future is None:
+                cluster.analysis_future = concurrent.futures.Future()
+                cluster.representative_entities = frozenset(entities)
+                return cluster.analysis_future, True
+            return cluster.analysis_future, False
+
+    def finish_analysis(self, cluster: StoryCluster, analysis: Optional[Dict[str, Any]]):
+        """代表分析完成；失败时清空，下一个成员重新成为代表"""
+        with self._lock:
+            future = cluster.analysis_future
+            if analysis is None:
+                cluster.analysis_future = None
+        if future is not None and not future.done():
+            future.set_result(analysis)
+
+    def record_sentiment(self, cluster: StoryCluster, sentiment: str, inherited: bool = False):
+        with self._lock:
+            cluster.sentiments[sentiment] += 1
+            if inherited:
+                self.stats['inherited'] += 1
+
+    def get_events(self, limit: int = 20, min_size: int = 1) -> List[Dict[str, Any]]:
+        """事件流：按最近更新时间倒序"""
+        with self._lock:
+            events = [cluster for cluster in self.events if cluster.size >= min_size]
+            events.sort(key=lambda cluster: cluster.last_seen, reverse=True)
+            return [cluster.to_event() for cluster in events[:limit]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'active_clusters': len(self.clusters), 'threshold': self.threshold}
+
+
+# 创建全局事件聚类实例
+story_clusterer = StoryClusterer()
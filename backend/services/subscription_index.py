@@ -0,0 +1,459 @@
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Callable, Set, Iterable
+
+from services.storage import connect, transaction
+from services.ticker_recognizer import TickerRecognizer, fold_ascii
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_DB_FILE = 'subscriptions.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    keywords TEXT NOT NULL,
+    tickers TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    sentiments TEXT NOT NULL,
+    min_score REAL,
+    max_score REAL,
+    channels TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions (user_id);
+CREATE TABLE IF NOT EXISTS subscription_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO subscription_version (id, version) VALUES (1, 0);
+"""
+
+SENTIMENTS = {'positive', 'negative', 'neutral'}
+PRIORITIES = {'low', 'normal', 'medium', 'high', 'urgent'}
+_PRIORITY_RANK = {'low': 0, 'normal': 1, 'medium': 1, 'high': 2, 'urgent': 3}
+
+# 单个订阅的条件数量上限
+MAX_TERMS = 50
+MAX_SUBSCRIPTIONS_PER_USER = 100
+
+# 发送函数：(user_id, message, priority, channels) -> 发送结果
+Sink = Callable[[str, str, str, Optional[List[str]]], Dict[str, Any]]
+
+_SENTIMENT_LABELS = {'positive': '利好', 'negative': '利空', 'neutral': '中性'}
+
+
+def _term_list(value: Any, field: str, fold: bool = False) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ValueError(f'{field}必须为数组')
+    terms = [str(item).strip() for item in value if str(item).strip()]
+    if fold:
+        terms = [fold_ascii(term) for term in terms]
+    terms = list(dict.fromkeys(terms))
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f'{field}最多{MAX_TERMS}项')
+    return terms
+
+
+def _score(value: Any, field: str) -> Optional[float]:
+    if value is None:
+        return None
+    score = float(value)
+    if not 0 <= score <= 1:
+        raise ValueError(f'{field}必须在0到1之间')
+    return score
+
+
+def normalize_subscription(data: Dict[str, Any]) -> Dict[str, Any]:
+    """校验并规范化订阅条件，参数错误时抛出ValueError"""
+    subscription = {
+        'name': (str(data['name']).strip() or None) if data.get('name') is not None else None,
+        'keywords': _term_list(data.get('keywords'), 'keywords', fold=True),
+        'tickers': _term_list(data.get('tickers'), 'tickers'),
+        'sources': _term_list(data.get('sources'), 'sources', fold=True),
+        'sentiments': _term_list(data.get('sentiments'), 'sentiments'),
+        'min_score': _score(data.get('min_score'), 'min_score'),
+        'max_score': _score(data.get('max_score'), 'max_score'),
+        'channels': _term_list(data.get('channels'), 'channels'),
+        'priority': data.get('priority') or 'medium',
+        'enabled': bool(data.get('enabled', True))
+    }
+    if not (subscription['keywords'] or subscription['tickers'] or subscription['sources']):
+        raise ValueError('keywords、tickers、sources至少指定一项')
+    if set(subscription['sentiments']) - SENTIMENTS:
+        raise ValueError(f"sentiments只能为 {', '.join(sorted(SENTIMENTS))}")
+    if subscription['priority'] not in PRIORITIES:
+        raise ValueError(f"priority只能为 {', '.join(sorted(PRIORITIES))}")
+    if (subscription['min_score'] is not None and subscription['max_score'] is not None
+            and subscription['min_score'] > subscription['max_score']):
+        raise ValueError('min_score不能大于max_score')
+    return subscription
+
+
+def _anchor(subscription: Dict[str, Any]) -> str:
+    """倒排索引只登记订阅最具选择性的一类条件：股票 > 关键词 > 来源，其余条件在候选验证时检查"""
+    for field in ('tickers', 'keywords', 'sources'):
+        if subscription[field]:
+            return field
+    raise ValueError('订阅缺少可索引的条件')
+
+
+class SubscriptionIndex:
+    """
+    文章订阅匹配
+    用户按关键词、股票、来源和情绪阈值订阅文章提醒，订阅保存在SQLite中。
+    内存中维护倒排索引（条件 -> 订阅ID集合），关键词编译为Aho-Corasick自动机（复用股票识别的实现），
+    新分析的文章扫描一遍得到命中的关键词，再由股票代码、来源查表得到候选订阅，只验证候选的其余条件；
+    匹配开销与文章长度和命中的订阅数相关，与订阅总数无关。
+    订阅变更时递增数据库中的版本号，其他进程（如 worker.py）在下次匹配时发现版本变化并重新加载。
+    """
+
+    def __init__(self, db_file: str = SUBSCRIPTION_DB_FILE):
+        self.db_file = db_file
+        self.sink: Optional[Sink] = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+        self._version: Optional[int] = None
+        self._subscriptions: Dict[int, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, Set[int]]] = {'tickers': {}, 'keywords': {}, 'sources': {}}
+        # 全部订阅（不论登记在哪类条件下）的关键词及引用数，自动机由此编译
+        self._keyword_refs: Dict[str, int] = {}
+        self._keywords: List[str] = []
+        self._automaton: Optional[TickerRecognizer] = None
+        self._automaton_stale = True
+        self.stats = {'articles': 0, 'candidates': 0, 'matched': 0, 'notified_users': 0}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def set_sink(self, sink: Sink):
+        """注册通知发送函数（由通知路由模块注册）"""
+        self.sink = sink
+
+    @staticmethod
+    def _to_subscription(row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'name': row['name'],
+            'keywords': json.loads(row['keywords']),
+            'tickers': json.loads(row['tickers']),
+            'sources': json.loads(row['sources']),
+            'sentiments': json.loads(row['sentiments']),
+            'min_score': row['min_score'],
+            'max_score': row['max_score'],
+            'channels': json.loads(row['channels']),
+            'priority': row['priority'],
+            'enabled': bool(row['enabled']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    # ---------- 内存索引 ----------
+
+    def _index(self, subscription: Dict[str, Any]):
+        """登记到倒排索引（调用方需持有锁）"""
+        if not subscription['enabled']:
+            return
+        self._subscriptions[subscription['id']] = subscription
+        field = _anchor(subscription)
+        postings = self._postings[field]
+        for term in subscription[field]:
+            postings.setdefault(term, set()).add(subscription['id'])
+        # 登记在股票或来源下的订阅也要识别其关键词，否则候选验证时关键词条件永远不满足
+        for keyword in subscription['keywords']:
+            if keyword not in self._keyword_refs:
+                self._keyword_refs[keyword] = 0
+                # 关键词集合变化时自动机需要重新编译
+                self._automaton_stale = True
+            self._keyword_refs[keyword] += 1
+
+    def _unindex(self, subscription_id: int):
+        """从倒排索引移除（调用方需持有锁）"""
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is None:
+            return
+        field = _anchor(subscription)
+        postings = self._postings[field]
+        for term in subscription[field]:
+            subscribers = postings.get(term)
+            if subscribers is not None:
+                subscribers.discard(subscription_id)
+                if not subscribers:
+                    del postings[term]
+        for keyword in subscription['keywords']:
+            self._keyword_refs[keyword] -= 1
+            if not self._keyword_refs[keyword]:
+                del self._keyword_refs[keyword]
+                self._automaton_stale = True
+
+    def _refresh(self, conn):
+        """数据库中的版本号变化时重新加载全部订阅（调用方需持有锁）"""
+        version = conn.execute('SELECT version FROM subscription_version WHERE id = 1').fetchone()['version']
+        if version == self._version:
+            return
+        started = time.perf_counter()
+        self._subscriptions = {}
+        self._postings = {'tickers': {}, 'keywords': {}, 'sources': {}}
+        self._keyword_refs = {}
+        for row in conn.execute('SELECT * FROM subscriptions WHERE enabled = 1'):
+            self._index(self._to_subscription(row))
+        self._automaton_stale = True
+        self._version = version
+        logger.info(f"🔔 订阅索引已加载: {len(self._subscriptions)}个订阅, "
+                    f"耗时{(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def _keyword_automaton(self) -> Optional[TickerRecognizer]:
+        """关键词变化后重新编译自动机（调用方需持有锁）"""
+        if self._automaton_stale:
+            self._keywords = list(self._keyword_refs)
+            self._automaton = None
+            if self._keywords:
+                automaton = TickerRecognizer(enabled=True)
+                automaton.build(
+                    [(keyword, keyword, '') for keyword in self._keywords],
+                    [(keyword, index) for index, keyword in enumerate(self._keywords)]
+                )
+                self._automaton = automaton
+            self._automaton_stale = False
+        return self._automaton
+
+    def _changed(self, conn):
+        """递增版本号，本进程的内存索引已同步更新，直接记下新版本（调用方需持有锁并在事务中）"""
+        conn.execute('UPDATE subscription_version SET version = version + 1 WHERE id = 1')
+        version = conn.execute('SELECT version FROM subscription_version WHERE id = 1').fetchone()['version']
+        # 本进程索引此前已是最新时才能跳过重新加载
+        if self._version is not None and self._version == version - 1:
+            self._version = version
+        else:
+            self._version = None
+
+    # ---------- 增删改查 ----------
+
+    def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        fields = normalize_subscription(data)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with transaction(conn, immediate=True):
+                    count = conn.execute('SELECT COUNT(*) AS count FROM subscriptions WHERE user_id = ?',
+                                         (user_id,)).fetchone()['count']
+                    if count >= MAX_SUBSCRIPTIONS_PER_USER:
+                        raise ValueError(f'每个用户最多{MAX_SUBSCRIPTIONS_PER_USER}个订阅')
+                    cursor = conn.execute(
+                        """INSERT INTO subscriptions (user_id, name, keywords, tickers, sources, sentiments, min_score,
+                           max_score, channels, priority, enabled, created_at, updated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (user_id, fields['name'], *(json.dumps(fields[key], ensure_ascii=False) for key in
+                                                    ('keywords', 'tickers', 'sources', 'sentiments')),
+                         fields['min_score'], fields['max_score'], json.dumps(fields['channels'], ensure_ascii=False),
+                         fields['priority'], int(fields['enabled']), now, now)
+                    )
+                    subscription = {'id': cursor.lastrowid, 'user_id': user_id, **fields,
+                                    'created_at': now, 'updated_at': now}
+                    self._changed(conn)
+                if self._version is not None:
+                    self._index(subscription)
+            finally:
+                conn.close()
+        return subscription
+
+    def get(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM subscriptions WHERE id = ?', (subscription_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_subscription(row) if row is not None else None
+
+    def list_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM subscriptions WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+        finally:
+            conn.close()
+        return [self._to_subscription(row) for row in rows]
+
+    def update(self, subscription_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按给出的字段更新订阅（未给出的字段保持不变），订阅不存在时返回None"""
+        current = self.get(subscription_id)
+        if current is None:
+            return None
+        fields = normalize_subscription({**current, **data})
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with transaction(conn, immediate=True):
+                    updated = conn.execute(
+                        """UPDATE subscriptions SET name = ?, keywords = ?, tickers = ?, sources = ?, sentiments = ?,
+                           min_score = ?, max_score = ?, channels = ?, priority = ?, enabled = ?, updated_at = ?
+                           WHERE id = ?""",
+                        (fields['name'], *(json.dumps(fields[key], ensure_ascii=False) for key in
+                                           ('keywords', 'tickers', 'sources', 'sentiments')),
+                         fields['min_score'], fields['max_score'], json.dumps(fields['channels'], ensure_ascii=False),
+                         fields['priority'], int(fields['enabled']), now, subscription_id)
+                    ).rowcount
+                    if not updated:
+                        return None
+                    self._changed(conn)
+                subscription = {**current, **fields, 'updated_at': now}
+                if self._version is not None:
+                    self._unindex(subscription_id)
+                    self._index(subscription)
+            finally:
+                conn.close()
+        return subscription
+
+    def delete(self, subscription_id: int) -> bool:
+        with self._lock:
+            conn = self._connect()
+            try:
+                with transaction(conn, immediate=True):
+                    deleted = conn.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,)).rowcount
+                    if not deleted:
+                        return False
+                    self._changed(conn)
+                if self._version is not None:
+                    self._unindex(subscription_id)
+            finally:
+                conn.close()
+        return True
+
+    # ---------- 匹配 ----------
+
+    @staticmethod
+    def _accepts(subscription: Dict[str, Any], tickers: Set[str], keywords: Set[str], source: Optional[str],
+                 sentiment: Optional[str], score: Optional[float]) -> bool:
+        """检查候选订阅的全部条件：不同类的条件须同时满足，同类条件满足其一即可"""
+        if subscription['tickers'] and tickers.isdisjoint(subscription['tickers']):
+            return False
+        if subscription['keywords'] and keywords.isdisjoint(subscription['keywords']):
+            return False
+        if subscription['sources'] and source not in subscription['sources']:
+            return False
+        if subscription['sentiments'] and sentiment not in subscription['sentiments']:
+            return False
+        if subscription['min_score'] is not None and (score is None or score < subscription['min_score']):
+            return False
+        if subscription['max_score'] is not None and (score is None or score > subscription['max_score']):
+            return False
+        return True
+
+    def match(self, article: Dict[str, Any], analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """返回文章命中的订阅"""
+        source = article.get('source')
+        if isinstance(source, dict):
+            source = source.get('name')
+        source = fold_ascii(str(source).strip()) if source else None
+        tickers = set(article.get('tickers') or analysis.get('tickers') or [])
+        text = f"{article.get('title') or ''}\n{article.get('content') or ''}"
+        sentiment = analysis.get('sentiment')
+        score = analysis.get('sentiment_score')
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                self._refresh(conn)
+            finally:
+                conn.close()
+            automaton = self._keyword_automaton()
+            keywords = {self._keywords[index] for _, _, index in automaton.scan(text)} if automaton else set()
+
+            postings = self._postings
+            candidates: Set[int] = set()
+            for field, terms in (('tickers', tickers), ('keywords', keywords), ('sources', [source] if source else [])):
+                for term in terms:
+                    candidates.update(postings[field].get(term, ()))
+            matched = [
+                self._subscriptions[subscription_id] for subscription_id in candidates
+                if self._accepts(self._subscriptions[subscription_id], tickers, keywords, source, sentiment, score)
+            ]
+            self.stats['articles'] += 1
+            self.stats['candidates'] += len(candidates)
+            self.stats['matched'] += len(matched)
+        return matched
+
+    @staticmethod
+    def format_message(article: Dict[str, Any], analysis: Dict[str, Any], subscriptions: Iterable[Dict[str, Any]]) -> str:
+        names = [subscription['name'] for subscription in subscriptions if subscription['name']]
+        lines = [f"🔔 订阅提醒{'（' + '、'.join(names[:3]) + '）' if names else ''}：{article.get('title') or '新文章'}"]
+        sentiment = analysis.get('sentiment')
+        if sentiment:
+            score = analysis.get('sentiment_score')
+            lines.append(f"情绪：{_SENTIMENT_LABELS.get(sentiment, sentiment)}"
+                         f"{f' ({score:.2f})' if isinstance(score, (int, float)) else ''}")
+        stocks = analysis.get('related_stocks') or []
+        if stocks:
+            lines.append('相关股票：' + '、'.join(f"{stock['name']}({stock['code']})" for stock in stocks[:5]))
+        elif article.get('tickers'):
+            lines.append('相关股票：' + '、'.join(article['tickers'][:5]))
+        if analysis.get('summary'):
+            lines.append(str(analysis['summary']))
+        return '\n'.join(lines)
+
+    def dispatch(self, article: Dict[str, Any], analysis: Dict[str, Any]) -> int:
+        """为新分析的文章通知命中的订阅用户，同一用户的多个订阅只发一条，返回通知的用户数"""
+        matched = self.match(article, analysis)
+        if not matched:
+            return 0
+        if self.sink is None:
+            logger.warning(f"⚠️ 未注册通知发送函数，跳过{len(matched)}个命中的订阅")
+            return 0
+
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for subscription in matched:
+            by_user.setdefault(subscription['user_id'], []).append(subscription)
+        notified = 0
+        for user_id, subscriptions in by_user.items():
+            priority = max((subscription['priority'] for subscription in subscriptions),
+                           key=lambda value: _PRIORITY_RANK.get(value, 1))
+            # 任一订阅未限定渠道时使用用户启用的全部渠道
+            channels: Optional[List[str]] = []
+            for subscription in subscriptions:
+                if not subscription['channels']:
+                    channels = None
+                    break
+                channels.extend(channel for channel in subscription['channels'] if channel not in channels)
+            try:
+                self.sink(user_id, self.format_message(article, analysis, subscriptions), priority, channels)
+                notified += 1
+            except Exception as error:
+                logger.error(f"发送订阅提醒失败 ({user_id}): {str(error)}")
+        with self._lock:
+            self.stats['notified_users'] += notified
+        logger.info(f"🔔 文章命中{len(matched)}个订阅，已通知{notified}个用户")
+        return notified
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'subscriptions': len(self._subscriptions),
+                'terms': {field: len(postings) for field, postings in self._postings.items()},
+                'loaded': self._version is not None
+            }
+
+
+# 创建全局订阅索引实例
+subscription_index = SubscriptionIndex()
@@ -0,0 +1,215 @@
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+from services.storage import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+TICKER_INDEX_DB_FILE = 'ticker_index.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ticker_postings (
+    ticker TEXT NOT NULL,
+    article_id TEXT NOT NULL,
+    published_at REAL NOT NULL,
+    title TEXT,
+    source TEXT,
+    sentiment TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (ticker, article_id)
+);
+DROP INDEX IF EXISTS idx_ticker_postings_time;
+CREATE INDEX IF NOT EXISTS idx_ticker_postings_cursor ON ticker_postings (ticker, published_at DESC, article_id DESC);
+CREATE INDEX IF NOT EXISTS idx_ticker_postings_article ON ticker_postings (article_id);
+CREATE TABLE IF NOT EXISTS ticker_stats (
+    ticker TEXT PRIMARY KEY,
+    positive INTEGER NOT NULL DEFAULT 0,
+    negative INTEGER NOT NULL DEFAULT 0,
+    neutral INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    last_published REAL
+);
+"""
+
+_UPSERT_STATS = """
+INSERT INTO ticker_stats (ticker, positive, negative, neutral, score_sum, last_published) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (ticker) DO UPDATE SET
+    positive = positive + excluded.positive,
+    negative = negative + excluded.negative,
+    neutral = neutral + excluded.neutral,
+    score_sum = score_sum + excluded.score_sum,
+    last_published = MAX(COALESCE(last_published, 0), COALESCE(excluded.last_published, 0))
+"""
+
+# SQLite单条语句的参数个数上限较低，IN查询分批进行
+_IN_BATCH = 500
+
+
+def _counts(sentiment: str) -> tuple:
+    return (int(sentiment == 'positive'), int(sentiment == 'negative'),
+            int(sentiment not in ('positive', 'negative')))
+
+
+class TickerIndex:
+    """
+    股票 → 文章倒排索引
+    每篇带股票标签的分析结果按股票写入一条倒排记录（按发布时间索引），同时增量更新该股票的情绪合计。
+    关注列表查询为每只股票打开一个按时间倒序的游标，多路归并（heapq.merge）取出最新的文章，
+    只读取实际返回的记录，耗时与关注股票数和返回条数有关，与文章总数无关。
+    """
+
+    def __init__(self, db_file: str = TICKER_INDEX_DB_FILE):
+        self.db_file = db_file
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def record(self, article_id: str, tickers: Iterable[str], sentiment: str, score: Optional[float],
+               title: str = None, source: str = None, published_at: float = None):
+        """
+        写入一篇文章的倒排记录
+        重新分析同一篇文章时删除原有的全部记录（股票标签可能已变化），并从情绪合计中扣除原来的情绪
+        """
+        tickers = list(dict.fromkeys(ticker for ticker in tickers if ticker))
+        if not tickers or article_id is None:
+            return
+        published_at = published_at if published_at is not None else time.time()
+        score = float(score) if score is not None else 0.5
+
+        conn = self._connect()
+        try:
+            with transaction(conn, immediate=True):
+                previous = conn.execute(
+                    'SELECT ticker, sentiment, score FROM ticker_postings WHERE article_id = ?', (article_id,)
+                ).fetchall()
+                for row in previous:
+                    conn.execute(_UPSERT_STATS, (row['ticker'], *(-count for count in _counts(row['sentiment'])),
+                                                 -row['score'], None))
+                if previous:
+                    conn.execute('DELETE FROM ticker_postings WHERE article_id = ?', (article_id,))
+                for ticker in tickers:
+                    conn.execute(
+                        """INSERT INTO ticker_postings
+                           (ticker, article_id, published_at, title, source, sentiment, score) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (ticker, article_id, published_at, title, source, sentiment, score)
+                    )
+                    conn.execute(_UPSERT_STATS, (ticker, *_counts(sentiment), score, published_at))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _format_stats(row) -> Dict[str, Any]:
+        total = row['positive'] + row['negative'] + row['neutral']
+        return {
+            'positive_count': row['positive'],
+            'negative_count': row['negative'],
+            'neutral_count': row['neutral'],
+            'total_articles': total,
+            'avg_score': round(row['score_sum'] / total, 3) if total else None,
+            'last_published': datetime.fromtimestamp(row['last_published']).isoformat() if row['last_published'] else None
+        }
+
+    @staticmethod
+    def _postings(conn, ticker: str, before: Optional[float], before_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        单只股票按 (发布时间, 文章ID) 倒序的游标，按需逐行读取
+        分页位置为上一页最后一篇的 (发布时间, 文章ID)，同一发布时间的其余文章不会被跳过
+        """
+        sql = 'SELECT * FROM ticker_postings WHERE ticker = ?'
+        params: List[Any] = [ticker]
+        if before is not None and before_id is not None:
+            sql += ' AND (published_at, article_id) < (?, ?)'
+            params.extend([before, before_id])
+        elif before is not None:
+            sql += ' AND published_at < ?'
+            params.append(before)
+        for row in conn.execute(sql + ' ORDER BY published_at DESC, article_id DESC', params):
+            yield dict(row)
+
+    def query(self, tickers: List[str], limit: int = 50, per_ticker: int = 0,
+              before: float = None, before_id: str = None) -> Dict[str, Any]:
+        """
+        关注列表查询：各股票的情绪合计，以及所有股票合并后按时间倒序的最新文章
+        同一篇文章涉及多只关注股票时只返回一次，tickers字段列出命中的股票；per_ticker>0时另返回每只股票最新的若干篇
+        下一页以返回的 next_before 和 next_before_id 作为 before 和 before_id
+        """
+        tickers = list(dict.fromkeys(ticker for ticker in tickers if ticker))
+        conn = self._connect()
+        try:
+            stats = {}
+            for offset in range(0, len(tickers), _IN_BATCH):
+                batch = tickers[offset:offset + _IN_BATCH]
+                rows = conn.execute(
+                    f"SELECT * FROM ticker_stats WHERE ticker IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for row in rows:
+                    stats[row['ticker']] = self._format_stats(row)
+
+            # 没有任何记录的股票不打开游标
+            active = [ticker for ticker in tickers if ticker in stats]
+            merged = heapq.merge(*(self._postings(conn, ticker, before, before_id) for ticker in active),
+                                 key=lambda posting: (posting['published_at'], posting['article_id']), reverse=True)
+
+            articles: List[Dict[str, Any]] = []
+            by_article: Dict[str, Dict[str, Any]] = {}
+            for posting in merged:
+                article = by_article.get(posting['article_id'])
+                if article is not None:
+                    article['tickers'].append(posting['ticker'])
+                    continue
+                if len(articles) >= limit:
+                    # 已取满，同一篇文章在各股票中的记录相邻，遇到下一篇即可结束
+                    break
+                article = {
+                    'article_id': posting['article_id'],
+                    'title': posting['title'],
+                    'source': posting['source'],
+                    'published_at': datetime.fromtimestamp(posting['published_at']).isoformat(),
+                    'sentiment': posting['sentiment'],
+                    'sentiment_score': posting['score'],
+                    'tickers': [posting['ticker']],
+                    '_published_at': posting['published_at']
+                }
+                by_article[posting['article_id']] = article
+                articles.append(article)
+
+            latest = {}
+            if per_ticker > 0:
+                for ticker in active:
+                    latest[ticker] = [{
+                        'article_id': posting['article_id'],
+                        'title': posting['title'],
+                        'published_at': datetime.fromtimestamp(posting['published_at']).isoformat(),
+                        'sentiment': posting['sentiment'],
+                        'sentiment_score': posting['score']
+                    } for _, posting in zip(range(per_ticker), self._postings(conn, ticker, before, before_id))]
+        finally:
+            conn.close()
+
+        next_before = articles[-1]['_published_at'] if len(articles) >= limit else None
+        next_before_id = articles[-1]['article_id'] if len(articles) >= limit else None
+        for article in articles:
+            del article['_published_at']
+        return {
+            'stats': stats,
+            'articles': articles,
+            'latest': latest,
+            'next_before': next_before,
+            'next_before_id': next_before_id
+        }
+
+
+# 创建全局股票倒排索引实例
+ticker_index = TickerIndex()
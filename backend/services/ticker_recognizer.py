@@ -0,0 +1,285 @@
+import os
+import csv
+import time
+import marshal
+import hashlib
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+from services.storage import get_data_path
+
+logger = logging.getLogger(__name__)
+
+_RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+DEFAULT_DICTIONARY = os.path.join(_RESOURCES_DIR, 'a_share_stocks.csv')
+DEFAULT_AUTOMATON = os.path.join(_RESOURCES_DIR, 'a_share_stocks.automaton')
+
+# 二进制格式版本，结构变化时递增使旧文件失效
+AUTOMATON_FORMAT = 1
+
+# 模型给出的笼统影响描述，识别到股票时改写为具体标的
+GENERIC_IMPACTS = {'利好', '利空', '影响待评估', '中性', ''}
+
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def fold_ascii(text: str) -> str:
+    """只把ASCII字母转为小写（自动机匹配前对模式和文本做同样的处理）"""
+    return text.translate(_ASCII_LOWER)
+
+
+def _is_ascii_alnum(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _file_digest(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+class TickerRecognizer:
+    """
+    A股股票实体识别
+    词典（代码、简称、全称、别名）编译为Aho-Corasick自动机，一次线性扫描找出文本中的全部股票。
+    自动机序列化为二进制文件，启动时直接加载；词典变化后自动重新构建。
+    英文别名不区分大小写；代码和英文别名要求前后不是字母数字，避免匹配到更长的数字或单词中。
+    重叠的匹配按"最左最长"取舍。
+    """
+
+    def __init__(self, dictionary_path: str = None, automaton_path: str = None, enabled: bool = None):
+        self.dictionary_path = dictionary_path or os.getenv('TICKER_DICTIONARY', DEFAULT_DICTIONARY)
+        self.automaton_path = automaton_path or os.getenv('TICKER_AUTOMATON', DEFAULT_AUTOMATON)
+        self.enabled = enabled if enabled is not None else os.getenv('TICKER_RECOGNITION', 'true').lower() == 'true'
+
+        self.tickers: List[Tuple[str, str, str]] = []
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        # 每个状态的输出：(模式长度, 股票序号, 是否需要检查边界)，已合并后缀链接上的输出
+        self._output: List[Tuple[Tuple[int, int, bool], ...]] = []
+        self._by_code: Dict[str, Tuple[str, str, str]] = {}
+        self._ready = False
+        self._lock = threading.Lock()
+
+    # ---------- 构建与加载 ----------
+
+    @staticmethod
+    def read_dictionary(path: str) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]:
+        """读取词典，返回 (股票列表[(代码, 简称, 交易所)], 模式列表[(文本, 股票序号)])"""
+        tickers, patterns = [], []
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            for row in csv.DictReader(file):
+                code = (row.get('code') or '').strip()
+                if not code:
+                    continue
+                index = len(tickers)
+                short_name = (row.get('short_name') or '').strip()
+                tickers.append((code, short_name, (row.get('exchange') or '').strip().upper()))
+                names = [code, short_name, (row.get('full_name') or '').strip()]
+                names.extend(alias.strip() for alias in (row.get('aliases') or '').split('|'))
+                for name in dict.fromkeys(names):
+                    if name:
+                        patterns.append((name.translate(_ASCII_LOWER), index))
+        return tickers, patterns
+
+    def build(self, tickers: List[Tuple[str, str, str]], patterns: List[Tuple[str, int]]):
+        """由模式列表构建自动机（goto表 + 失败链接 + 合并后的输出）"""
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[Tuple[int, int, bool]]] = [[]]
+        for text, index in patterns:
+            state = 0
+            for char in text:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+                state = next_state
+            boundary = _is_ascii_alnum(text[0]) or _is_ascii_alnum(text[-1])
+            output[state].append((len(text), index, boundary))
+
+        # 按BFS顺序计算失败链接，父状态的失败链接总是先于子状态完成
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[child] = goto[link].get(char, 0) if goto[link].get(char) != child else 0
+                output[child].extend(output[fail[child]])
+
+        self.tickers = tickers
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(items) for items in output]
+        self._ready = True
+
+    def save(self, path: str, digest: str):
+        data = marshal.dumps({
+            'format': AUTOMATON_FORMAT,
+            'digest': digest,
+            'tickers': [list(ticker) for ticker in self.tickers],
+            'goto': self._goto,
+            'fail': self._fail,
+            'output': [[list(item) for item in items] for items in self._output]
+        })
+        # 先写临时文件再替换，避免其他进程读到写了一半的文件
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def _load_binary(self, path: str, digest: str) -> bool:
+        try:
+            with open(path, 'rb') as file:
+                data = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if not isinstance(data, dict) or data.get('format') != AUTOMATON_FORMAT or data.get('digest') != digest:
+            return False
+        self.tickers = [tuple(ticker) for ticker in data['tickers']]
+        self._goto = data['goto']
+        self._fail = data['fail']
+        self._output = [tuple(tuple(item) for item in items) for items in data['output']]
+        self._ready = True
+        return True
+
+    def load(self) -> bool:
+        """
+        加载自动机：优先读取预构建的二进制文件（resources目录，其次数据目录缓存），
+        文件不存在或与词典不一致时由词典构建并写入缓存
+        """
+        if self._ready:
+            return True
+        with self._lock:
+            if self._ready:
+                return True
+            started = time.perf_counter()
+            try:
+                digest = _file_digest(self.dictionary_path)
+            except OSError as error:
+                logger.error(f"❌ 股票词典读取失败: {str(error)}")
+                return False
+
+            cache_path = get_data_path(os.path.basename(self.automaton_path))
+            for path in (self.automaton_path, cache_path):
+                if self._load_binary(path, digest):
+                    logger.info(f"📈 股票识别自动机已加载: {len(self.tickers)}只股票, {len(self._goto)}个状态, "
+                                f"耗时{(time.perf_counter() - started) * 1000:.1f}ms")
+                    return True
+
+            self.build(*self.read_dictionary(self.dictionary_path))
+            for path in (self.automaton_path, cache_path):
+                try:
+                    self.save(path, digest)
+                    break
+                except OSError:
+                    continue
+            logger.info(f"📈 股票识别自动机已构建: {len(self.tickers)}只股票, {len(self._goto)}个状态, "
+                        f"耗时{(time.perf_counter() - started) * 1000:.1f}ms")
+            return True
+
+    # ---------- 识别 ----------
+
+    def scan(self, text: str) -> List[Tuple[int, int, int]]:
+        """扫描文本，返回全部匹配（可能重叠）[(起始位置, 结束位置, 词条序号)]"""
+        if not text or not self.load():
+            return []
+        text = text.translate(_ASCII_LOWER)
+        goto, fail, output = self._goto, self._fail, self._output
+        length = len(text)
+
+        matches = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not state:
+                continue
+            for pattern_length, index, boundary in output[state]:
+                start = position - pattern_length + 1
+                if boundary and ((start > 0 and _is_ascii_alnum(text[start - 1])) or
+                                 (position + 1 < length and _is_ascii_alnum(text[position + 1]))):
+                    continue
+                matches.append((start, position + 1, index))
+        return matches
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        """扫描文本，返回不重叠的匹配 [(起始位置, 结束位置, 股票序号)]"""
+        matches = self.scan(text)
+        if len(matches) < 2:
+            return matches
+        # 最左最长：按起点升序、长度降序贪心选取不重叠的匹配
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        selected, covered = [], 0
+        for match in matches:
+            if match[0] >= covered:
+                selected.append(match)
+                covered = match[1]
+        return selected
+
+    def recognize(self, text: str) -> List[Dict[str, Any]]:
+        """识别文本中的股票，按首次出现顺序返回 [{'code', 'name', 'exchange', 'mentions'}]"""
+        found: Dict[int, Dict[str, Any]] = {}
+        for _, _, index in self.find(text):
+            entity = found.get(index)
+            if entity is None:
+                code, name, exchange = self.tickers[index]
+                found[index] = {'code': code, 'name': name, 'exchange': exchange, 'mentions': 1}
+            else:
+                entity['mentions'] += 1
+        return list(found.values())
+
+    def tag(self, article: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """为文章打上股票标签（article['tickers'] 为代码列表），返回识别结果"""
+        if not self.enabled:
+            return []
+        title = article.get('title') or article.get('标题') or ''
+        content = article.get('content') or article.get('内容') or ''
+        entities = self.recognize(f'{title}\n{content}')
+        article['tickers'] = [entity['code'] for entity in entities]
+        return entities
+
+    @staticmethod
+    def annotate(analysis: Dict[str, Any], entities: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        返回写入了识别结果的分析结果副本；模型只给出笼统影响时改写为具体标的
+        不修改原对象：同一事件的其他文章可能继承同一份分析结果
+        """
+        if not entities:
+            return analysis
+        analysis = dict(analysis, related_stocks=entities)
+        impact = analysis.get('stock_impact')
+        if isinstance(impact, str) and impact.strip() in GENERIC_IMPACTS:
+            names = '、'.join(f"{entity['name']}({entity['code']})" for entity in entities[:5])
+            analysis['stock_impact'] = f"{impact.strip() or '影响待评估'}：{names}"
+        return analysis
+
+    def lookup(self, code: str) -> Optional[Dict[str, str]]:
+        """按代码查询股票简称和交易所"""
+        if not self.load():
+            return None
+        if len(self._by_code) != len(self.tickers):
+            self._by_code = {ticker[0]: ticker for ticker in self.tickers}
+        ticker = self._by_code.get(code)
+        if ticker is None:
+            return None
+        return {'code': ticker[0], 'name': ticker[1], 'exchange': ticker[2]}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'loaded': self._ready,
+            'tickers': len(self.tickers),
+            'states': len(self._goto)
+        }
+
+
+# 创建全局股票识别实例
+ticker_recognizer = TickerRecognizer()
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import date, timedelta
+from typing import Dict, Any, Optional
+
+from services.storage import connect
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB_FILE = 'token_usage.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_usage (
+    day TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    route TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated_requests INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, provider, route)
+);
+"""
+
+# 当前请求所属的接口，用于按接口统计用量
+usage_route: ContextVar[str] = ContextVar('usage_route', default='other')
+
+# 健康探测的用量单独记在该接口下，不计入当日总预算和提供商预算
+PROBE_ROUTE = 'probe'
+
+
+def _parse_budget_map(value: Optional[str]) -> Dict[str, int]:
+    """解析 "hunyuan:100000,deepseek:50000" 格式的预算配置"""
+    budgets = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            key, amount = item.split(':', 1)
+            try:
+                budgets[key.strip()] = int(amount)
+            except ValueError:
+                logger.warning(f"⚠️ 无效的预算配置: {item}")
+    return budgets
+
+
+def estimate_tokens(text: str) -> int:
+    """提供商未返回用量时按字符数估算token（中文约1.5字/token）"""
+    return int(len(text or '') / 1.5) + 1
+
+
+class TokenUsageTracker:
+    """
+    Token用量统计与预算控制
+    按天、提供商、接口累计prompt/completion token并持久化到SQLite；当日合计缓存在内存中用于快速预算检查
+    """
+
+    def __init__(self, db_file: str = USAGE_DB_FILE, refresh_seconds: float = 30.0):
+        self.db_file = db_file
+        self.daily_budget = int(os.getenv('AI_DAILY_TOKEN_BUDGET', 0))
+        self.provider_budgets = _parse_budget_map(os.getenv('AI_PROVIDER_TOKEN_BUDGETS'))
+        self.route_budgets = _parse_budget_map(os.getenv('AI_ROUTE_TOKEN_BUDGETS'))
+        # 预算用尽时的处理方式：local（降级为本地分析）或 queue（异步任务暂缓处理，实时请求仍降级）
+        self.exhausted_action = os.getenv('AI_BUDGET_EXHAUSTED_ACTION', 'local')
+        # 其他进程（如独立的worker）也会写入用量，定期从数据库刷新当日合计
+        self.refresh_seconds = refresh_seconds
+
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._today: Optional[str] = None
+        self._today_loaded_at = 0.0
+        self._totals = {'all': 0, 'provider': {}, 'route': {}}
+
+    def _connect(self):
+        conn = connect(self.db_file)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _refresh_today(self):
+        """加载当日合计（调用方需持有锁）"""
+        today = date.today().isoformat()
+        if today == self._today and time.monotonic() - self._today_loaded_at < self.refresh_seconds:
+            return
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT provider, route, prompt_tokens + completion_tokens AS tokens FROM token_usage WHERE day = ?',
+                (today,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        totals = {'all': 0, 'provider': {}, 'route': {}}
+        for row in rows:
+            if row['route'] != PROBE_ROUTE:
+                totals['all'] += row['tokens']
+                totals['provider'][row['provider']] = totals['provider'].get(row['provider'], 0) + row['tokens']
+            totals['route'][row['route']] = totals['route'].get(row['route'], 0) + row['tokens']
+        self._totals = totals
+        self._today = today
+        self._today_loaded_at = time.monotonic()
+
+    def record(self, provider: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False,
+               route: str = None):
+        """记录一次调用的token用量"""
+        route = route or usage_route.get()
+        tokens = prompt_tokens + completion_tokens
+        with self._lock:
+            self._refresh_today()
+            if route != PROBE_ROUTE:
+                self._totals['all'] += tokens
+                self._totals['provider'][provider] = self._totals['provider'].get(provider, 0) + tokens
+            self._totals['route'][route] = self._totals['route'].get(route, 0) + tokens
+
+        today = date.today().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute(
+                """INSERT INTO token_usage (day, provider, route, requests, prompt_tokens, completion_tokens, estimated_requests)
+                   VALUES (?, ?, ?, 1, ?, ?, ?)
+                   ON CONFLICT (day, provider, route) DO UPDATE SET
+                       requests = requests + 1,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       estimated_requests = estimated_requests + excluded.estimated_requests""",
+                (today, provider, route, prompt_tokens, completion_tokens, int(estimated))
+            )
+        finally:
+            conn.close()
+
+    def record_response(self, provider: str, prompt: str, completion: str, usage: Optional[Dict[str, Any]] = None):
+        """根据提供商返回的usage记录用量，缺失时按文本长度估算"""
+        if usage and ('prompt_tokens' in usage or 'completion_tokens' in usage):
+            self.record(provider, int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0)))
+        else:
+            self.record(provider, estimate_tokens(prompt), estimate_tokens(completion), estimated=True)
+
+    def check_budget(self, provider: str = None, route: str = None) -> Optional[str]:
+        """检查预算，超出时返回原因，未超出返回None"""
+        route = route or usage_route.get()
+        with self._lock:
+            self._refresh_today()
+            if self.daily_budget and self._totals['all'] >= self.daily_budget:
+                return f'当日token总预算已用尽 ({self._totals["all"]}/{self.daily_budget})'
+            if provider and provider in self.provider_budgets and \
+                    self._totals['provider'].get(provider, 0) >= self.provider_budgets[provider]:
+                return f'{provider} 当日token预算已用尽'
+            if route in self.route_budgets and self._totals['route'].get(route, 0) >= self.route_budgets[route]:
+                return f'{route} 接口当日token预算已用尽'
+        return None
+
+    def get_usage(self, days: int = 7) -> Dict[str, Any]:
+        """获取最近若干天的用量明细和预算使用情况"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT * FROM token_usage WHERE day >= ? ORDER BY day DESC, provider, route', (since,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._refresh_today()
+            totals = {
+                'all': self._totals['all'],
+                'provider': dict(self._totals['provider']),
+                'route': dict(self._totals['route'])
+            }
+
+        return {
+            'usage': [dict(row) for row in rows],
+            'today': totals,
+            'budgets': {
+                'daily': self.daily_budget or None,
+                'daily_remaining': max(0, self.daily_budget - totals['all']) if self.daily_budget else None,
+                'provider': {
+                    key: {'budget': budget, 'used': totals['provider'].get(key, 0)}
+                    for key, budget in self.provider_budgets.items()
+                },
+                'route': {
+                    key: {'budget': budget, 'used': totals['route'].get(key, 0)}
+                    for key, budget in self.route_budgets.items()
+                },
+                'exhausted_action': self.exhausted_action
+            }
+        }
+
+
+# 创建全局用量统计实例
+usage_tracker = TokenUsageTracker()
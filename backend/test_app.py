@@ -104,6 +104,66 @@ async def test_notification_service():
     # 测试获取用户偏好
     test_endpoint('GET', f'/api/notifications/preferences/{TEST_USER_ID}', description="获取用户偏好")
 
+async def test_subscription_matching():
+    """测试订阅匹配：同时指定股票和关键词的订阅须在两者都出现时命中"""
+    print_section("测试文章订阅匹配")
+    
+    response = requests.post(f"{BASE_URL}/api/notifications/subscriptions", json={
+        "user_id": TEST_USER_ID,
+        "name": "茅台分红",
+        "tickers": ["600519"],
+        "keywords": ["分红"]
+    })
+    subscription_id = response.json()['data']['id']
+    
+    try:
+        cases = [
+            ("贵州茅台宣布年度分红方案", True),
+            ("贵州茅台发布季度业绩", False)
+        ]
+        for title, expected in cases:
+            response = requests.post(f"{BASE_URL}/api/notifications/subscriptions/match", json={
+                "title": title,
+                "tickers": ["600519"]
+            })
+            matched = [item['id'] for item in response.json()['data']['matched']]
+            passed = (subscription_id in matched) == expected
+            print(f"  {'✅' if passed else '❌'} {title}: {'命中' if subscription_id in matched else '未命中'}")
+    finally:
+        requests.delete(f"{BASE_URL}/api/notifications/subscriptions/{subscription_id}")
+
+async def test_analysis_parser_truncation():
+    """测试截断修复：合法的模型输出在情绪字段之后的任意位置被截断，都应能修复解析（本地执行，不需要服务器）"""
+    print_section("测试模型输出截断修复")
+    from services.analysis_parser import analysis_parser, AnalysisParseError
+    
+    analysis = {
+        "sentiment": "positive",
+        "sentiment_score": 0.82,
+        "risk_level": "low",
+        "investment_advice": "持有，关注\"业绩\"兑现\n",
+        "key_points": ["营收增长12.5%", "毛利率提升", {"note": "嵌套对象"}],
+        "stock_impact": "利好：贵州茅台(600519)",
+        "confidence": 0.9,
+        "verified": True,
+        "extra": None
+    }
+    response = "以下是分析结果：\n```json\n" + json.dumps(analysis, ensure_ascii=False, indent=2) + "\n```"
+    sentiment_end = response.index('"positive"') + len('"positive"')
+    
+    failed = []
+    for offset in range(sentiment_end, len(response) + 1):
+        try:
+            analysis_parser.parse(response[:offset])
+        except AnalysisParseError as error:
+            failed.append((offset, str(error)))
+    
+    total = len(response) + 1 - sentiment_end
+    print(f"  {'✅' if not failed else '❌'} 截断位置 {total} 个，修复失败 {len(failed)} 个")
+    for offset, error in failed[:5]:
+        print(f"     位置{offset}: {error}")
+    return not failed
+
 async def test_email_service():
     """测试邮件服务功能"""
     print_section("测试邮件服务")
@@ -160,6 +220,8 @@ async def main():
     await test_ai_service()
     await test_news_service()
     await test_notification_service()
+    await test_subscription_matching()
+    await test_analysis_parser_truncation()
     await test_email_service()
     await test_telegram_service()
     await test_wechat_work_service()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+股票新闻分析系统 - 分析吞吐量压测脚本
+分别压测 ai_service.analyze_content、/api/analysis/analyze 和 /api/analysis/batch-analyze，
+输出每种配置的吞吐量和p50/p95/p99延迟。默认在进程内启动模拟大模型服务，不消耗真实token。
+
+用法:
+    python tools/load_test.py --targets service,analyze,batch --concurrency 1,8,32 --requests 200
+    python tools/load_test.py --mock-latency-mean 1.2 --mock-rate-limit-rate 0.05 --json results.json
+    python tools/load_test.py --no-mock --base-url http://localhost:3001   # 压测已运行的服务
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加backend目录到Python路径
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_llm_server
+
+TARGETS = ['service', 'analyze', 'batch']
+
+_SUBJECTS = ['贵州茅台', '宁德时代', '招商银行', '比亚迪', '中国平安', '隆基绿能', '药明康德', '中芯国际']
+_EVENTS = [
+    '发布季度报告，营收与去年同期基本持平，管理层表示将继续观察市场变化',
+    '公告拟调整部分业务结构，具体影响仍有待评估',
+    '召开股东大会审议年度议案，市场关注后续经营安排',
+    '披露新的产能规划，行业人士对需求前景看法不一',
+]
+
+
+def generate_article(index: int) -> dict:
+    """生成压测用文章，每篇内容不同，避免结果被缓存（事件聚类默认关闭，每篇都产生一次模型请求）"""
+    subject = _SUBJECTS[index % len(_SUBJECTS)]
+    event = _EVENTS[index % len(_EVENTS)]
+    return {
+        'id': f'load-{index}',
+        'title': f'{subject}{event[:6]}（第{index}号）',
+        'content': f'{subject}{event}。编号{index}的压测文章，' + '相关数据将在后续公告中披露。' * 5,
+        'source': {'credibility': 0.8}
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(target: str, concurrency: int, latencies: list, errors: int, fallbacks: int,
+              elapsed: float, articles_per_request: int) -> dict:
+    completed = len(latencies)
+    return {
+        'target': target,
+        'concurrency': concurrency,
+        'requests': completed + errors,
+        'errors': errors,
+        'fallbacks': fallbacks,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(completed / elapsed, 2) if elapsed else 0.0,
+        'articles_per_second': round(completed * articles_per_request / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def run_service_target(total: int, concurrency: int) -> dict:
+    """直接调用 ai_service.analyze_content"""
+    from services.ai_service import ai_service
+
+    latencies, counters = [], {'errors': 0, 'fallbacks': 0}
+
+    async def run():
+        queue = asyncio.Queue()
+        for index in range(total):
+            queue.put_nowait(index)
+
+        async def worker():
+            while not queue.empty():
+                article = generate_article(queue.get_nowait())
+                start = time.perf_counter()
+                try:
+                    result = await ai_service.analyze_content(article['content'], article['title'], 0.8)
+                except Exception:
+                    counters['errors'] += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if result.get('fallback_mode'):
+                    counters['fallbacks'] += 1
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return summarize('service', concurrency, latencies, counters['errors'], counters['fallbacks'],
+                     time.perf_counter() - start, 1)
+
+
+def _make_poster(base_url: str):
+    """返回发送POST请求的函数：指定base_url时走HTTP，否则使用Flask测试客户端"""
+    if base_url:
+        import requests
+        session_local = threading.local()
+
+        def post(path, payload):
+            if not hasattr(session_local, 'session'):
+                session_local.session = requests.Session()
+            response = session_local.session.post(f"{base_url}{path}", json=payload, timeout=120)
+            return response.status_code, response.json()
+        return post
+
+    from app import app
+    client_local = threading.local()
+
+    def post(path, payload):
+        if not hasattr(client_local, 'client'):
+            client_local.client = app.test_client()
+        response = client_local.client.post(path, json=payload)
+        return response.status_code, response.get_json()
+    return post
+
+
+def run_http_target(target: str, total: int, concurrency: int, base_url: str, batch_size: int) -> dict:
+    """压测 /analyze（每个请求1篇）或 /batch-analyze（每个请求batch_size篇）"""
+    post = _make_poster(base_url)
+    latencies, lock = [], threading.Lock()
+    counters = {'errors': 0, 'fallbacks': 0}
+
+    def one(index):
+        if target == 'analyze':
+            article = generate_article(index)
+            path, payload = '/api/analysis/analyze', {
+                'content': article['content'], 'title': article['title'], 'source': article['source']
+            }
+        else:
+            path, payload = '/api/analysis/batch-analyze', {
+                'articles': [generate_article(index * batch_size + offset) for offset in range(batch_size)]
+            }
+
+        start = time.perf_counter()
+        try:
+            status, body = post(path, payload)
+        except Exception:
+            status, body = None, None
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            if status != 200 or not (body or {}).get('success'):
+                counters['errors'] += 1
+                return
+            latencies.append(elapsed)
+            if target == 'analyze':
+                analyses = [body['data']['analysis']]
+            else:
+                analyses = [item.get('analysis', {}) for item in body['data']['results']]
+            counters['fallbacks'] += sum(1 for analysis in analyses if analysis.get('fallback_mode'))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    return summarize(target, concurrency, latencies, counters['errors'], counters['fallbacks'],
+                     time.perf_counter() - start, 1 if target == 'analyze' else batch_size)
+
+
+def print_report(results: list):
+    print(f"\n{'=' * 100}")
+    print(f"{'目标':<10}{'并发':>6}{'请求数':>8}{'错误':>6}{'降级':>6}{'耗时(s)':>10}"
+          f"{'请求/s':>10}{'文章/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    print('-' * 100)
+    for row in results:
+        print(f"{row['target']:<10}{row['concurrency']:>6}{row['requests']:>8}{row['errors']:>6}{row['fallbacks']:>6}"
+              f"{row['elapsed_seconds']:>10}{row['throughput_rps']:>10}{row['articles_per_second']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print('=' * 100)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='分析吞吐量压测')
+    parser.add_argument('--targets', default=','.join(TARGETS), help='压测目标：service,analyze,batch')
+    parser.add_argument('--concurrency', default='1,8,32', help='并发数列表，逗号分隔')
+    parser.add_argument('--requests', type=int, default=100, help='每种配置的请求数')
+    parser.add_argument('--batch-size', type=int, default=10, help='batch目标每个请求的文章数（最多10）')
+    parser.add_argument('--base-url', default=None, help='压测已运行的服务（不指定时使用进程内Flask测试客户端）')
+    parser.add_argument('--fast-path', action='store_true', help='启用本地词典快速通道（默认关闭，只测模型路径）')
+    parser.add_argument('--story-clustering', action='store_true',
+                        help='启用事件聚类（默认关闭：同一事件的文章继承代表分析，不产生模型请求）')
+    parser.add_argument('--json', default=None, help='将结果写入JSON文件')
+    parser.add_argument('--no-mock', action='store_true', help='不启动模拟大模型服务，使用已配置的提供商')
+    parser.add_argument('--mock-port', type=int, default=8900)
+    mock_llm_server.add_config_arguments(parser, prefix='mock-')
+    args = parser.parse_args()
+
+    targets = [target.strip() for target in args.targets.split(',') if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的压测目标: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+    batch_size = max(1, min(10, args.batch_size))
+
+    # 服务模块在导入时读取环境变量，必须在导入前完成配置
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='load_test_'))
+    os.environ['LOCAL_SENTIMENT_FAST_PATH'] = 'true' if args.fast_path else 'false'
+    os.environ['STORY_CLUSTERING'] = 'true' if args.story_clustering else 'false'
+    mock = None
+    if not args.no_mock:
+        mock = mock_llm_server.run_in_thread(mock_llm_server.config_from_args(args, prefix='mock-'), port=args.mock_port)
+        os.environ.update({
+            'HUNYUAN_BASE_URL': f'http://127.0.0.1:{args.mock_port}',
+            'HUNYUAN_API_KEY': 'mock-key',
+            'HUNYUAN_SECRET_ID': 'mock-secret',
+            'DEEPSEEK_API_KEY': '',
+        })
+        print(f"🤖 模拟大模型服务: http://127.0.0.1:{args.mock_port} {json.dumps(mock.config, ensure_ascii=False)}")
+
+    results = []
+    for target in targets:
+        for concurrency in levels:
+            print(f"🚀 压测 {target}，并发 {concurrency}，请求数 {args.requests}")
+            if target == 'service':
+                result = run_service_target(args.requests, concurrency)
+            else:
+                result = run_http_target(target, args.requests, concurrency, args.base_url, batch_size)
+            results.append(result)
+
+    print_report(results)
+    if mock is not None:
+        print(f"🤖 模拟服务统计: {json.dumps(mock.stats, ensure_ascii=False)}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'results': results, 'mock': mock.stats if mock else None}, file, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+股票新闻分析系统 - 本地模拟大模型服务
+模拟腾讯混元 / OpenAI兼容的 chat/completions 接口，用于离线压测，不消耗真实token
+支持可配置的延迟分布、错误率、429限流和流式输出
+
+用法:
+    python tools/mock_llm_server.py --port 8900 --latency lognormal --latency-mean 0.8 --rate-limit-rate 0.05
+    HUNYUAN_BASE_URL=http://127.0.0.1:8900 DEEPSEEK_BASE_URL=http://127.0.0.1:8900/v1 python run.py
+"""
+
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from aiohttp import web
+
+DEFAULT_CONFIG = {
+    'latency': 'lognormal',        # fixed / uniform / exponential / lognormal
+    'latency_mean': 0.8,           # 平均延迟（秒）
+    'latency_sigma': 0.5,          # lognormal的形状参数，uniform时为上下浮动比例
+    'error_rate': 0.0,             # 返回500的概率
+    'rate_limit_rate': 0.0,        # 返回429的概率
+    'max_concurrency': 0,          # 超过该并发直接返回429（0为不限制）
+    'retry_after': 1.0,            # 429响应的Retry-After（秒）
+    'malformed_rate': 0.0,         # 返回不规范JSON（单引号、尾随逗号、截断）的概率
+    'stream_chunk_size': 8,        # 流式输出每个分片的字符数
+    'seed': None,
+}
+
+_SENTIMENTS = [
+    ('positive', 0.78, 'low', '买入'),
+    ('negative', 0.22, 'high', '卖出'),
+    ('neutral', 0.5, 'medium', '观望'),
+]
+
+
+class MockLLMServer:
+    """模拟大模型服务的状态与请求处理"""
+
+    def __init__(self, config: dict = None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.random = random.Random(self.config['seed'])
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'rate_limited': 0, 'malformed': 0, 'streams': 0}
+
+    def sample_latency(self) -> float:
+        mean = self.config['latency_mean']
+        sigma = self.config['latency_sigma']
+        kind = self.config['latency']
+        if kind == 'fixed':
+            return mean
+        if kind == 'uniform':
+            return self.random.uniform(mean * (1 - sigma), mean * (1 + sigma))
+        if kind == 'exponential':
+            return self.random.expovariate(1 / mean) if mean > 0 else 0.0
+        # lognormal：给定均值反推mu，长尾更接近真实模型延迟
+        mu = math.log(mean) - sigma ** 2 / 2 if mean > 0 else 0.0
+        return self.random.lognormvariate(mu, sigma) if mean > 0 else 0.0
+
+    def build_content(self, prompt: str) -> str:
+        """按prompt哈希生成确定的分析结果，同一篇文章多次请求结果一致"""
+        digest = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16)
+        sentiment, score, risk, advice = _SENTIMENTS[digest % len(_SENTIMENTS)]
+        result = {
+            'sentiment': sentiment,
+            'sentiment_score': score,
+            'risk_level': risk,
+            'investment_advice': advice,
+            'key_points': ['模拟分析要点一', '模拟分析要点二'],
+            'stock_impact': '模拟服务生成的影响分析'
+        }
+        content = json.dumps(result, ensure_ascii=False)
+        if self.random.random() < self.config['malformed_rate']:
+            self.stats['malformed'] += 1
+            variant = digest % 3
+            if variant == 0:
+                content = content.replace('"', "'")
+            elif variant == 1:
+                content = content[:-1] + ',}'
+            else:
+                content = '分析结果如下：\n' + content[:len(content) * 2 // 3]
+        return content
+
+    def _reject(self):
+        """按配置返回429/500，不拒绝时返回None"""
+        limit = self.config['max_concurrency']
+        if (limit and self.in_flight > limit) or self.random.random() < self.config['rate_limit_rate']:
+            self.stats['rate_limited'] += 1
+            return web.json_response(
+                {'error': {'message': 'rate limit exceeded', 'code': 429}},
+                status=429,
+                headers={'Retry-After': str(self.config['retry_after'])}
+            )
+        if self.random.random() < self.config['error_rate']:
+            self.stats['errors'] += 1
+            return web.json_response({'error': {'message': 'internal error', 'code': 500}}, status=500)
+        return None
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        prompt = payload.get('prompt') or ''.join(
+            message.get('content', '') for message in payload.get('messages', [])
+        )
+        self.stats['requests'] += 1
+        self.in_flight += 1
+        try:
+            rejected = self._reject()
+            if rejected is not None:
+                return rejected
+
+            latency = self.sample_latency()
+            content = self.build_content(prompt)
+            usage = {
+                'prompt_tokens': int(len(prompt) / 1.5) + 1,
+                'completion_tokens': int(len(content) / 1.5) + 1
+            }
+
+            if payload.get('stream'):
+                return await self._stream(request, content, latency)
+
+            await asyncio.sleep(latency)
+            self.stats['ok'] += 1
+            return web.json_response({
+                'id': f'mock-{self.stats["requests"]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model', 'mock-hunyuan'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {**usage, 'total_tokens': usage['prompt_tokens'] + usage['completion_tokens']}
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request: web.Request, content: str, latency: float) -> web.StreamResponse:
+        """流式输出：首个分片前等待约1/3延迟，其余延迟平均分摊到各分片"""
+        self.stats['streams'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+
+        size = max(1, self.config['stream_chunk_size'])
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        await asyncio.sleep(latency / 3)
+        for chunk in chunks:
+            data = {'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+            await response.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+            await asyncio.sleep(latency * 2 / 3 / len(chunks))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        self.stats['ok'] += 1
+        return response
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({'object': 'list', 'data': [{'id': 'mock-hunyuan', 'object': 'model'}]})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, 'in_flight': self.in_flight, 'config': self.config})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        # 混元 base_url 直接指向服务根路径，OpenAI兼容接口使用 /v1 前缀
+        for prefix in ('', '/v1'):
+            app.router.add_post(f'{prefix}/chat/completions', self.chat_completions)
+            app.router.add_get(f'{prefix}/models', self.models)
+        app.router.add_get('/stats', self.get_stats)
+        return app
+
+
+def run_in_thread(config: dict = None, host: str = '127.0.0.1', port: int = 8900) -> MockLLMServer:
+    """在后台线程中启动模拟服务（供压测脚本使用），返回服务实例"""
+    server = MockLLMServer(config)
+    ready = threading.Event()
+
+    async def serve():
+        runner = web.AppRunner(server.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        ready.set()
+        while True:
+            await asyncio.sleep(3600)
+
+    threading.Thread(target=lambda: asyncio.run(serve()), name='mock-llm-server', daemon=True).start()
+    if not ready.wait(10):
+        raise RuntimeError('模拟大模型服务启动超时')
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser, prefix: str = ''):
+    """注册模拟服务的命令行参数（压测脚本以 --mock- 前缀复用）"""
+    parser.add_argument(f'--{prefix}latency', choices=['fixed', 'uniform', 'exponential', 'lognormal'],
+                        default=DEFAULT_CONFIG['latency'], help='延迟分布')
+    parser.add_argument(f'--{prefix}latency-mean', type=float, default=DEFAULT_CONFIG['latency_mean'], help='平均延迟（秒）')
+    parser.add_argument(f'--{prefix}latency-sigma', type=float, default=DEFAULT_CONFIG['latency_sigma'], help='延迟离散程度')
+    parser.add_argument(f'--{prefix}error-rate', type=float, default=0.0, help='返回500的概率')
+    parser.add_argument(f'--{prefix}rate-limit-rate', type=float, default=0.0, help='返回429的概率')
+    parser.add_argument(f'--{prefix}max-concurrency', type=int, default=0, help='超过该并发返回429（0为不限制）')
+    parser.add_argument(f'--{prefix}retry-after', type=float, default=DEFAULT_CONFIG['retry_after'], help='429的Retry-After秒数')
+    parser.add_argument(f'--{prefix}malformed-rate', type=float, default=0.0, help='返回不规范JSON的概率')
+    parser.add_argument(f'--{prefix}seed', type=int, default=None, help='随机种子')
+
+
+def config_from_args(args: argparse.Namespace, prefix: str = '') -> dict:
+    attr = prefix.replace('-', '_')
+    return {key: getattr(args, f'{attr}{key}') for key in DEFAULT_CONFIG if hasattr(args, f'{attr}{key}')}
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='本地模拟大模型服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(config_from_args(args))
+    print("🤖 启动模拟大模型服务")
+    print(f"🌐 地址: http://{args.host}:{args.port}")
+    print(f"⚙️  配置: {json.dumps(server.config, ensure_ascii=False)}")
+    print(f"   HUNYUAN_BASE_URL=http://{args.host}:{args.port}")
+    print(f"   DEEPSEEK_BASE_URL=http://{args.host}:{args.port}/v1")
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+股票新闻分析系统 - 分析任务工作进程
+独立于Web服务运行，从持久化队列领取异步分析任务和待发送的通知，可按需部署多个进程横向扩展
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.job_queue import analysis_job_queue, analysis_worker_pool
+from routes.analysis import analyze_batch_item
+from services.notification_outbox import notification_outbox, notification_worker_pool
+from routes.notifications import deliver_outbox_message
+
+def main():
+    """主函数"""
+    print("🚀 启动分析任务工作进程")
+    print(f"👷 工作线程数: {analysis_worker_pool.size}")
+    print(f"📨 通知投递协程数: {notification_worker_pool.size}")
+    print(f"📦 队列状态: {analysis_job_queue.get_queue_stats()}")
+    print(f"📮 通知队列状态: {notification_outbox.get_stats()}")
+    
+    analysis_worker_pool.start(analyze_batch_item)
+    notification_worker_pool.start(deliver_outbox_message)
+    
+    # 任一工作池在运行时保持进程（ANALYSIS_WORKERS=0 时只投递通知）
+    try:
+        while analysis_worker_pool.running or notification_worker_pool.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("🛑 正在停止工作进程...")
+    finally:
+        analysis_worker_pool.stop()
+        notification_worker_pool.stop()
+
+if __name__ == '__main__':
+    main()